@@ -37,11 +37,10 @@ if __name__ == '__main__':
         # initialize view object with animal
         view_obj.initialize_animal(animal=animal)
 
-        # iterate over measurements of the animal
-        for measu in view_obj.get_measus_for_current_animal(analyze_values_to_use=(1,)):
-
-            # load a measurement for the animal
-            view_obj.load_measurement_data_from_current_animal(measu)
+        # iterate over measurements of the animal, loading each one. Raw data of the next measurement is read in the
+        # background while the current one is processed
+        measus = view_obj.get_measus_for_current_animal(analyze_values_to_use=(1,))
+        for measu, measu_label in view_obj.iter_measurements(measus, prefetch=1):
 
             # calculate signals
             view_obj.calculate_signals()
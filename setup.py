@@ -19,11 +19,11 @@ setup(
     install_requires=[
         "pandas>=0.24.2",
         "openpyxl>=3.0.3",
-        "scipy >=1.2.1",
+        "scipy >=1.4",
         "numpy>=1.16.3",
         "matplotlib>=3.0.3",
         "pyyaml>=3.3",
-        "Pillow>=6.0.0",
+        "Pillow>=8.0.0",
         "moviepy>=1.0.0",
         "scikit-image>=0.15.0",
         "appdirs>=1.4.3",
@@ -3,7 +3,17 @@ from view import VIEW
 import logging
 import pathlib as pl
 import shutil
+import time
 from nose.tools import raises
+from view.python_core.movies.colorizer.aux_funcs import apply_colormaps_based_on_mask, \
+    apply_colormap_luts_based_on_mask, ColormapLUT
+from view.python_core.movies.render import render_frames_in_order
+from view.python_core.movies.static_border import StaticBorder
+from view.python_core.utils.pil_helpers import numpy_to_pil_image, add_string
+from view.python_core.utils.fonts import resolve_font_file, get_font
+from PIL import Image, ImageDraw
+import matplotlib.pyplot as plt
+import numpy as np
 
 
 def export_fake_data_movie(flags_to_update, movie_name_suffix):
@@ -316,6 +326,99 @@ def test_bit_rate():
         "_bitrate_12M"
     )
 
+def test_colormap_lut():
+    """
+    Testing that colorizing with lookup tables of colormaps gives the same colors as colorizing with colormaps,
+    converted to uint8
+    """
+
+    random_state = np.random.RandomState(0)
+    data = random_state.uniform(-0.1, 1.1, size=(30, 20, 10))
+    data[0, 0, :] = np.nan
+    data[1, 1, :] = 1
+    background = random_state.uniform(0, 1, size=data.shape)
+    mask = random_state.rand(*data.shape) > 0.3
+
+    for dtype in (np.float32, np.float64):
+
+        expected = apply_colormaps_based_on_mask(
+            mask=mask, data_for_inside_mask=data.astype(dtype), data_for_outside_mask=background,
+            colormap_inside_mask=plt.cm.jet, colormap_outside_mask=plt.cm.gray, dtype=dtype)
+
+        colorized = apply_colormap_luts_based_on_mask(
+            mask=mask, data_for_inside_mask=data.astype(dtype), data_for_outside_mask=background,
+            colormap_lut_inside_mask=ColormapLUT(plt.cm.jet, dtype),
+            colormap_lut_outside_mask=ColormapLUT(plt.cm.gray, dtype))
+
+        assert colorized.dtype == np.uint8
+        assert np.array_equal(colorized, np.array(expected * 255, dtype=np.uint8))
+
+
+def test_render_frames_in_order():
+    """
+    Testing that frames rendered in parallel are returned in order
+    """
+
+    random_state = np.random.RandomState(0)
+    delays = random_state.uniform(0, 0.005, size=50)
+
+    def render_frame(frame_number):
+        time.sleep(delays[frame_number])
+        return frame_number * 2
+
+    for n_threads in (1, 4):
+        assert list(render_frames_in_order(render_frame, range(50), n_threads)) == list(range(0, 100, 2))
+
+
+def test_static_overlay():
+    """
+    Testing that compositing frames with a static overlay gives the same frames as drawing regions of interest onto
+    frames and adding borders to them
+    """
+
+    random_state = np.random.RandomState(0)
+    frame_data_uint8 = random_state.randint(0, 256, size=(10, 8, 4)).astype(np.uint8)
+    roi_color = (1, 1, 1, 1)
+    roi_mask = random_state.rand(10, 8) > 0.8
+
+    static_border = StaticBorder(mv_xgap_left=3, mv_xgap_right=3, mv_ygap=2, bg_color_for_mpl=(0, 0, 0.5, 1),
+                                 frame_size=(10, 8))
+
+    frame_data_with_roi = frame_data_uint8 / 255
+    frame_data_with_roi[roi_mask, :] = roi_color
+    expected = np.array(numpy_to_pil_image(static_border.composite(frame_data_with_roi,
+                                                                   static_border.get_static_frame(None))))
+
+    roi_overlay_colors = np.zeros((10, 8, 4))
+    roi_overlay_colors[roi_mask, :] = roi_color
+    static_overlay = static_border.get_static_overlay(data_to_01_mapper=None, data_overlay_colors=roi_overlay_colors,
+                                                      data_overlay_mask=roi_mask)
+
+    assert np.array_equal(static_overlay.composite(frame_data_uint8), expected)
+
+
+def test_add_string_cached():
+    """
+    Testing that adding strings using cached fonts and rendered texts gives the same images as drawing them directly
+    """
+
+    font_file = resolve_font_file("OpenSans-Regular")
+    random_state = np.random.RandomState(0)
+
+    for text, position in [("12.345 s", (10.3, 5.7)), ("12.345 s", (10.3, 5.7)), ("IAA@-2", (0, 0)),
+                           ("0", (55.5, 28.25)), ("-0.12", (-3.5, 10))]:
+
+        image_np = random_state.randint(0, 256, size=(30, 60, 4)).astype(np.uint8)
+
+        expected = Image.fromarray(image_np)
+        ImageDraw.Draw(expected).text(position, text, fill="rgb(255, 255, 255)", font=get_font(font_file, 16))
+
+        image = add_string(Image.fromarray(image_np), position=position, font_size=16, text=text,
+                           fill_color_for_pil="rgb(255, 255, 255)", font_file=font_file)
+
+        assert np.array_equal(np.asarray(image), np.asarray(expected))
+
+
 # def test_with_recorded_data():
 #     """
 #     Testing view.python_core.movies.export_movie with recorded data
@@ -1,7 +1,15 @@
 from view import VIEW
 from view.python_core.io import write_tif_2Dor3D
+from view.python_core.p1_class.filters import apply_scattered_light_correction, MedianMeanFilterPipeline
+from view.python_core.movement_correction import register_frames_phase_correlation, apply_shifts, \
+    read_movement_list, write_movement_list
+from view.python_core.bleach_corr.pixelwise import bleach_correct_pixelwise, BleachCorrectionWorkerPool, \
+    empty_shared_memory_array
+from scipy.ndimage import median_filter, uniform_filter, gaussian_filter, shift
 from common import initialize_test_yml_list_measurement
 import numpy as np
+import pathlib as pl
+import tempfile
 
 
 def run_artifact_correction(flags_to_update, output_suffix=None, tiny_dataset=False):
@@ -73,6 +81,113 @@ def test_no_bleach_with_scatter_light_correction():
     )
 
 
+def test_scatter_light_correction_fft():
+    """
+    testing that scatter light correction using FFT gives the same results as using gaussian filters directly
+    """
+
+    raw_data = np.random.RandomState(0).randint(0, 4000, size=(60, 50, 20)).astype(np.uint16)
+
+    for smoothradius in (2.5, 12):
+        direct = apply_scattered_light_correction(
+            matrix_in=raw_data, smoothfactor=0.7, smoothradius=smoothradius, dtype=np.float64, method="direct")
+        fft = apply_scattered_light_correction(
+            matrix_in=raw_data, smoothfactor=0.7, smoothradius=smoothradius, dtype=np.float64, method="fft")
+
+        assert np.allclose(direct, fft)
+
+
+def test_median_mean_filter_pipeline():
+    """
+    testing that filtering in blocks with MedianMeanFilterPipeline gives the same results as applying median and
+    mean filters to the whole data
+    """
+
+    raw_data = np.random.RandomState(0).randint(0, 4000, size=(60, 50, 40)).astype(np.uint16)
+
+    expected = uniform_filter(median_filter(raw_data, size=(3, 3, 1), mode="nearest"), size=(5, 5, 2), mode="nearest")
+
+    pipeline = MedianMeanFilterPipeline(
+        median_size_in_space=3, median_size_in_time=1, mean_size_in_space=5, mean_size_in_time=2, n_threads=3)
+    pipeline.block_elements = 2 ** 12
+
+    assert np.array_equal(pipeline.apply(raw_data), expected)
+    assert np.array_equal(pipeline.apply(np.asfortranarray(raw_data)), expected)
+
+
+def test_movement_registration():
+    """
+    testing that registration using phase correlation recovers shifts applied to synthetic frames
+    """
+
+    random_state = np.random.RandomState(0)
+    frame = gaussian_filter(random_state.rand(100, 80), 2) * 1000 + 500
+
+    expected_shifts = random_state.uniform(-6, 6, size=(2, 20))
+    expected_shifts[:, 5] = 0  # reference frame
+    movie = np.stack([shift(frame, -expected_shifts[:, ind], mode="nearest") for ind in range(20)], axis=2)
+
+    shifts = register_frames_phase_correlation(movie)
+
+    assert np.allclose(shifts[:2], expected_shifts, atol=0.1)
+
+
+def test_apply_shifts():
+    """
+    testing that shifting frames in blocks gives the same results as shifting each frame separately
+    """
+
+    random_state = np.random.RandomState(0)
+    movie = (random_state.rand(50, 40, 150) * 1000).astype(np.uint16)
+    shifts = random_state.uniform(-5, 5, size=(3, 150)).round(2)
+
+    expected_integer = np.stack(
+        [np.roll(movie[:, :, ind], tuple(np.round(shifts[:2, ind]).astype(int)), axis=(0, 1)) for ind in range(150)],
+        axis=2)
+    expected_subpixel = np.stack(
+        [shift(movie[:, :, ind].astype(np.float64), shifts[:2, ind], order=1, mode="grid-wrap") for ind in range(150)],
+        axis=2)
+
+    for n_threads in (1, 2):
+        assert np.array_equal(apply_shifts(movie, shifts, n_threads=n_threads), expected_integer)
+        assert np.allclose(apply_shifts(movie, shifts, subpixel=True, n_threads=n_threads), expected_subpixel)
+
+
+def test_movement_list_per_wavelength():
+    """
+    testing that movement values of the two wavelengths of a measurement are stored separately in .moveList files,
+    and that writing them again replaces the rows written before
+    """
+
+    move_file = pl.Path(tempfile.gettempdir()) / f"{tempfile.gettempprefix()}.moveList"
+    if move_file.is_file():
+        move_file.unlink()
+    shifts_wavelength0 = np.array([[1, -2, 3], [0, 1, 1], [9, 8, 9]])
+    shifts_wavelength1 = np.array([[1.25, -2, 3], [0, 1, 1], [9, 8, 9]])
+
+    write_movement_list(move_file, measu=5, movement_list=shifts_wavelength1, wavelength_index=1)
+    write_movement_list(move_file, measu=5, movement_list=shifts_wavelength0 + 1, wavelength_index=0)
+    write_movement_list(move_file, measu=5, movement_list=shifts_wavelength0, wavelength_index=0)
+
+    assert np.array_equal(read_movement_list(move_file, measu=5, n_frames=3, wavelength_index=0), shifts_wavelength0)
+    assert np.array_equal(read_movement_list(move_file, measu=5, n_frames=3, wavelength_index=1), shifts_wavelength1)
+    assert len(move_file.read_text().splitlines()) == 6
+    # integral values are written as integers, which IDL can read
+    assert "\t1\t-2\t3" in move_file.read_text()
+
+    move_file.unlink()
+
+
+def test_movement_correction():
+    """
+    testing loading data with movement correction
+    """
+
+    run_artifact_correction(
+        flags_to_update={"LE_MovementCorrection": 1},
+    )
+
+
 def test_log_bleach_pixelwise_1cpu():
     """
     testing loading data using pixelwise log bleach correction (non-parallel)
@@ -100,6 +215,85 @@ def test_log_bleach_pixelwise_parallel():
     )
 
 
+def test_log_bleach_pixelwise_parallel_in_shared_memory():
+    """
+    testing that movies in shared memory are bleach corrected in place by worker processes, with the same results
+    as without parallelization
+    """
+
+    frames = np.arange(40)
+    movie = 100 + 50 * np.exp(-frames / 10)[None, None, :] + np.random.normal(size=(6, 5, 40))
+    area = np.ones(movie.shape[:2], dtype=bool)
+    area[0, 0] = False
+    weights = np.ones(movie.shape[2])
+
+    expected, expected_params = bleach_correct_pixelwise(movie=movie, weights=weights, area=area, ncpu=1)
+
+    worker_pool = BleachCorrectionWorkerPool()
+    try:
+        shared_movie = empty_shared_memory_array(shape=movie.shape, dtype=movie.dtype)
+        shared_movie[:] = movie
+        corrected, params = bleach_correct_pixelwise(
+            movie=shared_movie, weights=weights, area=area, ncpu=2, worker_pool=worker_pool)
+    finally:
+        worker_pool.shutdown()
+
+    assert corrected is shared_movie
+    assert np.allclose(corrected, expected)
+    assert params.keys() == expected_params.keys()
+
+
+def test_log_bleach_pixelwise_batched():
+    """
+    testing loading data using pixelwise log bleach correction with the batched solver, which should give nearly
+    the same results as fitting each pixel with scipy
+    """
+
+    vo_batched = run_artifact_correction(
+        flags_to_update={
+            "LE_BleachCorrMethod": "log_pixelwise_batched"
+        },
+        tiny_dataset=True
+    )
+
+    vo_1cpu = run_artifact_correction(
+        flags_to_update={
+            "LE_BleachCorrMethod": "log_pixelwise_1cpu"
+        },
+        tiny_dataset=True
+    )
+
+    A, K, C = vo_batched.p1.metadata.bleachpar
+    assert A.shape == K.shape == C.shape == vo_batched.p1.raw1.shape[:2]
+    assert np.allclose(vo_batched.p1.raw1, vo_1cpu.p1.raw1, rtol=1e-3, atol=1e-2)
+
+
+def test_log_bleach_fit_reuse():
+    """
+    testing that bleach fit parameters saved for a measurement are reused when loading it again, giving the same
+    corrected data as fitting
+    """
+
+    vo_fitted = run_artifact_correction(
+        flags_to_update={
+            "LE_BleachCorrMethod": "log_pixelwise_batched",
+            "LE_BleachFitReuse": "measurement"
+        },
+        tiny_dataset=True
+    )
+
+    vo_reused = run_artifact_correction(
+        flags_to_update={
+            "LE_BleachCorrMethod": "log_pixelwise_batched",
+            "LE_BleachFitReuse": "measurement"
+        },
+        tiny_dataset=True
+    )
+
+    assert np.allclose(vo_fitted.p1.raw1, vo_reused.p1.raw1)
+    assert np.allclose(vo_fitted.p1.metadata.bleachpar, vo_reused.p1.metadata.bleachpar, equal_nan=True)
+
+
 def test_log_bleach_pixelwise_excluding_area():
     """
     testing loading data using pixelwise log bleach correction (parallel) with area exclusion
@@ -173,6 +367,20 @@ def test_log_bleach_uniform_excluding_stimulus():
     )
 
 
+def test_corrected_raw_data_cache():
+    """
+    testing that raw data loaded from the cache of corrected raw data is identical to freshly corrected raw data
+    """
+
+    flags_to_update = {"LE_BleachCorrMethod": "log_uniform", "LE_CorrectedRawDataCacheGB": 1}
+
+    vo_corrected = run_artifact_correction(flags_to_update=flags_to_update)
+    vo_cached = run_artifact_correction(flags_to_update=flags_to_update)
+
+    assert np.allclose(vo_corrected.p1.raw1, vo_cached.p1.raw1)
+    assert np.allclose(vo_corrected.p1.metadata.bleachpar, vo_cached.p1.metadata.bleachpar)
+
+
 def test_artifact_correction_filters_only():
     """
     testing loading data with no bleach correction, but with median filtering
@@ -2,6 +2,7 @@ from common import initialize_test_yml_list_measurement
 from view import VIEW
 from view.python_core import ctvs
 from view.python_core.overviews import generate_overview_frame
+from view.python_core.overviews.ctv_handlers import get_ctv_handler
 import inspect
 import pathlib as pl
 import numpy as np
@@ -56,5 +57,54 @@ def test_ctv_35():
     check_ctv_generic(35)
 
 
+def test_array_mode_ctvs():
+    """
+    Testing that array mode CTVs give the same overviews as applying CTVs one pixel after another, with FakeData
+    """
+
+    test_yml, test_animal, test_measu = initialize_test_yml_list_measurement()
+
+    view = VIEW()
+    view.update_flags_from_ymlfile(test_yml)
+    view.update_flags({"SO_Method": 0})
+    view.load_measurement_data(test_animal, test_measu)
+    view.calculate_signals()
+
+    for ctv_method in (22, 35, 300, 303, 330, 333, "22and35", "chunk_magnitude_basic"):
+        view.update_flags({"CTV_Method": ctv_method})
+        ctv_handler = get_ctv_handler(flags=view.flags, p1=view.p1)
+        assert ctv_handler.array_mode_ctv_method is not None
+
+        array_mode_overview = ctv_handler.apply(view.p1.sig1)
+
+        ctv_handler.array_mode_ctv_method = None
+        pixel_wise_overview = ctv_handler.apply(view.p1.sig1)
+
+        assert np.allclose(array_mode_overview, pixel_wise_overview, equal_nan=True)
+
+
+def test_parallel_ctv_handler():
+    """
+    Testing that calculating CTVs in parallel (SO_Method=1) gives the same overviews as SO_Method=0, with FakeData
+    """
+
+    test_yml, test_animal, test_measu = initialize_test_yml_list_measurement()
+
+    view = VIEW()
+    view.update_flags_from_ymlfile(test_yml)
+    view.update_flags({"SO_ParallelWorkers": 2})
+    view.load_measurement_data(test_animal, test_measu)
+    view.calculate_signals()
+
+    for ctv_method in (22, 35):
+        view.update_flags({"CTV_Method": ctv_method, "SO_Method": 0})
+        expected_overview = get_ctv_handler(flags=view.flags, p1=view.p1).apply(view.p1.sig1)
+
+        view.update_flags({"SO_Method": 1})
+        overview = get_ctv_handler(flags=view.flags, p1=view.p1).apply(view.p1.sig1)
+
+        assert np.allclose(overview, expected_overview, equal_nan=True)
+
+
 if __name__ == '__main__':
     test_ctv_35()
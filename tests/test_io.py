@@ -1,6 +1,6 @@
 from common import initialize_test_yml_list_measurement
 from view import VIEW
-from view.python_core.io import read_tif_2Dor3D, write_tif_2Dor3D
+from view.python_core.io import read_tif_2Dor3D, write_tif_2Dor3D, load_pst, is_memory_mapped
 import tempfile
 import pathlib as pl
 import numpy as np
@@ -42,6 +42,27 @@ def test_tif_io():
     # assert all(x == y for x, y in zip(fake_labels, read_labels))
 
 
+def test_lazy_pst_io():
+
+    temp_pst_path = pl.Path(tempfile.gettempdir()) / f"{tempfile.gettempprefix()}_lazy.pst"
+
+    stack_xyt = np.random.randint(0, 4096, size=(21, 17, 12)).astype(np.uint16)
+    # .pst files are stored in Fortran order and upside down
+    np.flip(stack_xyt, axis=1).astype(np.int16).ravel(order="F").tofile(temp_pst_path)
+    temp_pst_path.with_suffix(".inf").write_text("Width=21\nHeight=17\nFrames=12\n")
+
+    lazy_stack = load_pst(str(temp_pst_path), lazy=True)
+
+    assert is_memory_mapped(lazy_stack)
+    assert np.array_equal(lazy_stack, load_pst(str(temp_pst_path)))
+    assert np.array_equal(lazy_stack, stack_xyt)
+    assert not is_memory_mapped(np.array(lazy_stack))
+
+    del lazy_stack
+    temp_pst_path.unlink()
+    temp_pst_path.with_suffix(".inf").unlink()
+
+
 if __name__ == '__main__':
 
     test_tif_io()
@@ -4,6 +4,7 @@ from view.python_core.flags import FlagsManager
 from view.python_core.paths import get_existing_raw_data_filename
 from view.python_core.view_object import VIEW
 from view.python_core.p1_class import get_empty_p1
+import numpy as np
 
 
 def load_calc_data(yml_file, animal, measus=None, flags=None):
@@ -76,6 +77,57 @@ def test_loading_data_without_measurement_list():
         animal=animal)
 
 
+def test_tiled_signal_calculation():
+    """Testing that calculating signals in spatial tiles gives the same signals as calculating them at once"""
+
+    example_data_root_path = get_example_data_root_path()
+    yml_file = str(example_data_root_path / "FakeData" / "test_defaults.yml")
+
+    for calc_method in (3, 4):
+
+        vo = load_calc_data(yml_file=yml_file, animal="FakeData", flags={"LE_CalcMethod": calc_method})
+        expected_sig1 = vo.p1.sig1
+
+        vo.update_flags({"LE_SignalTileSize": 16})
+        vo.calculate_signals()
+
+        assert np.allclose(vo.p1.sig1, expected_sig1, equal_nan=True)
+
+
+def test_correcting_wavelengths_in_parallel():
+    """Testing that correcting the two wavelengths of dual wavelength data in parallel gives the same raw data as
+    correcting them one after the other"""
+
+    example_data_root_path = get_example_data_root_path()
+    yml_file = str(example_data_root_path / "IP_Fura" / "usage_till.yml")
+
+    vos = [load_calc_data(yml_file=yml_file, animal="190112_locust_ip",
+                          flags={"LE_CorrectWavelengthsInParallel": in_parallel, "LE_CorrectedRawDataCacheGB": 0})
+           for in_parallel in (False, True)]
+
+    assert np.array_equal(vos[0].p1.raw1, vos[1].p1.raw1)
+    assert np.array_equal(vos[0].p1.raw2, vos[1].p1.raw2)
+
+
+def test_iter_measurements():
+    """Testing loading measurements one after the other with prefetching"""
+
+    example_data_root_path = get_example_data_root_path()
+    yml_file = str(example_data_root_path / "HS_Till" / "usage_till.yml")
+
+    vo = VIEW()
+    vo.update_flags_from_ymlfile(yml_filename=yml_file)
+    vo.initialize_animal(animal="HS_bee_PELM_180416b")
+    measus = vo.get_measus_for_current_animal(analyze_values_to_use=(1, 2))
+
+    loaded_measus = []
+    for measu, measu_label in vo.iter_measurements(measus, prefetch=2):
+        assert measu_label == vo.get_measu_label_for_current_animal(measu)
+        loaded_measus.append(measu)
+
+    assert loaded_measus == list(measus)
+
+
 if __name__ == '__main__':
 
     # load_calc_data(
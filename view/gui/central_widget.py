@@ -15,6 +15,7 @@ from PyQt5.QtWidgets import QWidget, QVBoxLayout, QMessageBox, QHBoxLayout, QGro
 from matplotlib import pyplot as plt
 
 from view.idl_translation_core.ViewOverview import ExportMovie
+from view.python_core.bleach_corr import BleachCorrectionWorkerPool
 from view.python_core.flags import FlagsManager
 from view.python_core.foto import show_photo, get_foto1_data
 from view.python_core.io import read_check_yml_file
@@ -52,6 +53,9 @@ class CentralWidget(QWidget):
         self.misc_function_buttons = {}
         self.p1s = {}
 
+        # worker processes for parallel bleach correction, reused for all measurements loaded
+        self.bleach_correction_worker_pool = BleachCorrectionWorkerPool()
+
         self.init_flags()
         self.current_measurement_label = None
         self.init_ui()
@@ -64,6 +68,7 @@ class CentralWidget(QWidget):
 
         del self.gdm_viz_window
         del self.load_measurement_window
+        self.bleach_correction_worker_pool.shutdown()
 
     def init_flags(self):
 
@@ -680,7 +685,8 @@ class CentralWidget(QWidget):
                               f"LE_loadExp={self.flags['LE_loadExp']}.")
 
             try:
-                p1 = get_p1(p1_metadata=p1_metadata, flags=self.flags, extra_metadata=extra_metadata)
+                p1 = get_p1(p1_metadata=p1_metadata, flags=self.flags, extra_metadata=extra_metadata,
+                            bleach_correction_worker_pool=self.bleach_correction_worker_pool)
             except FileNotFoundError as fnfe:
                 QMessageBox.critical(self, "File Not Found", str(fnfe))
                 self.write_status(f"[failure] Loading measurement data for measu={measu} from {lst_or_log_filepath}.")
@@ -108,11 +108,10 @@ def xyouts(x,y, text, img, orientation=90, fill=255, align = 'left'):
     # now write the text into this place
     draw = PIL.ImageDraw.Draw(img)
     # corect x axis if right alignement
-    text_box_size = draw.textsize(text)
+    text_box_size = draw.textbbox((0, 0), text)[2:]
     if align.lower() == 'right':
         rot_x = rot_x - text_box_size[0]      
     if align.lower() == 'center':
-        text_box_size = draw.textsize(text)
         rot_x = rot_x - text_box_size[0]/2      
     #coordinates are different from IDL, it seams - so shift the y by the text height
     rot_y = rot_y - text_box_size[1]
@@ -625,16 +625,17 @@ def CalcSigAll3000_raw(p1, flag):
     return p1, flag #  no return, p1 is modified already. Try return instead now (8/19)
 
 
-def calc_deltaF(imgData, refRange):
+def calc_deltaF(imgData, refRange, dtype=np.float64):
     '''    
     Input: 3D matrix x,y,t, refRange
     calculates a crude deltaF.
     F0 is the entire movie (default), or the interval refRange (e.g. [14,21])
     :param refRange: list of length 2, frame numbers (indices) of the starting and ending frame of the range to use for
     baseline fluorescence calculation. Note that the ending frame is included in baseline calculation.
+    :param dtype: numpy floating point data type of the returned deltaF
     '''
 
-    referenceF = np.mean(imgData[:, :, refRange[0]: refRange[1] + 1], axis=2)
+    referenceF = np.mean(imgData[:, :, refRange[0]: refRange[1] + 1], axis=2, dtype=np.float64).astype(dtype)
 
     dead_mask = referenceF == 0
     if np.any(dead_mask):
@@ -646,7 +647,8 @@ def calc_deltaF(imgData, refRange):
     # convert to txy because framewise division is easier
     imgData_txy = np.moveaxis(imgData, source=-1, destination=0)
 
-    deltaFdata_txy = (imgData_txy / referenceF) - 1
+    deltaFdata_txy = np.divide(imgData_txy, referenceF, dtype=dtype)
+    deltaFdata_txy -= 1
 
     # convert back
     deltaFdata = np.moveaxis(deltaFdata_txy, source=0, destination=-1)
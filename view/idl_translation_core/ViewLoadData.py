@@ -15,6 +15,7 @@ import os
 from view.python_core.p1_class.filters import apply_filter
 from view.python_core.paths import get_existing_raw_data_filename
 from view.python_core.io import read_tif_2Dor3D
+from view.python_core.movement_correction import read_movement_list, write_movement_list
 import tifffile
 import pathlib as pl
 import logging
@@ -1003,15 +1004,8 @@ def ReadWriteMovementValues(flagWrite, MovementList, p1, flag):
     # the third column is the odor flag, generally 0,0,0,1,1,1, ...repeat this...
     # HERE: take row 4 for x movement, and row 5 for y movement, IGNORE the rest for now.
     # movelist is tab-separated
-            moveList_df = pd.read_csv(MoveFile, sep='\t', header=None)
-    # which is the measurement I am interested in?
-            measuNum = p1.messungszahl
-    # I only want the rows that have measuNum in the first column
-            moveList_df = moveList_df.loc[moveList_df.iloc[:,0] == measuNum]
-    # remove the first two columns, and keep only fourth and fifth row
-            #moveList_df = moveList_df.iloc[3:5,3:] #take rows 3-5, i.e. second three rows
-            moveList_df = moveList_df.iloc[-3:,3:p1.metadata.frames+3]  #take last three rows,
-            # and only as many columns as frames starting at 3
+            # reading is done in view.python_core.movement_correction, which also uses this format
+            # the last three rows of the measurement are taken, and only as many columns as frames starting at 3
 #;definition of movement list in the master is:
 #;movementList = intarr(3,p1.frames,p1.odors+1); x/y/quality, frames, data(odor/wavelength)
             # because in IDL there were, generally, two odors, the first fictive, the second not
@@ -1020,24 +1014,17 @@ def ReadWriteMovementValues(flagWrite, MovementList, p1, flag):
             # therefore, here in Phython I take the LAST 3 lines
             # this way, in the future, I can write 3 lines only. 
             # will go wrong if several odors are used (e.g. separate movementlist in Fura? CHECK)
-            MovementList = moveList_df.values # report matrix only
+            MovementList = read_movement_list(move_file=MoveFile, measu=p1.messungszahl, n_frames=p1.metadata.frames)
     else: #write file
         print('ReadWriteMovementValues: open info file for writing ', MoveFile)
         # add the first three columns to movementList matrix
         # first column: p1.messungszahl
         # second column 0,1,2 (for x/y/quality)
         # third column 0 (for odor - not used in Python, yet)
-        out_info = np.array([[p1.messungszahl,0,0],[p1.messungszahl,1,0],[p1.messungszahl,2,0]])
-        out_move   = pd.DataFrame(np.append(out_info, MovementList, axis=1)) #also convert to dataframe
         if os.path.isfile(MoveFile): #file exists
             print('ReadWriteMovementValues: appending to old file')
-            # load previous data
-            old_move  = pd.read_csv(MoveFile, sep='\t', header=None)
-            out_move  = pd.concat([old_move,out_move]) #add this one to the existing list
-        # now write the new movementList to file. 
-        # use dataframe format for my lazyness  -  np.savetxt would be leaner
-        # do not add header line (also IDL did not do that any more)
-        out_move.to_csv(MoveFile, sep='\t', header=False, index=False)
+        # writing to an existing file is done in view.python_core.movement_correction, which also uses this format
+        write_movement_list(move_file=MoveFile, measu=p1.messungszahl, movement_list=MovementList)
     #movementList is just the shiftArray, movementList_w has the first three columns added
     return MovementList #
 #end; ReadWriteMovementValues
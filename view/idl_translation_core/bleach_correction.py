@@ -51,7 +51,7 @@ def model_func(t, A, K, C):
 # (fittedout, opt_parms) = fitlogdecay(lineIn, weights, True, 'test')
 # print(opt_parms)
 
-def fitlogdecay(lineIn, weights, showresults=False, measurement_label=""):
+def fitlogdecay(lineIn, weights, showresults=False, measurement_label="", initial_params=None):
 
     ##python help, look at:
     # https://scipython.com/book/chapter-8-scipy/examples/weighted-and-non-weighted-least-squares-fitting/
@@ -64,6 +64,8 @@ def fitlogdecay(lineIn, weights, showresults=False, measurement_label=""):
     #weights: same length as lineIn. 0: do not consider this value.
     # high value: point is important
     # low value:  point is not important.
+    #initial_params: (A, K, C), used instead of the linear fit as initial guess if specified and finite,
+    # e.g. parameters fitted to an earlier measurement (warm start)
 
 
 
@@ -137,8 +139,13 @@ def fitlogdecay(lineIn, weights, showresults=False, measurement_label=""):
     else:
         try:
             # default value of maxfev is 800, not always sufficient
+            p0 = (A, K, offset)
+            if initial_params is not None and np.all(np.isfinite(initial_params)):
+                # A has to be within the bounds below
+                A_init = min(max(initial_params[0], min(y_keep.min() - offset, A)), max(y_keep.max() - offset, A))
+                p0 = (A_init, initial_params[1], initial_params[2])
             opt_parms, parm_cov = spo.curve_fit(
-                model_func, t_keep, y_keep,  p0=(A,K,offset), sigma = sigma, maxfev=3200,
+                model_func, t_keep, y_keep,  p0=p0, sigma = sigma, maxfev=3200,
                 # setting bounds on A, to make sure that the fitted curve does not rise/fall faster than y_keep does.
                 # it helps to reduce the exponential divergence between fittedout and y for points with 0 weight.
                 bounds=[
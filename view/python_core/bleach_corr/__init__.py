@@ -1,5 +1,7 @@
-from .pixelwise import bleach_correct_pixelwise
-from ...idl_translation_core.bleach_correction import fitlogdecay, get_bleach_weights
+from .pixelwise import bleach_correct_pixelwise, BleachCorrectionWorkerPool, empty_shared_memory_array
+from .batched import bleach_correct_pixelwise_batched, correct_with_parameter_maps
+from .fit_params_store import BleachFitParamsStore
+from ...idl_translation_core.bleach_correction import fitlogdecay, get_bleach_weights, model_func
 import numpy as np
 import platform
 import multiprocessing as mp
@@ -23,6 +25,17 @@ class NoBleachCompensator(object):
 
         return stack_xyt, None
 
+    def empty_movie(self, shape, dtype):
+        """
+        Returns an uninitialized array for a movie to be corrected with <apply>, e.g. for the output of earlier
+        corrections, which <apply> can correct without copying it
+        :param tuple shape: format XYT
+        :param dtype: numpy dtype
+        :rtype: numpy.ndarray
+        """
+
+        return np.empty(shape, dtype=dtype)
+
 
 class BaseBleachCompensator(NoBleachCompensator):
 
@@ -40,30 +53,126 @@ class BaseBleachCompensator(NoBleachCompensator):
             flags=flags, p1_metadata=p1_metadata, movie_size=movie_size,
             exclude_stimulus=flags["LE_BleachExcludeStimulus"])
 
+        self.fit_params_store = BleachFitParamsStore.from_flags(flags)
+
+    def apply(self, stack_xyt: np.ndarray, area_mask: np.ndarray):
+        """
+        Apply bleach correction to the movie `stack_xyt`. Depending on the flag "LE_BleachFitReuse", parameters fitted
+        earlier are reused instead of fitting, or used as initial guesses for fitting (see BleachFitParamsStore)
+        :param numpy.ndarray stack_xyt: 3D, format XYT
+        :param numpy.ndarray area_mask: 2D, formay XY
+        :return: bleach corrected movie and fitted parameters
+        :rtype: tuple
+        """
+
+        if self.fit_params_store is None:
+            return self.correct(stack_xyt=stack_xyt, area_mask=area_mask)
+
+        key = self.fit_params_store.get_key(stack_xyt=stack_xyt, area_mask=area_mask, weights=self.weights)
+        params_shape = self.get_params_shape(movie_size=stack_xyt.shape)
+
+        params = self.fit_params_store.get_params_to_reuse(key=key, shape=params_shape)
+        if params is not None:
+            logging.getLogger("VIEW").info(f"Reusing bleach fit parameters from {self.fit_params_store.store_dir}")
+            return self.correct(stack_xyt=stack_xyt, area_mask=area_mask, fixed_params=params)
+
+        initial_params = self.fit_params_store.load_latest(shape=params_shape)
+        corrected, fit_params = self.correct(stack_xyt=stack_xyt, area_mask=area_mask, initial_params=initial_params)
+        self.fit_params_store.save(key=key, params=self.params_to_array(fit_params, frame_size=stack_xyt.shape[:2]))
+
+        return corrected, fit_params
+
+    def correct(self, stack_xyt: np.ndarray, area_mask: np.ndarray, initial_params=None, fixed_params=None):
+        """
+        Apply bleach correction to the movie `stack_xyt`
+        :param numpy.ndarray stack_xyt: 3D, format XYT
+        :param numpy.ndarray area_mask: 2D, formay XY
+        :param numpy.ndarray initial_params: initial guesses for fitting, in the format of <params_to_array>
+        :param numpy.ndarray fixed_params: parameters used instead of fitting, in the format of <params_to_array>
+        :return: bleach corrected movie and fitted parameters
+        :rtype: tuple
+        """
+
+        raise NotImplementedError
+
+    def get_params_shape(self, movie_size):
+        """
+        Shape of fitted parameters as returned by <params_to_array>
+        :param tuple movie_size: raw data size, format XYT
+        :rtype: tuple
+        """
+
+        return (3,) + tuple(movie_size[:2])
+
+    def params_to_array(self, params, frame_size):
+        """
+        Convert fitted parameters as returned by <correct> into a numpy.ndarray
+        :param params: fitted parameters
+        :param tuple frame_size: format XY
+        :rtype: numpy.ndarray
+        """
+
+        raise NotImplementedError
+
 
 class PixelWiseBleachCompensatorParallel(BaseBleachCompensator):
 
-    def __init__(self, flags, p1_metadata, movie_size):
+    def __init__(self, flags, p1_metadata, movie_size, worker_pool=None):
         """
         :param FlagsManager flags:
         :param pandas.Series p1_metadata: experimental metadata
+        :param BleachCorrectionWorkerPool worker_pool: pool of worker processes of the session, if None, worker
+        processes are started for each correction
         :return: an object that can be used to apply bleach compensation
         """
 
         super().__init__(flags, p1_metadata, movie_size)
-        self.ncpu = mp.cpu_count()
+        n_workers = flags["LE_BleachParallelWorkers"]
+        self.ncpu = n_workers if n_workers > 0 else mp.cpu_count()
+        self.worker_pool = worker_pool
 
-    def apply(self, stack_xyt: np.ndarray, area_mask: np.ndarray):
+    def empty_movie(self, shape, dtype):
+        """
+        Returns an uninitialized array for a movie to be corrected with <apply>. With more than one CPU, it is allocated
+        in shared memory, where worker processes correct it in place
+        :param tuple shape: format XYT
+        :param dtype: numpy dtype
+        :rtype: numpy.ndarray
+        """
+
+        if self.ncpu > 1:
+            return empty_shared_memory_array(shape=shape, dtype=dtype)
+
+        return super().empty_movie(shape=shape, dtype=dtype)
+
+    def correct(self, stack_xyt: np.ndarray, area_mask: np.ndarray, initial_params=None, fixed_params=None):
         """
         Apply bleach correction to the movie `stack_xyt`
         :param numpy.ndarray stack_xyt: 3D, format XYT
         :param numpy.ndarray area_mask: 2D, formay XY
-        :return: bleach corrected movie
-        :rtype: numpy.ndarray, same shape and format as `stack_xyt`
+        :param numpy.ndarray initial_params: initial guesses for fitting, A, K and C maps stacked along the first axis
+        :param numpy.ndarray fixed_params: parameters used instead of fitting, format as <initial_params>
+        :return: bleach corrected movie and a dict with pixel indices as keys and fitted parameters (A, K, C) as
+        values
+        :rtype: tuple
         """
 
+        if fixed_params is not None:
+            pixel_inds = zip(*(inds.tolist() for inds in np.nonzero(area_mask)))
+            return correct_with_parameter_maps(movie=stack_xyt, parameter_maps=fixed_params, area=area_mask), \
+                {pixel_ind: tuple(fixed_params[(slice(None),) + pixel_ind]) for pixel_ind in pixel_inds}
+
         return bleach_correct_pixelwise(
-            movie=stack_xyt, weights=self.weights, area=area_mask, ncpu=self.ncpu)
+            movie=stack_xyt, weights=self.weights, area=area_mask, ncpu=self.ncpu,
+            initial_parameter_maps=initial_params, worker_pool=self.worker_pool)
+
+    def params_to_array(self, params, frame_size):
+
+        parameter_maps = np.full((3,) + tuple(frame_size), np.nan)
+        for pixel_ind, pixel_params in params.items():
+            parameter_maps[(slice(None),) + pixel_ind] = pixel_params
+
+        return parameter_maps
 
 
 class PixelWiseBleachCompensator1CPU(PixelWiseBleachCompensatorParallel):
@@ -79,6 +188,40 @@ class PixelWiseBleachCompensator1CPU(PixelWiseBleachCompensatorParallel):
         self.ncpu = 1
 
 
+class PixelWiseBleachCompensatorBatched(BaseBleachCompensator):
+
+    def __init__(self, flags, p1_metadata, movie_size):
+        """
+        :param FlagsManager flags:
+        :param pandas.Series p1_metadata: experimental metadata
+        :return: an object that can be used to apply bleach compensation
+        """
+
+        super().__init__(flags, p1_metadata, movie_size)
+
+    def correct(self, stack_xyt: np.ndarray, area_mask: np.ndarray, initial_params=None, fixed_params=None):
+        """
+        Apply bleach correction to the movie `stack_xyt`, fitting many pixels at once
+        :param numpy.ndarray stack_xyt: 3D, format XYT
+        :param numpy.ndarray area_mask: 2D, formay XY
+        :param numpy.ndarray initial_params: initial guesses for fitting, A, K and C maps stacked along the first axis
+        :param numpy.ndarray fixed_params: parameters used instead of fitting, format as <initial_params>
+        :return: bleach corrected movie and fitted parameters (A, K, C), each a 2D numpy.ndarray in format XY
+        :rtype: tuple
+        """
+
+        if fixed_params is not None:
+            return correct_with_parameter_maps(movie=stack_xyt, parameter_maps=fixed_params, area=area_mask), \
+                tuple(fixed_params)
+
+        return bleach_correct_pixelwise_batched(
+            movie=stack_xyt, weights=self.weights, area=area_mask, initial_parameter_maps=initial_params)
+
+    def params_to_array(self, params, frame_size):
+
+        return np.stack(params)
+
+
 class UniformBleachCompensator(BaseBleachCompensator):
 
     def __init__(self, flags, p1_metadata, movie_size):
@@ -88,7 +231,15 @@ class UniformBleachCompensator(BaseBleachCompensator):
         self.show_results = not flags["VIEW_batchmode"]
         self.measurement_label = p1_metadata['ex_name']
 
-    def apply(self, stack_xyt: np.ndarray, area_mask: np.ndarray):
+    def get_params_shape(self, movie_size):
+
+        return 3,
+
+    def params_to_array(self, params, frame_size):
+
+        return np.array(params, dtype=np.float64)
+
+    def correct(self, stack_xyt: np.ndarray, area_mask: np.ndarray, initial_params=None, fixed_params=None):
 
         # converting data temporarily to txy format as it is easier to divide the movie by
         # a frame in this format
@@ -107,8 +258,14 @@ class UniformBleachCompensator(BaseBleachCompensator):
         # (some pixels in F0_frame might have values of 0, so F_by_F0_txy might have nans)
         curve = np.nanmean(F_by_F0_txy_masked, axis=(1, 2))
 
-        # apply bleach correction to curve and return the parameters A, K and C
-        fitted_curve, (A, K, C) = fitlogdecay(lineIn=curve, weights=self.weights, showresults=self.show_results, measurement_label=self.measurement_label)
+        if fixed_params is not None:
+            A, K, C = fixed_params
+            fitted_curve = model_func(np.arange(len(curve)), A, K, C)
+        else:
+            # apply bleach correction to curve and return the parameters A, K and C
+            fitted_curve, (A, K, C) = fitlogdecay(
+                lineIn=curve, weights=self.weights, showresults=self.show_results,
+                measurement_label=self.measurement_label, initial_params=initial_params)
 
         # converting to xyt as it is easier to subtract a trace from all pixels in this format
         F_by_F0_xyt = np.moveaxis(F_by_F0_txy, source=0, destination=-1)
@@ -128,11 +285,13 @@ class UniformBleachCompensator(BaseBleachCompensator):
         return raw_corrected, (A, K, C)
 
 
-def get_bleach_compensator(flags, p1_metadata, movie_size):
+def get_bleach_compensator(flags, p1_metadata, movie_size, worker_pool=None):
     """
     Get an object whose "apply" method can apply bleach compensation to a movie
     :param FlagsManager flags:
     :param pandas.Series p1_metadata: experimental metadata
+    :param BleachCorrectionWorkerPool worker_pool: pool of worker processes of the session, used for parallel bleach
+    correction
     :return: an object that can be used to apply bleach compensation
     """
 
@@ -146,7 +305,11 @@ def get_bleach_compensator(flags, p1_metadata, movie_size):
 
     if flags["LE_BleachCorrMethod"] == "log_pixelwise_parallel":
 
-        return PixelWiseBleachCompensatorParallel(flags, p1_metadata, movie_size)
+        return PixelWiseBleachCompensatorParallel(flags, p1_metadata, movie_size, worker_pool=worker_pool)
+
+    if flags["LE_BleachCorrMethod"] == "log_pixelwise_batched":
+
+        return PixelWiseBleachCompensatorBatched(flags, p1_metadata, movie_size)
 
     elif flags["LE_BleachCorrMethod"] == "log_uniform":
 
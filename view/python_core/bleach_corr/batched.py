@@ -0,0 +1,241 @@
+import numpy as np
+
+
+def fit_exp_linear_autoOffset_batched(t, curves):
+    """
+    Same as view.idl_translation_core.bleach_correction.fit_exp_linear_autoOffset, but for many curves at once
+    :param numpy.ndarray t: 1D, time points
+    :param numpy.ndarray curves: 2D, one curve per row, sampled at <t>
+    :return: A, K, offset, each a 1D numpy.ndarray with one value per curve
+    """
+
+    percent_left = 0.01
+
+    miny, maxy = curves.min(axis=1), curves.max(axis=1)
+    offset = (1 + percent_left) * miny - percent_left * maxy
+    flat = offset == miny
+
+    # flat curves give -inf here and are handled below
+    with np.errstate(divide="ignore", invalid="ignore"):
+        y_log = np.log(curves - offset[:, np.newaxis])
+
+        # linear least squares fit of y_log against t, the same as np.polyfit(t, y_log, 1) for each curve
+        t_centered = t - t.mean()
+        K = (y_log - y_log.mean(axis=1, keepdims=True)) @ t_centered / (t_centered @ t_centered)
+        A = np.exp(y_log.mean(axis=1) - K * t.mean())
+
+    # entirely flat curves
+    A[flat] = 0
+    K[flat] = 1
+    offset[flat] = miny[flat]
+
+    return A, K, offset
+
+
+def fit_log_decay_batched(curves, weights, initial_params=None, max_iterations=100, tolerance=1e-10):
+    """
+    Fits A * exp(K * t) + C to many curves at once, with the same initial estimates, weights and bounds as
+    view.idl_translation_core.bleach_correction.fitlogdecay. Instead of one call of scipy.optimize.curve_fit per
+    curve, a vectorized Levenberg-Marquardt algorithm is run on all curves together. Where it does not converge to
+    finite values, the initial estimates are used, as in fitlogdecay
+    :param numpy.ndarray curves: 2D, one curve per row
+    :param numpy.ndarray weights: 1D, one weight per time point, 0 excludes a time point from the fit
+    :param numpy.ndarray initial_params: 2D, one row (A, K, C) per curve. Where finite, used as initial guesses instead
+    of the linear fit, e.g. parameters fitted to an earlier measurement (warm start)
+    :param int max_iterations: maximum number of Levenberg-Marquardt iterations
+    :param float tolerance: iterations stop for a curve when its weighted sum of squared residuals changes by less than
+    this fraction
+    :return: A, K, C, each a 1D numpy.ndarray with one value per curve
+    """
+
+    keep = weights != 0
+    t_keep = np.arange(curves.shape[1])[keep].astype(np.float64)
+    y_keep = curves[:, keep].astype(np.float64)
+    # curve_fit is called with sigma = 1 / weights, which weights residuals with <weights>
+    weights_keep = weights[keep].astype(np.float64)
+
+    A_init, K_init, C_init = fit_exp_linear_autoOffset_batched(t_keep, y_keep)
+    params = np.stack([A_init, K_init, C_init], axis=1)
+
+    # bounds on A, to make sure that the fitted curve does not rise/fall faster than y_keep does (see fitlogdecay)
+    A_lower = np.minimum(y_keep.min(axis=1) - C_init, A_init)
+    A_upper = np.maximum(y_keep.max(axis=1) - C_init, A_init)
+
+    if initial_params is not None:
+        warm_start = np.isfinite(initial_params).all(axis=1)
+        params[warm_start] = initial_params[warm_start]
+        params[:, 0] = np.clip(params[:, 0], A_lower, A_upper)
+
+    def weighted_residuals(params_, curve_inds):
+        with np.errstate(over="ignore", invalid="ignore"):
+            model = params_[:, 0:1] * np.exp(params_[:, 1:2] * t_keep) + params_[:, 2:3]
+        return (y_keep[curve_inds] - model) * weights_keep
+
+    def cost(residuals_):
+        costs = np.einsum("ij,ij->i", residuals_, residuals_)
+        costs[~np.isfinite(costs)] = np.inf
+        return costs
+
+    residuals = weighted_residuals(params, slice(None))
+    costs = cost(residuals)
+    damping = np.full(len(params), 1e-3)
+
+    # linear fit is better than exponential fit where A == 0, as these curves are flat
+    active = (A_init != 0) & np.isfinite(costs)
+
+    for iteration in range(max_iterations):
+
+        active_inds = np.flatnonzero(active)
+        if active_inds.size == 0:
+            break
+
+        params_active = params[active_inds]
+        with np.errstate(over="ignore", invalid="ignore"):
+            exp_Kt = np.exp(params_active[:, 1:2] * t_keep)
+        jacobian = np.stack(
+            [exp_Kt, params_active[:, 0:1] * t_keep * exp_Kt, np.ones_like(exp_Kt)], axis=2) \
+            * weights_keep[:, np.newaxis]
+
+        JtJ = np.einsum("ijk,ijl->ikl", jacobian, jacobian)
+        Jtr = np.einsum("ijk,ij->ik", jacobian, residuals[active_inds])
+
+        # Levenberg-Marquardt: the diagonal of JtJ is scaled by (1 + damping)
+        damped_JtJ = JtJ * (1 + damping[active_inds, np.newaxis, np.newaxis] * np.eye(3))
+
+        def solve(damped_JtJ_, Jtr_):
+            with np.errstate(over="ignore", invalid="ignore"):
+                solvable_ = np.isfinite(damped_JtJ_).all(axis=(1, 2)) & (np.abs(np.linalg.det(damped_JtJ_)) > 0)
+            steps_ = np.zeros(Jtr_.shape)
+            steps_[solvable_] = np.linalg.solve(damped_JtJ_[solvable_], Jtr_[solvable_, :, np.newaxis])[:, :, 0]
+            return steps_, solvable_
+
+        steps, solvable = solve(damped_JtJ, Jtr)
+
+        # where A is at one of its bounds and the step points beyond it, keep A fixed and only update K and C
+        A_active = params_active[:, 0]
+        blocked = ((A_active <= A_lower[active_inds]) & (steps[:, 0] < 0)) \
+            | ((A_active >= A_upper[active_inds]) & (steps[:, 0] > 0))
+        if blocked.any():
+            damped_JtJ[blocked, 0, :] = 0
+            damped_JtJ[blocked, :, 0] = 0
+            damped_JtJ[blocked, 0, 0] = 1
+            Jtr[blocked, 0] = 0
+            steps_blocked, solvable_blocked = solve(damped_JtJ[blocked], Jtr[blocked])
+            steps[blocked], solvable[blocked] = steps_blocked, solvable_blocked
+
+        candidate_params = params_active + steps
+        candidate_params[:, 0] = np.clip(candidate_params[:, 0], A_lower[active_inds], A_upper[active_inds])
+
+        candidate_residuals = weighted_residuals(candidate_params, active_inds)
+        candidate_costs = cost(candidate_residuals)
+
+        improved = solvable & (candidate_costs < costs[active_inds])
+        improved_inds = active_inds[improved]
+
+        relative_changes \
+            = (costs[improved_inds] - candidate_costs[improved]) / np.maximum(costs[improved_inds], 1e-300)
+
+        params[improved_inds] = candidate_params[improved]
+        residuals[improved_inds] = candidate_residuals[improved]
+        costs[improved_inds] = candidate_costs[improved]
+        damping[improved_inds] /= 10
+        damping[active_inds[~improved]] *= 10
+
+        # stop iterating for curves that converged or for which steps keep failing
+        active[improved_inds[relative_changes < tolerance]] = False
+        active[active_inds[~solvable | (damping[active_inds] > 1e10)]] = False
+
+    not_converged = ~np.isfinite(params).all(axis=1)
+    params[not_converged] = np.stack([A_init, K_init, C_init], axis=1)[not_converged]
+
+    return params[:, 0], params[:, 1], params[:, 2]
+
+
+def bleach_correct_pixelwise_batched(movie: np.ndarray, weights, area, batch_size=16384, initial_parameter_maps=None):
+    """
+    Pixelwise bleach correction like view.python_core.bleach_corr.pixelwise.bleach_correct_pixelwise, where curves
+    of pixels are fitted <batch_size> pixels at a time using <fit_log_decay_batched>
+    :param numpy.ndarray movie: 3D, format XYT
+    :param numpy.ndarray weights: 1D, one weight per frame
+    :param numpy.ndarray area: 2D, format XY, only pixels where it is True are corrected
+    :param int batch_size: number of pixels fitted together
+    :param tuple initial_parameter_maps: A, K and C, each a numpy.ndarray in format XY, used as initial guesses where
+    finite (see <fit_log_decay_batched>)
+    :return: corrected_movie, (A, K, C)
+    corrected_movie: numpy.ndarray, same shape and format as <movie>, floating point
+    A, K, C: numpy.ndarray, format XY, fitted parameters of each pixel, NaN outside <area>
+    """
+
+    assert movie.shape[:2] == area.shape, f"Area file specified has dimensions {area.shape} that does not match with" \
+                                          f"data dimensions {movie.shape}"
+
+    output_dtype = movie.dtype if np.issubdtype(movie.dtype, np.floating) else np.float64
+    corrected_movie = np.array(movie, dtype=output_dtype)
+
+    parameter_maps = np.full((3,) + area.shape, np.nan)
+
+    pixel_inds_x, pixel_inds_y = np.nonzero(area)
+    for batch_start in range(0, len(pixel_inds_x), batch_size):
+
+        batch_x = pixel_inds_x[batch_start: batch_start + batch_size]
+        batch_y = pixel_inds_y[batch_start: batch_start + batch_size]
+        curves = movie[batch_x, batch_y, :].astype(np.float64)
+
+        initial_params = None
+        if initial_parameter_maps is not None:
+            initial_params = np.stack([param_map[batch_x, batch_y] for param_map in initial_parameter_maps], axis=1)
+
+        A, K, C = fit_log_decay_batched(curves=curves, weights=weights, initial_params=initial_params)
+        parameter_maps[:, batch_x, batch_y] = A, K, C
+
+        corrected_movie[batch_x, batch_y, :] = subtract_fitted_curves(curves, A, K, C)
+
+    return corrected_movie, tuple(parameter_maps)
+
+
+def subtract_fitted_curves(curves, A, K, C):
+    """
+    Bleach corrects each row of <curves> by subtracting A * exp(K * t) + C with the parameters of that row
+    :param numpy.ndarray curves: 2D, one curve per row
+    :param numpy.ndarray A: 1D, one value per curve, same for <K> and <C>
+    :return: corrected curves, same shape as <curves>
+    :rtype: numpy.ndarray
+    """
+
+    t = np.arange(curves.shape[1])
+    corrected_curves = np.array(curves, dtype=np.float64)
+
+    # sometimes A and/or K can be NAN, then don't bleach correct
+    # adding the mean of the fitted curve ensures the average intensity value of every pixel
+    # is not affected by the bleach correction applied
+    fitted = ~np.isnan(A) & ~np.isnan(K)
+    fitted_curves = A[fitted, np.newaxis] * np.exp(K[fitted, np.newaxis] * t) + C[fitted, np.newaxis]
+    corrected_curves[fitted] += fitted_curves.mean(axis=1, keepdims=True) - fitted_curves
+
+    return corrected_curves
+
+
+def correct_with_parameter_maps(movie: np.ndarray, parameter_maps, area, batch_size=16384):
+    """
+    Pixelwise bleach correction with already fitted parameters, without fitting
+    :param numpy.ndarray movie: 3D, format XYT
+    :param tuple parameter_maps: A, K and C, each a numpy.ndarray in format XY
+    :param numpy.ndarray area: 2D, format XY, only pixels where it is True are corrected
+    :param int batch_size: number of pixels corrected together
+    :return: corrected movie, same shape and format as <movie>, floating point
+    :rtype: numpy.ndarray
+    """
+
+    output_dtype = movie.dtype if np.issubdtype(movie.dtype, np.floating) else np.float64
+    corrected_movie = np.array(movie, dtype=output_dtype)
+
+    pixel_inds_x, pixel_inds_y = np.nonzero(area)
+    for batch_start in range(0, len(pixel_inds_x), batch_size):
+
+        batch_x = pixel_inds_x[batch_start: batch_start + batch_size]
+        batch_y = pixel_inds_y[batch_start: batch_start + batch_size]
+
+        A, K, C = (param_map[batch_x, batch_y] for param_map in parameter_maps)
+        corrected_movie[batch_x, batch_y, :] = subtract_fitted_curves(movie[batch_x, batch_y, :], A, K, C)
+
+    return corrected_movie
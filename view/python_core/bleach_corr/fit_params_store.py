@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import pathlib as pl
+import zipfile
+
+import numpy as np
+
+
+class BleachFitParamsStore(object):
+    """
+    Stores parameters fitted during bleach correction, as one .npz file per measurement in the folder
+    "bleach_fit_params/<animal>" in STG_ProcessedDataPath. Files are named after a key that changes when the data
+    to correct, the area or the bleach correction flags change (see <get_key>). Depending on the flag
+    "LE_BleachFitReuse", stored parameters are reused instead of fitting again, or used as initial guesses for fitting
+    """
+
+    # flags that influence bleach fitting have names starting with these prefixes
+    relevant_flag_prefixes = ("LE_Bleach", "LELog_")
+
+    # flags with names starting with <relevant_flag_prefixes> that do not influence bleach fitting
+    irrelevant_flags = ("LE_BleachParallelWorkers", "LE_BleachFitReuse")
+
+    def __init__(self, store_dir, mode, relevant_flags):
+        """
+        :param str|pathlib.Path store_dir: folder in which parameters are saved
+        :param str mode: "measurement" or "animal", see the flag "LE_BleachFitReuse"
+        :param list relevant_flags: (flag name, flag value) tuples of the flags that influence bleach fitting
+        """
+
+        super().__init__()
+        self.store_dir = pl.Path(store_dir)
+        self.mode = mode
+        self.relevant_flags = relevant_flags
+
+    @classmethod
+    def from_flags(cls, flags):
+        """
+        Create a store for the current animal, with the mode given by the flag "LE_BleachFitReuse"
+        :param FlagsManager flags:
+        :return: BleachFitParamsStore object, or None if parameters are not to be stored
+        """
+
+        mode = flags["LE_BleachFitReuse"]
+        if mode == "off":
+            return None
+
+        relevant_flags = sorted(
+            (flag_name, repr(flag_value)) for flag_name, flag_value in flags.items()
+            if flag_name.startswith(cls.relevant_flag_prefixes) and flag_name not in cls.irrelevant_flags)
+
+        return cls(store_dir=flags.get_processed_data_dir_path() / "bleach_fit_params" / flags["STG_ReportTag"],
+                   mode=mode, relevant_flags=relevant_flags)
+
+    def get_key(self, stack_xyt, area_mask, weights):
+        """
+        Calculate a key that changes when the data to correct, the area, the weights or the bleach correction flags
+        change. All pixels of the data are hashed, so that changes of raw data or of corrections applied before bleach
+        correction are detected even if they affect only a few pixels
+        :param numpy.ndarray stack_xyt: 3D, format XYT, data to correct
+        :param numpy.ndarray area_mask: 2D, format XY
+        :param numpy.ndarray weights: 1D, weights for fitting, one per frame
+        :rtype: str
+        """
+
+        sha1 = hashlib.sha1()
+        sha1.update(repr((self.relevant_flags, stack_xyt.shape, str(stack_xyt.dtype))).encode())
+        sha1.update(np.ascontiguousarray(stack_xyt).data)
+        sha1.update(np.ascontiguousarray(area_mask, dtype=bool).tobytes())
+        sha1.update(np.ascontiguousarray(weights, dtype=np.float64).tobytes())
+
+        return sha1.hexdigest()
+
+    def load(self, key):
+        """
+        Load parameters saved with key <key>
+        :param str key: see <get_key>
+        :return: numpy.ndarray if parameters were saved with key <key>, else None
+        """
+
+        try:
+            with np.load(self.store_dir / f"{key}.npz") as npz_file:
+                return npz_file["params"]
+        except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def load_latest(self, shape):
+        """
+        Load the parameters of this animal saved last, among those having the shape <shape>
+        :param tuple shape: shape of the parameters, e.g. (3,) for uniform and (3, X, Y) for pixelwise bleach correction
+        :return: numpy.ndarray, or None if there are none
+        """
+
+        if not self.store_dir.is_dir():
+            return None
+
+        files = sorted((x for x in self.store_dir.glob("*.npz") if not x.name.endswith(".tmp.npz")),
+                       key=lambda x: x.stat().st_mtime, reverse=True)
+        for file in files:
+            params = self.load(file.stem)
+            if params is not None and params.shape == tuple(shape):
+                return params
+
+        return None
+
+    def get_params_to_reuse(self, key, shape):
+        """
+        Parameters to use instead of fitting: those saved with key <key>, or in the mode "animal", those of this
+        animal saved last
+        :param str key: see <get_key>
+        :param tuple shape: shape of the parameters expected
+        :return: numpy.ndarray, or None if fitting is needed
+        """
+
+        params = self.load(key)
+        if params is not None and params.shape != tuple(shape):
+            params = None
+
+        if params is None and self.mode == "animal":
+            params = self.load_latest(shape)
+
+        return params
+
+    def save(self, key, params):
+        """
+        Save parameters with key <key>
+        :param str key: see <get_key>
+        :param numpy.ndarray params: fitted parameters
+        """
+
+        try:
+            self.store_dir.mkdir(parents=True, exist_ok=True)
+            # written to a temporary file first, so that partially written files are never loaded
+            temp_file = self.store_dir / f"{key}.{os.getpid()}.tmp.npz"
+            np.savez(temp_file, params=params)
+            os.replace(temp_file, self.store_dir / f"{key}.npz")
+        except OSError as e:
+            logging.getLogger("VIEW").warning(f"Could not save bleach fit parameters in {self.store_dir}: {e}")
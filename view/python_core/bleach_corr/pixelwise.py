@@ -1,102 +1,279 @@
 import numpy as np
 from view.idl_translation_core.bleach_correction import fitlogdecay, model_func
-from itertools import product
-import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+import contextlib
 import logging
-import platform
+import threading
+import weakref
 
 
-shared_arr_g = None
-patch_size_g = None
+class BleachCorrectionWorkerPool(object):
 
+    def __init__(self):
+        """
+        Pool of worker processes for parallel pixelwise bleach correction, which is created at the first use and
+        reused for all measurements of a session (e.g. a VIEW object) as long as the number of workers does not change,
+        so that worker processes are not started again for every measurement. Owners need to call <shutdown> at the
+        end of the session
+        """
 
-def _init(shared_arr_, patch_size_, weights_, fit_pars_dict_):
-    # The shared array pointer is a global variable so that it can be accessed by the
-    # child processes. It is a tuple (pointer, dtype, shape).
-    global shared_arr, patch_size, weights, fit_pars_dict
-    shared_arr = shared_arr_
-    patch_size = patch_size_
-    weights = weights_
-    fit_pars_dict = fit_pars_dict_
+        super().__init__()
 
+        # (number of workers, concurrent.futures.ProcessPoolExecutor)
+        self._worker_pool = None
 
-def shared_to_numpy(shared_array_pars, copy=False):
-    """Get a NumPy array from a shared memory buffer, with a given dtype and shape.
-    No copy is involved, the array reflects the underlying shared buffer."""
-    shared_arr, dtype, shape = shared_array_pars
-    wrapped_arr = np.frombuffer(shared_arr, dtype=dtype).reshape(shape)
-    if copy:
-        copy_arr = np.empty_like(wrapped_arr)
-        np.copyto(dst=copy_arr, src=wrapped_arr)
-        return copy_arr
-    else:
-        return wrapped_arr
+        # number of bleach corrections currently using each pool, see <using>
+        self._worker_pool_users = {}
+
+        # pools replaced by a pool with a different number of workers while still in use, shut down after their last
+        # use
+        self._retired_worker_pools = set()
+
+        # the two wavelengths of dual wavelength measurements are corrected in concurrent threads, which share the pool
+        self._lock = threading.RLock()
+
+    def _get(self, n_workers):
+
+        if self._worker_pool is None or self._worker_pool[0] != n_workers:
+            self._shutdown_current()
+            self._worker_pool = n_workers, ProcessPoolExecutor(max_workers=n_workers)
+
+        return self._worker_pool[1]
+
+    def _shutdown_current(self):
+
+        if self._worker_pool is not None:
+            worker_pool = self._worker_pool[1]
+            if self._worker_pool_users.get(worker_pool, 0) > 0:
+                self._retired_worker_pools.add(worker_pool)
+            else:
+                worker_pool.shutdown(wait=False)
+            self._worker_pool = None
+
+    @contextlib.contextmanager
+    def using(self, n_workers):
+        """
+        Context manager providing a pool of <n_workers> worker processes, which is not shut down while it is used, even
+        if another thread requests a pool with a different number of workers or shuts this pool down meanwhile
+        :param int n_workers: number of worker processes
+        :rtype: concurrent.futures.ProcessPoolExecutor
+        """
+
+        with self._lock:
+            worker_pool = self._get(n_workers)
+            self._worker_pool_users[worker_pool] = self._worker_pool_users.get(worker_pool, 0) + 1
+
+        try:
+            yield worker_pool
+        finally:
+            with self._lock:
+                self._worker_pool_users[worker_pool] -= 1
+                if self._worker_pool_users[worker_pool] == 0:
+                    del self._worker_pool_users[worker_pool]
+                    if worker_pool in self._retired_worker_pools:
+                        self._retired_worker_pools.remove(worker_pool)
+                        worker_pool.shutdown(wait=False)
+
+    def shutdown(self):
+        """
+        Stops the worker processes. A pool still used by a bleach correction (see <using>) is stopped only after that
+        has finished. The pool is started again if it is used afterwards
+        """
 
+        with self._lock:
+            self._shutdown_current()
 
-def numpy2raw_array(ndarray):
+
+def _release_shared_memory(shared_memory):
     """
-    Convert numpy array to raw array
+    Close and unlink <shared_memory>
+    :param multiprocessing.shared_memory.SharedMemory shared_memory:
     """
-    dtype = ndarray.dtype
-    shape = ndarray.shape
-    # Get a ctype type from the NumPy dtype.
-    cdtype = np.ctypeslib.as_ctypes_type(dtype)
-    # Create the RawArray instance.
-    shared_arr = mp.RawArray(cdtype, int(np.prod(shape)))
-    # Wrap shared_arr as an numpy array so we can easily manipulates its data (here only to copy data into it)
-    fake_numpy_arr = shared_to_numpy((shared_arr, dtype, shape))
 
-    np.copyto(dst=fake_numpy_arr, src=ndarray)
+    shared_memory.close()
+    shared_memory.unlink()
+
+
+class _SharedMemoryBlock(object):
+
+    def __init__(self, shape, dtype):
+        """
+        Owner of a shared memory block, exposed as a numpy array of shape <shape> and dtype <dtype> through the numpy
+        array interface. Arrays created from it (see <empty_shared_memory_array>) and their views keep it as their
+        base, so that the block is released when none of them is used any more
+        """
+
+        super().__init__()
+
+        dtype = np.dtype(dtype)
+        self.shared_memory = SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
 
-    return shared_arr, dtype, shape
+        # the address of the block is taken from a temporary array, as arrays keeping the buffer of the block would
+        # prevent it from being closed
+        address = np.frombuffer(self.shared_memory.buf, dtype=np.uint8).ctypes.data
+        self.__array_interface__ = {
+            "shape": tuple(shape), "typestr": dtype.str, "data": (address, False), "version": 3}
 
+        weakref.finalize(self, _release_shared_memory, self.shared_memory)
 
-def bleach_correct_pixelwise(movie: np.ndarray, weights, area, ncpu: int):
+
+def empty_shared_memory_array(shape, dtype):
+    """
+    Returns an uninitialized array in a new shared memory block, which worker processes can attach to without copying
+    (see <get_shared_memory_name>). The block is released when neither the array nor any view of it is used any more
+    :param tuple shape: shape of the array
+    :param dtype: numpy dtype of the array
+    :rtype: numpy.ndarray
+    """
+
+    return np.asarray(_SharedMemoryBlock(shape=shape, dtype=dtype))
+
+
+def get_shared_memory_name(array):
+    """
+    Returns the name of the shared memory block of <array> if it was created with <empty_shared_memory_array>, else
+    None. Views of such arrays are not considered, as workers attach to whole blocks
+    :param numpy.ndarray array:
+    :rtype: str
+    """
+
+    block = array.base
+    if isinstance(block, _SharedMemoryBlock) and array.__array_interface__ == np.asarray(block).__array_interface__:
+        return block.shared_memory.name
+
+    return None
+
+
+def bleach_correct_pixelwise(movie: np.ndarray, weights, area, ncpu: int, initial_parameter_maps=None,
+                             worker_pool=None):
+    """
+    Bleach correct the time trace of each pixel of <movie> within <area>. With more than one CPU, pixels are corrected
+    in worker processes, in place in the shared memory block of <movie> if it was created with
+    <empty_shared_memory_array>, else in a shared memory copy of it. With one CPU, a copy of <movie> is corrected
+    :param numpy.ndarray movie: 3D, format XYT
+    :param numpy.ndarray weights: weights for fitting, one per frame
+    :param numpy.ndarray area: 2D, format XY
+    :param int ncpu: number of CPUs (worker processes) to use
+    :param numpy.ndarray initial_parameter_maps: initial guesses for fitting, A, K and C maps stacked along the first
+    axis
+    :param BleachCorrectionWorkerPool worker_pool: pool of worker processes to use. If None, worker processes are
+    started for this correction only
+    :return: bleach corrected movie and a dict with pixel indices as keys and fitted parameters (A, K, C) as values
+    :rtype: tuple
+    """
 
     assert movie.shape[:2] == area.shape, f"Area file specified has dimensions {area.shape} that does not match with" \
                                           f"data dimensions {movie.shape}"
 
-    pixel_inds = [ind for ind, val in np.ndenumerate(area) if val]
+    if ncpu > 1 and worker_pool is None:
+        worker_pool = BleachCorrectionWorkerPool()
+        try:
+            return bleach_correct_pixelwise(
+                movie=movie, weights=weights, area=area, ncpu=ncpu, initial_parameter_maps=initial_parameter_maps,
+                worker_pool=worker_pool)
+        finally:
+            worker_pool.shutdown()
 
-    global shared_arr_g, weights_g
+    pixel_inds = [ind for ind, val in np.ndenumerate(area) if val]
 
-    # mmappickle could be used instead of shared memory. https://mmappickle.readthedocs.io/en/latest/
-    shared_arr_g = numpy2raw_array(movie)
-    weights_g = weights
+    # initial guesses for fitting, e.g. parameters fitted to an earlier measurement (warm start)
+    if initial_parameter_maps is None:
+        initial_params_list = [None] * len(pixel_inds)
+    else:
+        initial_params_list = [tuple(param_map[pixel_ind] for param_map in initial_parameter_maps)
+                               for pixel_ind in pixel_inds]
 
     if ncpu > 1:
 
-        assert platform.system() != "Windows", \
-            "Pixelwise bleach correction currently does not work on Windows due to parallization issues. Sorry!"
+        # worker processes correct the movie in place in its shared memory block
+        shared_memory_name = get_shared_memory_name(movie)
+        if shared_memory_name is None:
+            shared_movie = empty_shared_memory_array(shape=movie.shape, dtype=movie.dtype)
+            np.copyto(dst=shared_movie, src=movie)
+            movie = shared_movie
+            shared_memory_name = get_shared_memory_name(movie)
+
+        # apply bleach correction to chunks of pixels in parallel, about four chunks per worker, so that workers
+        # stay busy when some chunks take longer than others
+        chunk_size = max(1, int(np.ceil(len(pixel_inds) / (4 * ncpu))))
+        with worker_pool.using(ncpu) as executor:
+            futures = [
+                executor.submit(
+                    bleach_correct_pixelwise_shared_memory_worker, shared_memory_name, movie.shape, movie.dtype,
+                    pixel_inds[chunk_start: chunk_start + chunk_size], weights,
+                    initial_params_list[chunk_start: chunk_start + chunk_size])
+                for chunk_start in range(0, len(pixel_inds), chunk_size)]
+
+            op_params_list = []
+            try:
+                for future in futures:
+                    op_params_list += future.result()
+            finally:
+                # after an error, chunks that are already being corrected need to finish before the movie is used
+                for future in futures:
+                    future.cancel()
+                wait(futures)
+
+        array2return = movie
 
-        # apply bleach correction to each patch in parallel
-        with mp.Pool(processes=ncpu) as p:  # use all cores
-            op_params_list = p.map(bleach_correct_pixelwise_worker, pixel_inds, chunksize=100)
     elif ncpu == 1:
 
+        array2return = np.array(movie)
+
         # apply bleach correction to each patch without parallelization
         op_params_list = []
         for pixel_ind_nr, pixel_ind in enumerate(pixel_inds):
             logging.getLogger("VIEW").debug(f"Doing pixel {pixel_ind_nr + 1}/{len(pixel_inds)}")
-            op_params = bleach_correct_pixelwise_worker(pixel_ind)
+            op_params = bleach_correct_pixelwise_worker(
+                array2return, pixel_ind, weights, initial_params_list[pixel_ind_nr])
             op_params_list.append(op_params)
     else:
         raise ValueError(f"Paramater ncpu has to be 1 or more ({ncpu} specified)")
 
-    array2return = shared_to_numpy(shared_arr_g, copy=True)
-
     return array2return, {k: v for k, v in zip(pixel_inds, op_params_list)}
 
 
-def bleach_correct_pixelwise_worker(pixel_index: tuple):
+def bleach_correct_pixelwise_shared_memory_worker(
+        shared_memory_name, shape, dtype, pixel_indices, weights, initial_params_list):
+    """
+    Runs in worker processes. Applies <bleach_correct_pixelwise_worker> to the pixels <pixel_indices> of the movie
+    in the shared memory block named <shared_memory_name>
+    :return: list of fitted parameters (A, K, C), one per pixel
+    """
 
-    movie = shared_to_numpy(shared_arr_g)
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        movie = np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)
+        op_params_list = [
+            bleach_correct_pixelwise_worker(movie, pixel_index, weights, initial_params)
+            for pixel_index, initial_params in zip(pixel_indices, initial_params_list)]
+        del movie
+    finally:
+        try:
+            shared_memory.close()
+        except BufferError:  # movie still referenced by the traceback of an exception, released with it
+            pass
+
+    return op_params_list
+
+
+def bleach_correct_pixelwise_worker(movie: np.ndarray, pixel_index: tuple, weights, initial_params=None):
+    """
+    Bleach correct the time trace of the pixel <pixel_index> of <movie> in place
+    :param numpy.ndarray movie: 3D, format XYT
+    :param tuple pixel_index: X and Y index of a pixel
+    :param numpy.ndarray weights: weights for fitting, one per frame
+    :param tuple initial_params: initial guess of A, K and C for fitting, see fitlogdecay
+    :return: fitted parameters A, K and C
+    """
 
     # reduce patch to curve
     curve = movie[pixel_index[0], pixel_index[1], :]
 
     # apply bleach correction to curve and return the parameters A, K and C
-    fitted_curve, (A, K, C) = fitlogdecay(lineIn=curve, weights=weights_g, showresults=False)
+    fitted_curve, (A, K, C) = fitlogdecay(
+        lineIn=curve, weights=weights, showresults=False, initial_params=initial_params)
 
     # sometimes A and/or K can be NAN, then don't bleach correct
     # adding the mean of the fitted curve ensures the average intensity value of every pixel
@@ -2,13 +2,14 @@ import numpy as np
 from ..idl_translation_core.ViewCalcData import calc_deltaF
 
 
-def calc_method_0(raw_data: list, background_frames: list, area_mask: np.ndarray):
+def calc_method_0(raw_data: list, background_frames: list, area_mask: np.ndarray, dtype=np.float64):
     """
     Calculate signal from raw data as: sig1 = raw1 / 1000
     :param list raw_data: list of numpy.ndarrays, raw data in format XYT
     :param list background_frames: list of two integers indicating the start and end frames of background
     :param numpy.ndarray area_mask: boolean numpy ndarray in format XY, with 0 indicating pixels
     outside the tissue of interest
+    :param dtype: numpy floating point data type of the returned signal
     :return: numpy.ndarray in format XYT, the same size as any member of <raw_data>
     :rtype: numpy.ndarray
     """
@@ -17,16 +18,17 @@ def calc_method_0(raw_data: list, background_frames: list, area_mask: np.ndarray
     assert isinstance(raw_data, list) and len(raw_data) >= 1, error
     assert isinstance(raw_data[0], np.ndarray), error
 
-    return raw_data[0].astype(float) / 1000
+    return raw_data[0].astype(dtype) / 1000
 
 
-def calc_method_1(raw_data: list, background_frames: list, area_mask: np.ndarray):
+def calc_method_1(raw_data: list, background_frames: list, area_mask: np.ndarray, dtype=np.float64):
     """
     Calculate signal from raw data as: sig1 = raw2 / 1000
     :param list raw_data: list of numpy.ndarrays, raw data in format XYT
     :param list background_frames: list of two integers indicating the start and end frames of background
     :param numpy.ndarray area_mask: boolean numpy ndarray in format XY, with 0 indicating pixels
     outside the tissue of interest
+    :param dtype: numpy floating point data type of the returned signal
     :return: numpy.ndarray in format XYT, the same size as any member of <raw_data>
     :rtype: numpy.ndarray
     """
@@ -35,16 +37,17 @@ def calc_method_1(raw_data: list, background_frames: list, area_mask: np.ndarray
     assert isinstance(raw_data, list) and len(raw_data) >= 1, error
     assert isinstance(raw_data[0], np.ndarray), error
 
-    return raw_data[1].astype(float) / 1000
+    return raw_data[1].astype(dtype) / 1000
 
 
-def calc_method_3(raw_data: list, background_frames: list, area_mask: np.ndarray):
+def calc_method_3(raw_data: list, background_frames: list, area_mask: np.ndarray, dtype=np.float64):
     """
     Calculate signal from raw data as: sig1 = deltaF/F0; F0=average intensity during <background_frames>
     :param list raw_data: list of numpy.ndarrays, raw data in format XYT
     :param list background_frames: list of two integers indicating the start and end frames of background
     :param numpy.ndarray area_mask: boolean numpy ndarray in format XY, with 0 indicating pixels
     outside the tissue of interest
+    :param dtype: numpy floating point data type of the returned signal
     :return: numpy.ndarray in format XYT, the same size as any member of <raw_data>
     :rtype: numpy.ndarray
     """
@@ -54,16 +57,36 @@ def calc_method_3(raw_data: list, background_frames: list, area_mask: np.ndarray
     assert isinstance(raw_data, list) and len(raw_data) >= 1, error
     assert isinstance(raw_data[0], np.ndarray), error
 
-    return calc_deltaF(raw_data[0], background_frames)
+    return calc_deltaF(raw_data[0], background_frames, dtype=dtype)
 
 
-def calc_method_4(raw_data: list, background_frames: list, area_mask: np.ndarray):
+def get_background_averages(raw_data: list, background_frames: list, area_mask: np.ndarray):
+    """
+    Average pixel intensity during <background_frames> within <area_mask>, for each of the first two members of
+    <raw_data>
+    :param list raw_data: list of numpy.ndarrays, raw data in format XYT
+    :param list background_frames: list of two integers indicating the start and end frames of background
+    :param numpy.ndarray area_mask: boolean numpy ndarray in format XY, with 0 indicating pixels
+    outside the tissue of interest
+    :return: tuple of two floats
+    """
+
+    bg_start, bg_end = background_frames
+
+    return tuple(raw[area_mask, bg_start: bg_end + 1].mean(dtype=np.float64) for raw in raw_data[:2])
+
+
+def calc_method_4(raw_data: list, background_frames: list, area_mask: np.ndarray, dtype=np.float64,
+                  background_averages=None):
     """
     Calculate signal from raw data as: sig1 = raw1/raw2 - (raw1/raw2 averaged over <background_frames>)
     :param list raw_data: list of numpy.ndarrays, raw data in format XYT
     :param list background_frames: list of two integers indicating the start and end frames of background
     :param numpy.ndarray area_mask: boolean numpy ndarray in format XY, with 0 indicating pixels
     outside the tissue of interest
+    :param dtype: numpy floating point data type of the returned signal
+    :param tuple background_averages: if specified, used instead of the output of <get_background_averages>.
+    Useful when <raw_data> is a part of a larger frame
     :return: numpy.ndarray in format XYT, the same size as any member of <raw_data>
     :rtype: numpy.ndarray
     """
@@ -79,11 +102,12 @@ def calc_method_4(raw_data: list, background_frames: list, area_mask: np.ndarray
 
     # normalizing by average background pixel intensity to nullify the effects of exposure time differences
     # on ratio calculation
-    raw1_background_average = raw1[area_mask, bg_start: bg_end + 1].mean()
-    raw2_background_average = raw2[area_mask, bg_start: bg_end + 1].mean()
+    if background_averages is None:
+        background_averages = get_background_averages(raw_data, background_frames, area_mask)
+    raw1_background_average, raw2_background_average = background_averages
 
-    normalized_raw1 = raw1 / raw1_background_average
-    normalized_raw2 = raw2 / raw2_background_average
+    normalized_raw1 = np.divide(raw1, raw1_background_average, dtype=dtype)
+    normalized_raw2 = np.divide(raw2, raw2_background_average, dtype=dtype)
 
     ratio = normalized_raw1 / normalized_raw2
 
@@ -116,3 +140,41 @@ def get_calc_method(flags):
         raise NotImplementedError
 
 
+def calc_signals_tiled(calc_method, raw_data: list, background_frames: list, area_mask: np.ndarray,
+                       dtype=np.float64, tile_size=256, out=None):
+    """
+    Calculate signals using <calc_method> separately for square spatial tiles of size <tile_size> (all frames of a
+    tile together), writing into <out>. Except for <out>, only arrays of the size of one tile are allocated, so that
+    movies larger than the memory available can be processed when <raw_data> and <out> are memory mapped.
+    :param Callable calc_method: one of the functions returned by <get_calc_method>
+    :param list raw_data: list of numpy.ndarrays, raw data in format XYT
+    :param list background_frames: list of two integers indicating the start and end frames of background
+    :param numpy.ndarray area_mask: boolean numpy ndarray in format XY, with 0 indicating pixels
+    outside the tissue of interest
+    :param dtype: numpy floating point data type of the returned signal
+    :param int tile_size: size of tiles along X and Y, in pixels
+    :param numpy.ndarray out: array in format XYT, the same size as any member of <raw_data> into which signals are
+    written, e.g. a numpy.memmap. If None, a new array is allocated
+    :return: numpy.ndarray in format XYT, the same size as any member of <raw_data>
+    :rtype: numpy.ndarray
+    """
+
+    if out is None:
+        out = np.empty(raw_data[0].shape, dtype=dtype)
+
+    kwargs = {}
+    if calc_method is calc_method_4:
+        # normalization uses averages over the whole area, which are therefore calculated once for all tiles
+        kwargs["background_averages"] = get_background_averages(raw_data, background_frames, area_mask)
+
+    size_x, size_y = raw_data[0].shape[:2]
+    for x_start in range(0, size_x, tile_size):
+        for y_start in range(0, size_y, tile_size):
+
+            tile = (slice(x_start, x_start + tile_size), slice(y_start, y_start + tile_size))
+
+            out[tile] = calc_method(
+                raw_data=[np.asarray(raw[tile]) for raw in raw_data], background_frames=background_frames,
+                area_mask=area_mask[tile], dtype=dtype, **kwargs)
+
+    return out
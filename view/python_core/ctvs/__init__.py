@@ -4,7 +4,8 @@ from typing import Callable
 
 import numpy as np
 
-from view.python_core.ctvs.chunk_ctv_funcs_from_fidor import ctv_for_FIDOR_chunks_with_minmax_indices
+from view.python_core.ctvs.chunk_ctv_funcs_from_fidor import ctv_for_FIDOR_chunks_with_minmax_indices, \
+    ctv_for_FIDOR_chunks_with_minmax_indices_array
 
 
 def ctv_dummy(
@@ -437,6 +438,347 @@ def ctv_chunk_magnitude_basic(
     return ctv_for_FIDOR_chunks_with_minmax_indices(time_trace)
 
 
+def array_ctv_0(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_0>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_0>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return array_ctv_303(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1
+    )
+
+
+def array_ctv_22(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_22>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_22>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    first_frame_index = first_frame
+    last_frame_index = last_frame
+    n_frames = time_traces.shape[1]
+
+    assert 1 <= last_frame_index <= n_frames - 2, f"Error calculating CTV 22: lastframe={last_frame} " \
+                                                  f"is invalid for data with {n_frames} frames. " \
+                                                  f"Need three frames around lastframe."
+    assert 1 <= first_frame_index <= n_frames - 2, f"Error calculating CTV 22: firstframe={first_frame} " \
+                                                   f"is invalid for data with {n_frames} frames. " \
+                                                   f"Need three frames around firstframe."
+    ctv_values = np.mean(time_traces[:, last_frame_index - 1: last_frame_index + 2], axis=1) \
+        - np.mean(time_traces[:, first_frame_index - 1: first_frame_index + 2], axis=1)
+
+    return ctv_values[np.newaxis, :]
+
+
+def array_ctv_222(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_222>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_222>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    first_frame_index = first_frame
+    last_frame_index = last_frame
+    n_frames = time_traces.shape[1]
+
+    assert 0 <= last_frame_index <= n_frames - 4, f"Error calculating CTV 222: lastframe={last_frame} " \
+                                                  f"is invalid for data with {n_frames} frames. " \
+                                                  f"Need three frames around lastframe."
+    assert 0 <= first_frame_index <= n_frames - 4, f"Error calculating CTV 22: firstframe={first_frame} " \
+                                                   f"is invalid for data with {n_frames} frames. " \
+                                                   f"Need three frames around firstframe."
+    ctv_values = np.mean(time_traces[:, last_frame_index: last_frame_index + 4], axis=1) \
+        - np.mean(time_traces[:, first_frame_index: first_frame_index + 4], axis=1)
+
+    return ctv_values[np.newaxis, :]
+
+
+def array_ctv_35(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_35>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_35>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    n_frames = time_traces.shape[1]
+
+    stim_on_frame_ind = int(stim_on_times[stimulus_number] / sampling_period) + 1
+    frame_ind_after_3s_stim_onset = int((stim_on_times[stimulus_number] + 3000) / sampling_period) + 1
+
+    # reset to end of trace if stimulus onset is less than 3 seconds before the end of trace
+    frame_ind_after_3s_stim_onset = min(frame_ind_after_3s_stim_onset, n_frames - 1)
+
+    argmax_in_3s_after_stim_onset \
+        = np.argmax(time_traces[:, stim_on_frame_ind: frame_ind_after_3s_stim_onset + 1], axis=1) + stim_on_frame_ind
+
+    # make sure there are three frames around <argmax_in_3s_after_stim_onset>
+    argmax_in_3s_after_stim_onset = np.clip(argmax_in_3s_after_stim_onset, 1, n_frames - 2)
+
+    three_frames_around_argmax = argmax_in_3s_after_stim_onset[:, np.newaxis] + np.array([[-1, 0, 1]])
+    A = np.take_along_axis(time_traces, three_frames_around_argmax, axis=1).mean(axis=1)
+
+    # make sure there are three frames around <stim_on_frame_ind2use>
+    stim_on_frame_ind2use = \
+        min(max(1, stim_on_frame_ind - flags["LE_PrestimEndBackground"]), n_frames - 2)
+
+    B = np.mean(time_traces[:, stim_on_frame_ind2use - 1: stim_on_frame_ind2use + 2], axis=1)
+
+    return (A - B)[np.newaxis, :]
+
+
+def array_ctv_22and35(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_22and35>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_22and35>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return np.concatenate([
+        array_ctv_22(
+            time_traces, sampling_period,
+            first_frame, last_frame,
+            stimulus_number, stim_on_times, stim_off_times,
+            flags, p1),
+        array_ctv_35(
+            time_traces, sampling_period,
+            first_frame, last_frame,
+            stimulus_number, stim_on_times, stim_off_times,
+            flags, p1)
+        ])
+
+
+def array_ctv_300(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_300>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_300>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return np.nanmean(time_traces, axis=1)[np.newaxis, :]
+
+
+def array_ctv_301(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_301>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_301>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return np.nanmean(time_traces[:, 4: 10], axis=1)[np.newaxis, :]
+
+
+def array_ctv_302(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_302>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_302>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    first_frame_index = first_frame
+    last_frame_index = last_frame + 1
+    n_frames = time_traces.shape[1]
+
+    assert 0 <= last_frame_index <= n_frames - 1, f"Error calculating CTV 302: lastframe={last_frame} " \
+                                                  f"is invalid for data with {n_frames} frames. "
+
+    assert 0 <= first_frame_index <= n_frames - 1, f"Error calculating CTV 302: firstframe={first_frame} " \
+                                                   f"is invalid for data with {n_frames} frames. "
+
+    return np.nanmean(time_traces[:, first_frame_index: last_frame_index + 1], axis=1)[np.newaxis, :]
+
+
+def array_ctv_303(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_303>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_303>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    bg_start, bg_end = p1.metadata.background_frames
+    return np.nanmean(time_traces[:, bg_start: bg_end + 1], axis=1)[np.newaxis, :]
+
+
+def array_ctv_330(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_330>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_330>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return np.nanmedian(time_traces, axis=1)[np.newaxis, :]
+
+
+def array_ctv_331(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_331>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_331>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return np.nanmedian(time_traces[:, 4: 10], axis=1)[np.newaxis, :]
+
+
+def array_ctv_332(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_332>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_332>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    first_frame_index = first_frame
+    last_frame_index = last_frame + 1
+    n_frames = time_traces.shape[1]
+
+    assert 0 <= last_frame_index <= n_frames - 1, f"Error calculating CTV 302: lastframe={last_frame} " \
+                                                  f"is invalid for data with {n_frames} frames. "
+
+    assert 0 <= first_frame_index <= n_frames - 1, f"Error calculating CTV 302: firstframe={first_frame} " \
+                                                   f"is invalid for data with {n_frames} frames. "
+
+    return np.nanmedian(time_traces[:, first_frame_index: last_frame_index + 1], axis=1)[np.newaxis, :]
+
+
+def array_ctv_333(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_333>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_333>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    bg_start, bg_end = p1.metadata.background_frames
+    return np.nanmedian(time_traces[:, bg_start: bg_end + 1], axis=1)[np.newaxis, :]
+
+
+def array_ctv_chunk_magnitude_basic(
+        time_traces, sampling_period,
+        first_frame, last_frame,
+        stimulus_number, stim_on_times, stim_off_times,
+        flags, p1):
+    """
+    Array mode of <ctv_chunk_magnitude_basic>, i.e., applied to many time traces at once
+    :param time_traces: 2D numpy.ndarray, one time trace per row
+    other parameters: see <ctv_chunk_magnitude_basic>
+    :rtype: numpy.ndarray
+    :return: 2D, one row per feature and one column per time trace
+    """
+
+    return np.stack(ctv_for_FIDOR_chunks_with_minmax_indices_array(time_traces))
+
+
+# CTVs with array mode versions, which are used instead of applying the CTV to one time trace after another
+array_mode_ctvs = {
+    ctv_0: array_ctv_0,
+    ctv_22: array_ctv_22,
+    ctv_222: array_ctv_222,
+    ctv_35: array_ctv_35,
+    ctv_22and35: array_ctv_22and35,
+    ctv_300: array_ctv_300,
+    ctv_301: array_ctv_301,
+    ctv_302: array_ctv_302,
+    ctv_303: array_ctv_303,
+    ctv_330: array_ctv_330,
+    ctv_331: array_ctv_331,
+    ctv_332: array_ctv_332,
+    ctv_333: array_ctv_333,
+    ctv_chunk_magnitude_basic: array_ctv_chunk_magnitude_basic
+}
+
+
+def get_array_mode_ctv_function(ctv_function):
+    """
+    Returns the array mode version of the CTV function <ctv_function> (see for example <array_ctv_22>), or None if it
+    has none, as is the case for custom CTVs
+    :param Callable ctv_function: as returned by <get_ctv_function>
+    :rtype: Callable
+    """
+
+    return array_mode_ctvs.get(ctv_function)
+
+
 def get_custom_ctv_method(file, function_name):
     
     with open(file, 'r') as fh:
@@ -56,4 +56,42 @@ def ctv_for_FIDOR_chunks_frames(curve):
         base_ind = leftminpos + argmaxval
         peak_ind = leftminpos + argminval
 
-    return base_ind, peak_ind
\ No newline at end of file
+    return base_ind, peak_ind
+
+
+def ctv_for_FIDOR_chunks_with_minmax_indices_array(curves):
+    """
+    Same as ctv_for_FIDOR_chunks_with_minmax_indices, but for many time traces at once
+    input: 2D array, one time trace (curve) per row
+    output: ctv, ind1, ind2
+    ctv, ind1 and ind2: 1D arrays, one value per time trace, with CTV = curve[ind2] - curve[ind1]
+    """
+    base_ind, peak_ind = ctv_for_FIDOR_chunks_frames_array(curves)
+    output = np.take_along_axis(curves, peak_ind[:, None], axis=1)[:, 0] \
+        - np.take_along_axis(curves, base_ind[:, None], axis=1)[:, 0]
+    return output, base_ind, peak_ind
+
+
+def ctv_for_FIDOR_chunks_frames_array(curves):
+    """
+    Same as ctv_for_FIDOR_chunks_frames, but for many time traces at once
+    input: 2D array, one time trace (curve) per row
+    output: two 1D arrays of indices ind1 and ind2, so that CTV = curve[ind2] - curve[ind1] for each curve
+    """
+    middle = curves.shape[1] // 2
+    leftminpos = np.argmin(curves[:, :middle], axis=1)
+    leftmaxpos = np.argmax(curves[:, :middle], axis=1)
+
+    # equivalent of curve[leftminpos:] for each curve, values before leftminpos can never be selected
+    after_leftminpos = np.arange(curves.shape[1])[None, :] >= leftminpos[:, None]
+    argminval = np.argmin(np.where(after_leftminpos, curves, np.inf), axis=1) - leftminpos
+    argmaxval = np.argmax(np.where(after_leftminpos, curves, -np.inf), axis=1) - leftminpos
+
+    # see ctv_for_FIDOR_chunks_frames for the cases distinguished here
+    early_pos_resp = (argminval != 0) & (argmaxval == 0)
+    neg_resp = (argminval != 0) & (argmaxval != 0) & (argminval < argmaxval)
+
+    base_ind = leftminpos + np.where(neg_resp, argmaxval, argminval)
+    peak_ind = np.where(early_pos_resp, leftmaxpos, leftminpos + np.where(neg_resp, argminval, argmaxval))
+
+    return base_ind, peak_ind
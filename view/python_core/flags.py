@@ -39,6 +39,7 @@ flags_series = flags.to_series()
 
 import pkg_resources
 import pandas as pd
+import numpy as np
 import yaml
 import pathlib as pl
 from ast import literal_eval
@@ -674,6 +675,14 @@ class FlagsManager(object):
         raise ValueError(
             f"Could not interpret value set for flag `LE_BleachPatchSize`. Expected int or tuple, got {flag_value}")
 
+    def get_float_dtype(self):
+        """
+        Interprets value of flag "LE_FloatPrecision".
+        :returns: numpy floating point data type to use when converting data to floating point numbers
+        """
+
+        return np.dtype(self["LE_FloatPrecision"])
+
     def reset_all_flags_in_subgroup_to_default(self, subgroup):
 
         def_df = self.get_subgroup_definition(subgroup).set_index("Flag Name")
@@ -6,9 +6,13 @@ import pathlib as pl
 import datetime as dt
 import xml.etree.ElementTree as ET
 import logging
+import mmap
 import os
 import datetime
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from readlif.reader import LifFile
 
 
@@ -17,21 +21,54 @@ class LIFReaderGio(LifFile):
     def __init__(self, lif_file: str):
 
         super().__init__(lif_file)
+        # filled on first use by self.load_all_metadata
+        self._all_metadata_df = None
+
+    def get_time_stamps(self):
+        """
+        Parse the time stamps of the first frames of all measurements from the XML header
+        :return: list of datetime.datetime objects, in the order in which they appear in the XML header
+        """
+
+        root = ET.fromstring(self.xml_header)  # this is the full metadata as XML
+
+        # windows uses 1. Januar<y 1601 as reference
+        # https://gist.github.com/Mostafa-Hamdy-Elgiar/9714475f1b3bc224ea063af81566d873
+        EPOCH_AS_FILETIME = 116444736000000000  # January 1, 1970 as MS file time
+        HUNDREDS_OF_NANOSECONDS = 10000000
+
+        time_stamps = []
+        for time_stamp_list in root.findall(".//TimeStampList"):
+            timeStamp = int(time_stamp_list.text[:15], 16)
+            time_stamps.append(
+                datetime.datetime.utcfromtimestamp((timeStamp - EPOCH_AS_FILETIME) / HUNDREDS_OF_NANOSECONDS))
+
+        return time_stamps
 
     def load_all_metadata(self):
         """
         Load all metadata in the initialized LIF file
         only including sets with more than one frame (i.e. exclude snapshots)
+        The XML header is parsed only once per LIFReaderGio object, subsequent calls return a copy of the first result
         :return: pd.DataFrame with each row containing metadata of one measurement
         """
 
-        root = ET.fromstring(self.xml_header)  # this is the full metadata as XML
-        all_metadata_df = pd.DataFrame()
+        if self._all_metadata_df is not None:
+            return self._all_metadata_df.copy()
+
+        # extract measurement time - which is only in the XML of the full LIF file, and not in this_measurement
+        # see /pyview/view/python_core/measurement_list/importers.py
+        # i.e. if changes are necessary here, do them also there
+        #  time stamps are not correct - I do not know why yet (15.6.2022)
+        # that is: there are less time stamps in the XML file than measurements in the .lif file
+        # therefore, I cannot attribute the right time to each measurements
+        time_stamps = self.get_time_stamps()
+
+        all_metadata = []
 
         # iterate all measurements
-        for fle_ind, measurement in enumerate(self.get_iter_image()):
-            this_measurement = self.get_image(fle_ind)
-            lif_metadata = pd.Series()
+        for fle_ind, this_measurement in enumerate(self.get_iter_image()):
+            lif_metadata = pd.Series(dtype=object)
             lif_metadata["Label"] = this_measurement.name
 #            lif_metadata["Measu"] = fle_ind
             if this_measurement.dims.t > 1:
@@ -54,52 +91,125 @@ class LIFReaderGio(LifFile):
             lif_metadata['NumFrames'] = this_measurement.dims.t  # pixel number in t
             lif_metadata['Comment'] = "Leica .lif file"
 
-            # extract measurement time - which is only in the XML of the full LIF file, and not in this_measurement
-            # see /pyview/view/python_core/measurement_list/importers.py
-            # i.e. if changes are necessary here, do them also there
-            #  time stamps are not correct - I do not know why yet (15.6.2022)
-            # that is: there are less time stamps in the XML file than measurements in the .lif file
-            # therefore, I cannot attribute the right time to each measurements
-            print('Now using UTC from first frame in measu: ', fle_ind)
             # timestamp of first frame in measurement measu!
-            time = root.findall(".//TimeStampList")[fle_ind].text[:15]
-            timeStamp = int(time, 16)
-            # windows uses 1. Januar<y 1601 as reference
-            # https://gist.github.com/Mostafa-Hamdy-Elgiar/9714475f1b3bc224ea063af81566d873
-            EPOCH_AS_FILETIME = 116444736000000000  # January 1, 1970 as MS file time
-            HUNDREDS_OF_NANOSECONDS = 10000000
-            measurementtime = datetime.datetime.utcfromtimestamp((timeStamp - EPOCH_AS_FILETIME) / HUNDREDS_OF_NANOSECONDS)
-            print('Lif-File time in importers.py: ', measurementtime)  # for debugging
+            measurementtime = time_stamps[fle_ind]
             # UTC, e.g. 1623229504.482
             UTC = measurementtime.timestamp()
-            # meta_info.update({'UTCTime':UTC})
             lif_metadata['UTC'] = UTC
             # MTime is the time passed with respect to the very first measurement in this animal
-            time = root.findall(".//TimeStampList")[0].text[:15]
-            timeStamp = int(time, 16)
-            measurementtime_first = datetime.datetime.utcfromtimestamp(
-                (timeStamp - EPOCH_AS_FILETIME) / HUNDREDS_OF_NANOSECONDS)
-            MTime = measurementtime - measurementtime_first
+            MTime = measurementtime - time_stamps[0]
             # format this timedelta
             minutes, seconds = divmod(MTime.seconds + MTime.days * 86400, 60)
             hours, minutes = divmod(minutes, 60)
             lif_metadata['MTime'] = '{:02d}:{:02d}:{:02d}'.format(hours, minutes, seconds)
 
-            all_metadata_df = all_metadata_df.append(pd.DataFrame(lif_metadata).T, ignore_index=True)
-        return all_metadata_df
+            all_metadata.append(lif_metadata)
+
+        self._all_metadata_df = pd.DataFrame(all_metadata).reset_index(drop=True)
+        return self._all_metadata_df.copy()
+
+    def get_measurement_metadata(self, measu):
+        """
+        Metadata of the measurement with index <measu>
+        :param int measu: index of the measurement in the lif file
+        :rtype: pandas.Series
+        """
+
+        if self._all_metadata_df is None:
+            self.load_all_metadata()
 
-    def load_data(self, measu):
+        return self._all_metadata_df.iloc[measu].copy()
+
+    def load_data(self, measu, as_float=False):
+        """
+        Load the frames of channel 0, z-position 0 of measurement <measu>
+        :param int measu: index of the measurement in the lif file
+        :param bool as_float: if True, data is returned as float64, else in its native data type (uint8 or uint16)
+        :return: numpy.ndarray, frames are in the same orientation as numpy.asarray(<PIL image of frame>)
+        """
 
         this_measurement = self.get_image(measu)
+
+        if this_measurement.display_dims != (1, 2):  # atypical experiment, let readlif handle it frame by frame
+            img_data = self.load_data_framewise(this_measurement)
+        else:
+            img_data = self.load_data_from_memory_block(this_measurement)
+
+        if as_float:
+            img_data = img_data.astype(np.float64)
+
+        return img_data
+
+    def get_memory_block_range(self, measu):
+        """
+        Position of the memory block of measurement <measu> in the lif file, which contains all its frames
+        :param int measu: index of the measurement in the lif file
+        :return: offset and length of the memory block, in bytes
+        :rtype: tuple
+        """
+
+        return tuple(self.get_image(measu).offsets)
+
+    @staticmethod
+    def load_data_framewise(this_measurement):
+        """
+        Read frames one by one as PIL images using readlif
+        :param readlif.reader.LifImage this_measurement: measurement
+        :rtype: numpy.ndarray
+        """
+
         dims = this_measurement.dims
-        # dimensions are x, y, z, t, m. We are interested in x, y, t
-        img_data = np.zeros((dims.x, dims.y, dims.t), dtype=np.float)
+        # dimensions are x, y, z, t, m. We are interested in x, y, t.
+        # numpy.asarray(<PIL image of frame>) has the shape (dims.y, dims.x)
+        img_data = np.zeros((dims.y, dims.x, dims.t), dtype=np.float64)
 
-        frame_list = [i for i in this_measurement.get_iter_t(c=0, z=0)]
-        for count, frame in enumerate(frame_list):
+        for count, frame in enumerate(this_measurement.get_iter_t(c=0, z=0)):
             img_data[:, :, count] = np.asarray(frame)
 
         return img_data
+
+    def load_data_from_memory_block(self, this_measurement):
+        """
+        Read frames of channel 0, z-position 0 directly from the memory block of <this_measurement> into a
+        preallocated array of its native data type, using the offsets parsed from the header. Equivalent to
+        <load_data_framewise>, without the conversion of each frame into a PIL image and back.
+        :param readlif.reader.LifImage this_measurement: measurement
+        :rtype: numpy.ndarray
+        """
+
+        dims = this_measurement.dims
+        if this_measurement.bit_depth[0] == 8:
+            dtype = np.dtype(np.uint8)
+        elif this_measurement.bit_depth[0] <= 16:
+            dtype = np.dtype("<u2")  # same as "I;16" of PIL
+        else:
+            raise ValueError(f"Unknown bit-depth ({this_measurement.bit_depth[0]}) in measurement {this_measurement.name}")
+
+        # frames in the memory block are ordered as (mosaic, t, z, channel), unless channel is the second dimension
+        n_items = this_measurement.channels * this_measurement._get_len_nondisplay_dims()
+        block_offset, block_length = this_measurement.offsets
+        # one frame contains dims.y rows of dims.x pixels
+        frames_tyx = np.zeros((dims.t, dims.y, dims.x), dtype=dtype)
+
+        if block_length == 0:  # blank (truncated) image
+            return frames_tyx.transpose(1, 2, 0)
+
+        item_length = block_length // n_items
+        item_stride = this_measurement.channels * this_measurement.nz  # items between consecutive time points
+        frame_length = frames_tyx[0].nbytes
+
+        with open(self.filename, "rb") as fh:
+
+            if item_stride == 1 and item_length == frame_length:  # time points are contiguous
+                fh.seek(block_offset)
+                fh.readinto(memoryview(frames_tyx).cast("B"))
+            else:
+                for t in range(dims.t):
+                    fh.seek(block_offset + item_length * item_stride * t)
+                    fh.readinto(memoryview(frames_tyx[t]).cast("B"))
+
+        # same orientation as numpy.asarray(<PIL image of frame>) used in <load_data_framewise>
+        return frames_tyx.transpose(1, 2, 0)
 # end LIFReaderGio
 
 class MultiTiffReaderInga():
@@ -155,27 +265,52 @@ class MultiTiffReaderInga():
         self.data_txt = txt_file
         self.measu = measu
         self.all_meta_data = pd.DataFrame()
+        # sorted list of all .tif files in self.data_path, filled on first use by self.get_tif_files
+        self.tif_files = None
 
+    def get_tif_files(self):
+        """
+        Sorted list of all .tif files in the data directory. The directory is listed only once per reader.
+        :rtype: list of pathlib.Path
+        """
+
+        if self.tif_files is None:
+            self.tif_files = sorted(self.data_path.glob('*.tif*'))
+
+        return self.tif_files
+
+    def get_measurement_tif_files(self, measu):
+        """
+        Paths of the .tif files containing the frames of measurement <measu>, in the order of frames
+        :param int measu: index of the measurement, see <load_all_metadata>
+        :rtype: list of pathlib.Path
+        """
+
+        metadata = self.load_all_metadata()  # getting info from Inga .txt file
+        return [self.data_path / fln for fln in metadata.loc[measu]["dbb2"]]
 
 
     def load_all_metadata(self):
         """
-        Load all metadata coded in the indicated .txt file
+        Load all metadata coded in the indicated .txt file. Metadata is parsed only once per reader,
+        subsequent calls return the result of the first call.
         :return: pd.DataFrame with each row containing metadata of one measurement
         """
+        if not self.all_meta_data.empty:
+            return self.all_meta_data.copy()
+
         # prepare the information: which measurements do I have?
         measurements = self.meta_dict['Stimuli']
         measurements_list = [t.strip() for t in measurements.split(',')] # now contains list of stimuli
         measu_num = len(measurements_list)
         # list all the .tif files in the directory
-        tif_files = list(self.data_path.glob('*.tif*'))
-        tif_files.sort() # 
+        tif_files = self.get_tif_files()
         tif_num = len(tif_files)
         # check the numbers. There mus be
         assert (measu_num * int(self.meta_dict['Duration']) == tif_num), ("io.py: Number of .tif file does not match info in .txt file")
         
         #now create the table with info about each measurement
-        all_metadata_df = pd.DataFrame()
+        all_metadata = []
         measurementtime_first = None
 
         # iterate all measurements
@@ -244,32 +379,75 @@ class MultiTiffReaderInga():
             
             # done this measurement, add it as a line
 
-            all_metadata_df = all_metadata_df.append(pd.DataFrame(single_metadata).T, ignore_index=True)
-            self.all_meta_data = all_metadata_df
-        return all_metadata_df
+            all_metadata.append(single_metadata)
 
-    def load_data(self, measu):
+        self.all_meta_data = pd.DataFrame(all_metadata).reset_index(drop=True)
+        return self.all_meta_data.copy()
+
+    def load_data(self, measu, n_threads=None):
 #    def load_data(self, datadirectory, measu):
         #load measurement measu into a NumPy Array stack
-        #assumes load_all_metadata was run, so that self.all_meta_data exists
+        #metadata is taken from self.all_meta_data, which is filled on the first call of load_all_metadata
         #if no measurement is selected, take the first one (for debugging, Oct. 2022)
+        # frames are single tif files, which are decoded in parallel by <n_threads> threads (default: number of CPUs),
+        # since reading them (e.g. from network storage) is mostly waiting
 
         #datadirectory = r'/Users/galizia/Documents/DATA/inga_calcium/01_DATA/'
         
-        metadata = self.load_all_metadata() # getting info from Inga .txt file
-        thisline = metadata.loc[measu] # self.measu
-        which_directory = self.data_path
-        directory = pl.Path(which_directory)
-        filenames =  [directory / fln for fln in thisline["dbb2"]]
-        img_data = tifffile.imread(filenames)
+        filenames = self.get_measurement_tif_files(measu)
+
+        # the first frame defines frame size and data type
+        first_frame = tifffile.imread(filenames[0])
+        img_data = np.empty((len(filenames),) + first_frame.shape, dtype=first_frame.dtype)
+        img_data[0] = first_frame
+
+        def read_frame(frame_ind):
+            img_data[frame_ind] = tifffile.imread(filenames[frame_ind])
+
+        if n_threads is None:
+            n_threads = os.cpu_count()
+
+        with ThreadPoolExecutor(max_workers=max(1, min(n_threads, len(filenames) - 1))) as executor:
+            # list() to raise exceptions of worker threads here
+            list(executor.map(read_frame, range(1, len(filenames))))
+
         # format is now TXY
-        print('io.py: transposed data array - adjust syntax if needed')
         img_data = img_data.transpose([1,2,0])  # TYX to XYT format
 
         return img_data
 # end MultiTiffReaderInga
 
 
+# MultiTiffReaderInga objects, keyed by (path, modification time, size) of the .txt file
+_inga_reader_cache = OrderedDict()
+_inga_reader_cache_max_entries = 8
+
+
+def get_multi_tiff_reader_inga(txt_file):
+    """
+    Return a MultiTiffReaderInga object for <txt_file>. Objects are cached using path, modification time and size
+    of <txt_file>, so that the data directory is listed and metadata is parsed only once per trial.
+    :param str|pathlib.Path txt_file: path of .txt file written along with the tif files
+    :rtype: MultiTiffReaderInga
+    """
+
+    txt_file = pl.Path(txt_file)
+    stat = txt_file.stat()
+    key = (str(txt_file.resolve()), stat.st_mtime_ns, stat.st_size)
+
+    if key in _inga_reader_cache:
+        _inga_reader_cache.move_to_end(key)
+        return _inga_reader_cache[key]
+
+    inga_reader = MultiTiffReaderInga(str(txt_file), measu=0)
+
+    _inga_reader_cache[key] = inga_reader
+    if len(_inga_reader_cache) > _inga_reader_cache_max_entries:
+        _inga_reader_cache.popitem(last=False)
+
+    return inga_reader
+
+
 
 def read_lif(lif_file, measu):
     """
@@ -277,14 +455,215 @@ def read_lif(lif_file, measu):
     implemented May 2022, tested with data from Marco Paoli, Toulouse
     :param str lif_file: path of lif file
     :param int measu: which measurement in the lif file to load
-    :return: numpy.ndarray in XYT format
+    :return: numpy.ndarray in XYT format, in the native data type of the lif file (uint8 or uint16). Conversion to
+    float happens during signal calculation.
     """
 
-    lif_reader_wrapper = LIFReaderGio(lif_file)
+    lif_reader_wrapper = get_lif_reader(lif_file)
     return lif_reader_wrapper.load_data(measu)
 # end read_lif
 
 
+# LIFReaderGio objects, keyed by (path, modification time, size)
+_lif_reader_cache = OrderedDict()
+_lif_reader_cache_max_entries = 8
+
+
+def get_lif_reader(lif_file):
+    """
+    Return a LIFReaderGio object for <lif_file>. Objects are cached using path, modification time and size
+    of <lif_file>, so that the XML header of a lif file is parsed only once, as long as the file is not changed.
+    :param str|pathlib.Path lif_file: path of lif file
+    :rtype: LIFReaderGio
+    """
+
+    lif_file = pl.Path(lif_file)
+    stat = lif_file.stat()
+    key = (str(lif_file.resolve()), stat.st_mtime_ns, stat.st_size)
+
+    if key in _lif_reader_cache:
+        _lif_reader_cache.move_to_end(key)
+        return _lif_reader_cache[key]
+
+    lif_reader = LIFReaderGio(str(lif_file))
+
+    _lif_reader_cache[key] = lif_reader
+    if len(_lif_reader_cache) > _lif_reader_cache_max_entries:
+        _lif_reader_cache.popitem(last=False)
+
+    return lif_reader
+
+
+# namespace of the OME XML written by Andor and TillPhotonics software
+# this uses xTree OME syntax
+# https://docs.python.org/3/library/xml.etree.elementtree.html#xml.etree.ElementTree.Element
+OME_NAMESPACE = {"d": "http://www.openmicroscopy.org/Schemas/OME/2013-06"}
+
+
+@dataclass
+class OMETifMetadata:
+    """Metadata parsed in a single pass from the OME XML header of a TIF file"""
+    # attributes of Image/Pixels, e.g. {'DimensionOrder': 'XYTZC', 'Type': 'uint16', 'SizeX': '1392',
+    # 'SizeY': '1040', 'SizeZ': '1', 'SizeC': '1', 'SizeT': '160', 'PhysicalSizeX': '6.45', ...}
+    pixels: dict = field(default_factory=dict)
+    # acquisition date as string, e.g. '2021-09-19T16:49:28'
+    acquisition_date: str = None
+    # binning of the first channel, e.g. '1x1'
+    binning: str = None
+    # in seconds, relative to acquisition date, one entry per plane, None where missing
+    plane_delta_t: list = field(default_factory=list)
+    # in seconds, one entry per plane, None where missing
+    plane_exposure_time: list = field(default_factory=list)
+
+    @classmethod
+    def from_xml_string(cls, xml_string):
+        """
+        Parse OME XML. All elements needed are collected in one walk over the tree
+        :param str xml_string: OME XML
+        :rtype: OMETifMetadata
+        """
+
+        root = ET.fromstring(xml_string)
+        pixels = root.find("./d:Image/d:Pixels", OME_NAMESPACE)
+        if pixels is None:
+            raise ValueError("OME XML does not contain an Image/Pixels element")
+
+        acquisition_date = root.find("./d:Image/d:AcquisitionDate", OME_NAMESPACE)
+        detector_settings = pixels.find("./d:Channel/d:DetectorSettings", OME_NAMESPACE)
+
+        def to_float(value):
+            return None if value is None else float(value)
+
+        planes = pixels.findall("./d:Plane", OME_NAMESPACE)
+
+        return cls(
+            pixels=dict(pixels.attrib),
+            acquisition_date=None if acquisition_date is None else acquisition_date.text,
+            binning=None if detector_settings is None else detector_settings.attrib.get("Binning"),
+            plane_delta_t=[to_float(plane.attrib.get("DeltaT")) for plane in planes],
+            plane_exposure_time=[to_float(plane.attrib.get("ExposureTime")) for plane in planes]
+        )
+
+    def get_delta_t(self, plane_number):
+        """
+        :param int plane_number: 1-based, as in XPath, i.e. plane_number=1 is the first plane
+        :rtype: float
+        """
+        delta_t = self.plane_delta_t[plane_number - 1]
+        if delta_t is None:
+            raise KeyError(f"Plane {plane_number} does not have the attribute 'DeltaT'")
+        return delta_t
+
+    def get_exposure_time(self, plane_number):
+        """
+        :param int plane_number: 1-based, as in XPath, i.e. plane_number=1 is the first plane
+        :rtype: float
+        """
+        exposure_time = self.plane_exposure_time[plane_number - 1]
+        if exposure_time is None:
+            raise KeyError(f"Plane {plane_number} does not have the attribute 'ExposureTime'")
+        return exposure_time
+
+    def get_measurement_time(self, plane_number):
+        """
+        Acquisition date plus the relative time of plane <plane_number>
+        :param int plane_number: 1-based, as in XPath, i.e. plane_number=1 is the first plane
+        :rtype: datetime.datetime
+        """
+        if self.acquisition_date is None:
+            raise KeyError("AcquisitionDate not found in OME XML")
+        measurement_start = dt.datetime.fromisoformat(self.acquisition_date)
+        return measurement_start + dt.timedelta(seconds=self.get_delta_t(plane_number))
+
+
+# parsed metadata of TIF files, keyed by (path, modification time, size)
+_ome_tif_metadata_cache = OrderedDict()
+_ome_tif_metadata_cache_max_entries = 1024
+
+
+def read_ome_tif_metadata(tif_file, tif=None):
+    """
+    Read and parse the OME XML header of <tif_file>. Results are cached using path, modification time and size
+    of <tif_file>, so that the header of a file is parsed only once, as long as the file is not changed.
+    :param str|pathlib.Path tif_file: path of tif file
+    :param tifffile.TiffFile tif: if specified, an already opened handle of <tif_file>, used on cache misses
+    :return: OMETifMetadata if <tif_file> contains OME XML, else None
+    """
+
+    tif_file = pl.Path(tif_file)
+    stat = tif_file.stat()
+    key = (str(tif_file.resolve()), stat.st_mtime_ns, stat.st_size)
+
+    if key in _ome_tif_metadata_cache:
+        _ome_tif_metadata_cache.move_to_end(key)
+        return _ome_tif_metadata_cache[key]
+
+    if tif is None:
+        with tifffile.TiffFile(tif_file) as tif:
+            description = tif.pages[0].description
+    else:
+        description = tif.pages[0].description
+
+    try:
+        ome_metadata = OMETifMetadata.from_xml_string(description)
+    except (ET.ParseError, ValueError, TypeError) as e:
+        logging.getLogger("VIEW").debug(f"No OME metadata found in {tif_file}: {e}")
+        ome_metadata = None
+
+    _ome_tif_metadata_cache[key] = ome_metadata
+    if len(_ome_tif_metadata_cache) > _ome_tif_metadata_cache_max_entries:
+        _ome_tif_metadata_cache.popitem(last=False)
+
+    return ome_metadata
+
+
+def get_meta_info_from_ome_metadata(ome_metadata, tif_file):
+    """
+    Convert <ome_metadata> to the dictionary returned by read_tif_2Dor3D
+    :param OMETifMetadata ome_metadata:
+    :param pathlib.Path tif_file: path of tif file
+    :rtype: dict
+    """
+
+    # now get all infos that we put into settings file
+    meta_info = dict(ome_metadata.pixels)
+    if ome_metadata.acquisition_date is None or ome_metadata.binning is None:
+        raise KeyError("AcquisitionDate or Binning not found in OME XML")
+    meta_info['AcquisitionDate'] = ome_metadata.acquisition_date
+    meta_info['Binning'] = ome_metadata.binning
+
+    # frame interval
+    # relative time of second image (first image looks unsafe - often it is blank. Therefore use frames 2 and 3)
+    time_frame1 = ome_metadata.get_delta_t(2)
+    time_frame2 = ome_metadata.get_delta_t(3)
+    GDMfreq = int((time_frame2 - time_frame1) * 1000 + 0.5)  # unit is ms, rounded
+    meta_info['GDMfreq'] = str(GDMfreq)
+
+    # exposure time for frame 2 - expecting that to be uniform
+    ExposureTime_ms = int(1000 * ome_metadata.get_exposure_time(2))  # value in Andor is in seconds
+    meta_info['ExposureTime_ms'] = str(ExposureTime_ms)
+
+    # columns in .settings that need to be filled here:
+    # get the tif file, including the last directory
+    this_filename = tif_file.parts
+    meta_info['dbb'] = this_filename[-2] + '/' + this_filename[-1]
+    meta_info['Label'] = this_filename[-1]
+
+    # replace the Andor name "PhysicalSizeX' with the Galizia name PsSzX
+    meta_info['PsSzX'] = meta_info.pop('PhysicalSizeX')
+    meta_info['PsSzY'] = meta_info.pop('PhysicalSizeY')
+
+    # When was this measurement taken?
+    # measurement start time is equal for all measurements in one loop, so add the time of the (second) frame
+    measurementtime = ome_metadata.get_measurement_time(2)
+    # StartTime, e.g. 10:05:04
+    meta_info['StartTime'] = measurementtime.strftime('%H:%M:%S')
+    # UTC, e.g. 1623229504.482
+    meta_info['UTCTime'] = measurementtime.timestamp()
+
+    return meta_info
+
+
 def read_tif_2Dor3D(tif_file, flip_y=True, return_3D=False, load_data=True):
     """
     Read a TIF file into numpy array. TIF file axes are assumed to be TYX or YX. Also works for OME Tiff files,
@@ -303,89 +682,21 @@ def read_tif_2Dor3D(tif_file, flip_y=True, return_3D=False, load_data=True):
     if type(tif_file) == str:
         tif_file = pl.Path(tif_file)
 
-    # load metadata
-    # tif_file=animal_list[10]
-    with tifffile.TiffFile(tif_file) as tif:
-            metadata = tif.imagej_metadata
-            # imagej_metadata does not work any more or never worked on stack - read metadata from first frame
-            if metadata is None:
-                metadata = tif.pages[0].description
-
-    # extract XML tree from metadata into root
-    try:
-        root = ET.fromstring(metadata)
-        metadata_present = True
-
-        # define namespace for OME data
-        # this uses xTree OME syntax
-        # https://docs.python.org/3/library/xml.etree.elementtree.html#xml.etree.ElementTree.Element
-        ns = {
-            "d": "http://www.openmicroscopy.org/Schemas/OME/2013-06"    
-        }
-        # now get all infos that we put into settings file
-        meta_info = root.find("./d:Image/d:Pixels", ns).attrib
-        # result is a dictionary, for example:
-     #        {'ID': 'Pixels:1-0',
-     # 'DimensionOrder': 'XYTZC',
-     # 'Type': 'uint16',
-     # 'SizeX': '1392',
-     # 'SizeY': '1040',
-     # 'SizeZ': '1',
-     # 'SizeC': '1',
-     # 'SizeT': '160',
-     # 'PhysicalSizeX': '6.45',
-     # 'PhysicalSizeY': '6.45',
-     # 'PhysicalSizeZ': '1000',
-     # 'SignificantBits': '14'}
-        # acquisition date as string, e.g. '2021-09-19T16:49:28'
-        AcquisitionDate = root.find("./d:Image/d:AcquisitionDate", ns).text
-        meta_info.update({'AcquisitionDate':AcquisitionDate})
-        # binning info, e.g. '1x1'
-        Binning = root.find("./d:Image/d:Pixels/d:Channel/d:DetectorSettings", ns).attrib["Binning"]
-        meta_info.update({'Binning':Binning})
-     # frame interval
-        # relative time of secoond image (first image looks unsafe - often it is blanck. Therefore use frames 2 and 3)
-        time_frame1 = root.find("./d:Image/d:Pixels/d:Plane[2]", ns).attrib["DeltaT"]
-        # relative time of third image
-        time_frame2 = root.find("./d:Image/d:Pixels/d:Plane[3]", ns).attrib["DeltaT"]
-        GDMfreq = (float(time_frame2) - float(time_frame1))
-        GDMfreq = int(GDMfreq*1000 + 0.5) # unit is ms, rounded
-        meta_info.update({'GDMfreq':str(GDMfreq)})
-    # exposure time for frame 2 - expecting that to be uniform
-        ExposureTime_ms = float(root.find("./d:Image/d:Pixels/d:Plane[2]", ns).attrib["ExposureTime"])
-        ExposureTime_ms = int(1000*ExposureTime_ms) # value in Andor is in seconds
-        meta_info.update({'ExposureTime_ms':str(ExposureTime_ms)})
-    # columns in .settings that need to be filled here:
-    # get the tif file, including the last directory
-        this_filename = tif_file.parts
-        dbb = this_filename[-2] +'/'+ this_filename[-1]
-        meta_info.update({'dbb':dbb})
-        meta_info.update({'Label':this_filename[-1]})
-        # PxSzX
-        # replace the Andor name "PhysicalSizeX' with the Galizia name PsSzX
-        meta_info['PsSzX'] = meta_info.pop('PhysicalSizeX')
-        meta_info['PsSzY'] = meta_info.pop('PhysicalSizeY')
-        # PxSzY, e.g. 1.5625
-    # When was this measurement taken?
-    # first get the time when the measurement was started
-        measurementtime = dt.datetime.fromisoformat(AcquisitionDate)
-    # now add the time of the first frame, since measurement start time ie equal for all measurements in one loop
-        measurementtime_delta = dt.timedelta(seconds=float(time_frame1))
-        measurementtime = measurementtime + measurementtime_delta
-        # StartTime, e.g. 10:05:04
-        StartTime = measurementtime.strftime('%H:%M:%S')
-        meta_info.update({'StartTime':StartTime})
-        # UTC, e.g. 1623229504.482
-        UTC = measurementtime.timestamp()
-        meta_info.update({'UTCTime':UTC})
-    except:
-        metadata_present = False
-        meta_info = None
-
-    # load data
+    def get_meta_info(tif=None):
+        ome_metadata = read_ome_tif_metadata(tif_file, tif=tif)
+        if ome_metadata is None:
+            return None
+        try:
+            return get_meta_info_from_ome_metadata(ome_metadata, tif_file)
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logging.getLogger("VIEW").debug(f"Incomplete OME metadata in {tif_file}: {e}")
+            return None
+
+    # load data, reusing the same file handle for parsing metadata
     if load_data:
         with tifffile.TiffFile(tif_file) as tif:
-                imagej_hyperstack = tif.asarray()
+            meta_info = get_meta_info(tif)
+            imagej_hyperstack = tif.asarray()
 
         if len(imagej_hyperstack.shape) == 3:  # 3D data in TYX format
 
@@ -405,6 +716,7 @@ def read_tif_2Dor3D(tif_file, flip_y=True, return_3D=False, load_data=True):
                 imagej_hyperstack = np.stack([imagej_hyperstack], axis=2)
     else:  # i.e., if load_data is false
         imagej_hyperstack = None
+        meta_info = get_meta_info()
 
     return imagej_hyperstack, meta_info
 # end read_ometif_metadict
@@ -420,7 +732,7 @@ def read_SingleWavelengthTif_MultiFileInga(txt_file, measu):
     print('/view/python_core/io.py: reading MultiFile tiff in read_SingleWavelengthTif_MultiFile.')
     print('use object MultiTiffReaderInga directly')
     #return tifffile.imread(tif_file_list)  # return in format XYT
-    inga_reader_wrapper = MultiTiffReaderInga(txt_file, measu)
+    inga_reader_wrapper = get_multi_tiff_reader_inga(txt_file)
     return inga_reader_wrapper.load_data(measu)
 
 
@@ -552,9 +864,30 @@ def read_lsm(path):
     return data_cut_rot_flip
 
 
-def load_pst(filename):
+def is_memory_mapped(array):
+    """
+    Whether <array> is a memory mapped file (e.g. returned by load_pst with lazy=True) or a view of one
+    :param numpy.ndarray array:
+    :rtype: bool
+    """
+
+    # arrays of type np.memmap are not necessarily memory mapped, e.g. after astype, but have the map as their base
+    while array is not None:
+        if isinstance(array, mmap.mmap):
+            return True
+        array = getattr(array, "base", None)
+
+    return False
+
+
+def load_pst(filename, lazy=False):
     """
     read tillvision based .pst files as uint16.
+    :param str filename: path of the .pst/.ps file, with or without extension
+    :param bool lazy: if True, the file is memory mapped (copy-on-write) and a flipped XYT view of the map is
+    returned, so that no frame is read from disk before it is accessed. In-place modifications of the returned
+    array are not written back to the file.
+    :rtype: numpy.ndarray, format XYT
     """
     # filename can have an extension (e.g. .pst), or not
     # reading stack size from inf
@@ -589,13 +922,43 @@ def load_pst(filename):
     assert filepath.stat().st_size >= 2 * expected_units, \
         f"Expected at least {2 * expected_units} bytes in {filepath}. Found {filepath.stat().st_size}"
 
-    raw = np.fromfile(filepath, dtype='int16', count=expected_units)
-    data = np.reshape(raw, shape, order='F')
+    if lazy:
+        # values are stored as int16, but are interpreted as uint16. Mapping the file directly as uint16
+        # reinterprets the same bits, which is exactly what the ".astype('uint16')" below does
+        data = np.memmap(filepath, dtype='uint16', mode='c', shape=tuple(int(x) for x in shape), order='F')
+    else:
+        raw = np.fromfile(filepath, dtype='int16', count=expected_units)
+        data = np.reshape(raw, shape, order='F')
 
     # was swapping x, y axes; commented out to retain original order
     # data  = data.swapaxes(0,1)
 
     # data is upside down as compared to what we see in TillVision
     data = np.flip(data, axis=1)
-    data = data.astype('uint16')
+
+    if not lazy:
+        data = data.astype('uint16')
+
     return data
+
+
+def read_file_ranges_into_os_cache(file_ranges, chunk_size=16 * 1024 ** 2):
+    """
+    Read byte ranges of files, discarding their content, so that they are in the file cache of the operating system
+    and reading them later does not need to wait for the disk or network. Ranges occurring more than once in
+    <file_ranges> are read only once
+    :param Iterable file_ranges: tuples (path, offset, length), with length None for reading until the end of the file
+    :param int chunk_size: number of bytes read at once
+    """
+
+    buffer = memoryview(bytearray(chunk_size))
+    for file, offset, length in dict.fromkeys(file_ranges):
+        with open(file, "rb", buffering=0) as fh:
+            fh.seek(offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                n_read = fh.readinto(buffer if remaining is None else buffer[:min(remaining, chunk_size)])
+                if not n_read:
+                    break
+                if remaining is not None:
+                    remaining -= n_read
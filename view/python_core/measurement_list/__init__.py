@@ -511,10 +511,11 @@ class MeasurementList(object):
 
         return new_ml
 
-    def load_data(self, flags, measu):
+    def load_data(self, flags, measu, bleach_correction_worker_pool=None):
 
         p1_metadata, extra_metadata = self.get_p1_metadata_by_measu(measu)
-        p1 = get_p1(p1_metadata=p1_metadata, flags=flags, extra_metadata=extra_metadata)
+        p1 = get_p1(p1_metadata=p1_metadata, flags=flags, extra_metadata=extra_metadata,
+                    bleach_correction_worker_pool=bleach_correction_worker_pool)
 
         return flags.get_measurement_label(measurement_row=self.get_row_by_measu(measu)), p1
 
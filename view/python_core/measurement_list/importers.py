@@ -10,9 +10,8 @@ import logging
 import pprint
 import datetime
 from abc import ABC, abstractmethod
-import xml.etree.ElementTree as ET
-from view.python_core.io import LIFReaderGio
-from view.python_core.io import MultiTiffReaderInga
+from view.python_core.io import get_lif_reader, read_ome_tif_metadata
+from view.python_core.io import get_multi_tiff_reader_inga
 
 
 def calculate_dt_from_timing_ms(timing_ms: str) -> float:
@@ -328,10 +327,11 @@ class LifImporter(BaseImporter):
 
     def parse_metadata(self, fle: str, fle_ind: int,
                        measurement_filter: typing.Callable[[pd.Series], bool] = True) -> pd.DataFrame:
-        lif_reader = LIFReaderGio(fle)
+        # shared with view.python_core.io.read_lif, so that the XML header is parsed only once
+        lif_reader = get_lif_reader(fle)
         all_lif_metadata = lif_reader.load_all_metadata()
 
-        this_lst_frame = pd.DataFrame()
+        lst_lines = []
 
         # iterate all measurements
         for fle_ind, lst_row in all_lif_metadata.iterrows():
@@ -343,9 +343,12 @@ class LifImporter(BaseImporter):
                     default_row=self.get_default_row()
                 )
 
-                this_lst_frame = this_lst_frame.append(lst_line, ignore_index=True)
+                lst_lines.append(lst_line)
 
-        return this_lst_frame
+        if len(lst_lines) == 0:
+            return pd.DataFrame()
+
+        return pd.concat(lst_lines, ignore_index=True)
 
 
 class LSMImporter(BaseImporter):
@@ -427,7 +430,8 @@ class IngaTif_Importer(BaseImporter):
                        measurement_filter: typing.Callable[[pd.Series], bool] = True) -> pd.DataFrame:
         # load metadata from a .txt file, format defined by Inga Petelski, 2022
 
-        inga_reader = MultiTiffReaderInga(fle, measu=0) # initialize reader with the txt file, measu to first line
+        # initialize reader with the txt file, shared with view.python_core.io.read_SingleWavelengthTif_MultiFileInga
+        inga_reader = get_multi_tiff_reader_inga(fle)
         all_metadata = inga_reader.load_all_metadata() # get the dataframe
 
         #this_lst_frame = pd.DataFrame()
@@ -551,22 +555,13 @@ class P1DualWavelengthTIFSingleFileImporter(BaseImporter):
         
         
         tif_file=pl.Path(fle)
-        with tifffile.TiffFile(tif_file) as tif:
-                metadata   = tif.imagej_metadata
-                # imagej_metadata does not work any more or never worked on stack - read metadata from first frame
-                if metadata is None:
-                    metadata = tif.pages[0].description
-    
-        # extract XML tree from metadata into root
-        root = ET.fromstring(metadata)
-        # define namespace for OME data
-        # this uses xTree OME syntax
-        # https://docs.python.org/3/library/xml.etree.elementtree.html#xml.etree.ElementTree.Element
-        ns = {
-            "d": "http://www.openmicroscopy.org/Schemas/OME/2013-06"    
-        }
+        # parsed only once per file, also shared with view.python_core.io.read_tif_2Dor3D
+        ome_metadata = read_ome_tif_metadata(tif_file)
+        if ome_metadata is None:
+            raise ValueError(f"Could not find OME metadata in {fle}")
+
         # now get all infos that we put into settings file
-        meta_info = root.find("./d:Image/d:Pixels", ns).attrib
+        meta_info = dict(ome_metadata.pixels)
       # so far, this works with TillPhotonics .tif files for dual wavelengths (as saved in Trondheim group)
         # recognized by int(meta_info['SizeC']) == 2
         # saved sigle wavelength files have SizeC == 1
@@ -587,8 +582,7 @@ class P1DualWavelengthTIFSingleFileImporter(BaseImporter):
      # 'PhysicalSizeZ': '1000',
      # 'SignificantBits': '14'}
         # acquisition date as string, e.g. '2021-09-19T16:49:28'
-        AcquisitionDate = root.find("./d:Image/d:AcquisitionDate", ns).text
-        meta_info.update({'AcquisitionDate':AcquisitionDate})
+        meta_info.update({'AcquisitionDate': ome_metadata.acquisition_date})
 
 
     # columns in .settings that need to be filled here:
@@ -606,20 +600,16 @@ class P1DualWavelengthTIFSingleFileImporter(BaseImporter):
         first_frame = 1
         num_frames = int(meta_info['SizeT'])
         last_frame = num_frames * int(meta_info['SizeC'])
-        root_text_first_frame = "./d:Image/d:Pixels/d:Plane["+str(first_frame)+"]"
-        root_text_last_frame  = "./d:Image/d:Pixels/d:Plane["+str(last_frame)+"]"
-        time_frame1 = root.find(root_text_first_frame, ns).attrib["DeltaT"]
-        time_frame_last = root.find(root_text_last_frame, ns).attrib["DeltaT"]
+        time_frame1 = ome_metadata.get_delta_t(first_frame)
+        time_frame_last = ome_metadata.get_delta_t(last_frame)
         # frame interval. Since this is dual wavelength, 
         # take time from first to last, and divide by dimension T
-        GDMfreq = (float(time_frame_last) - float(time_frame1)) / num_frames
+        GDMfreq = (time_frame_last - time_frame1) / num_frames
         GDMfreq = round(GDMfreq*1000) # unit is ms, rounded
         meta_info.update({'GDMfreq':str(GDMfreq)})
 
-        measurementtime = datetime.datetime.fromisoformat(AcquisitionDate)
     # now add the time of the first frame, since measurement start time ie equal for all measurements in one loop
-        measurementtime_delta = datetime.timedelta(seconds=float(time_frame1))
-        measurementtime = measurementtime + measurementtime_delta
+        measurementtime = ome_metadata.get_measurement_time(first_frame)
         # StartTime, e.g. 10:05:04
         StartTime = measurementtime.strftime('%H:%M:%S')
         meta_info.update({'StartTime':StartTime})
@@ -632,14 +622,14 @@ class P1DualWavelengthTIFSingleFileImporter(BaseImporter):
         if int(meta_info['SizeC']) == 2:
             meta_info.update({'dbb2':dbb}) # copy filename also into column dbb2, since it is dual wavelength
             # binning info, e.g. '1x1'
-            Binning = root.find("./d:Image/d:Pixels/d:Channel/d:DetectorSettings", ns).attrib["Binning"]
+            Binning = ome_metadata.binning
             meta_info.update({'Binning':Binning})
         # this format is for two-wavelength recording,
         # so I take exposure time for frame 3 and 4
         # just in case the very first one would be strange
-            ExposureTime_ms = float(root.find("./d:Image/d:Pixels/d:Plane[3]", ns).attrib["ExposureTime"])
+            ExposureTime_ms = ome_metadata.get_exposure_time(3)
             ExposureTime_ms_340 = int(1000*ExposureTime_ms) # value in Andor is in seconds
-            ExposureTime_ms = float(root.find("./d:Image/d:Pixels/d:Plane[4]", ns).attrib["ExposureTime"])
+            ExposureTime_ms = ome_metadata.get_exposure_time(4)
             ExposureTime_ms_380 = int(1000*ExposureTime_ms) # value in Andor is in seconds
             ExposureTimeStr = str(ExposureTime_ms_340)+'/'+str(ExposureTime_ms_380)
             meta_info.update({'ExposureTime_ms':ExposureTimeStr})
@@ -0,0 +1,484 @@
+import hashlib
+import logging
+import os
+import pathlib as pl
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.fft
+from scipy import ndimage
+
+
+# frame against which all other frames are registered, as in view.idl_translation_core.ViewLoadData.MovementCorrection
+REFERENCE_FRAME = 5
+
+# maximum shift searched, as proportion of frame size along X and Y
+MAX_SHIFT_PROPORTION = 0.1
+
+# standard deviation of the gaussian low pass filter applied during phase correlation, in cycles per pixel
+LOW_PASS_SIGMA = 0.05
+
+# number of times frames are registered again after aligning them with the shifts found
+REFINEMENT_ITERATIONS = 1
+
+# number of frames transformed together during registration and shifting, limits memory usage
+FRAMES_PER_BLOCK = 64
+
+# maximum number of sets of shifts stored in one file next to raw data
+MAX_SIDECAR_ENTRIES = 8
+
+# raw data of both wavelengths of dual wavelength measurements can be corrected concurrently (see
+# view.python_core.p1_class.P1DualWavelengthAbstract.run_for_each_wavelength), which write to the same .moveList file
+# and, for data of both wavelengths in one file, to the same file next to raw data
+_movement_list_file_lock = threading.Lock()
+_shifts_sidecar_lock = threading.Lock()
+
+
+def get_movement_list_path(flags):
+    """
+    Path of the .moveList file of the current animal, in STG_OdorInfoPath
+    :param FlagsManager flags:
+    :rtype: pathlib.Path
+    """
+
+    return pl.Path(flags["STG_OdorInfoPath"]) / f"{flags['STG_ReportTag']}.moveList"
+
+
+def read_movement_list(move_file, measu, n_frames, wavelength_index=None):
+    """
+    Read the movement values of measurement <measu> from the .moveList file <move_file>.
+    Format of .moveList files: tab-separated, without header. The first column is the measurement number, the second
+    the row label (0 for shifts along X, 1 for shifts along Y, 2 for quality of registration), the third the odor or
+    wavelength (0 for single wavelength data, 0 or 1 for the two wavelengths of dual wavelength data), followed by
+    one column per frame. Values are integers, as expected by IDL, unless shifts were calculated with subpixel
+    precision (flag "LE_MovementSubpixel"), in which case shifts have two decimals. If there are several sets of
+    three rows for a measurement (and wavelength), the last three are used
+    :param str|pathlib.Path move_file: path of the .moveList file
+    :param int measu: measurement number
+    :param int n_frames: number of frames
+    :param int wavelength_index: if not None, only rows with this value in the third column are used
+    :return: numpy.ndarray of shape (3, <n_frames>) with rows shifts along X, shifts along Y and quality, or None if
+    <move_file> does not exist or contains no movement values for <measu>
+    """
+
+    if not os.path.isfile(move_file):
+        return None
+
+    move_list_df = pd.read_csv(move_file, sep="\t", header=None)
+    move_list_df = move_list_df.loc[move_list_df.iloc[:, 0] == measu]
+    if wavelength_index is not None:
+        move_list_df = move_list_df.loc[move_list_df.iloc[:, 2] == wavelength_index]
+
+    if move_list_df.shape[0] < 3:
+        return None
+
+    return move_list_df.iloc[-3:, 3: n_frames + 3].values
+
+
+def write_movement_list(move_file, measu, movement_list, wavelength_index=None):
+    """
+    Write the movement values of measurement <measu> to the .moveList file <move_file>, creating it if needed.
+    Rows of <measu> already in the file (only those of <wavelength_index>, if it is not None) are replaced.
+    See <read_movement_list> for the format. Values are written as integers where they are integral
+    :param str|pathlib.Path move_file: path of the .moveList file
+    :param int measu: measurement number
+    :param numpy.ndarray movement_list: shape (3, number of frames), rows shifts along X, shifts along Y and quality
+    :param int wavelength_index: value of the third column, see <read_movement_list>. If None, 0 is written
+    """
+
+    odor = 0 if wavelength_index is None else wavelength_index
+    out_info = pd.DataFrame([[measu, 0, odor], [measu, 1, odor], [measu, 2, odor]])
+    out_move = pd.concat([out_info, pd.DataFrame(movement_list)], axis=1, ignore_index=True)
+
+    with _movement_list_file_lock:
+        if os.path.isfile(move_file):
+            old_move = pd.read_csv(move_file, sep="\t", header=None)
+            rows_to_replace = old_move.iloc[:, 0] == measu
+            if wavelength_index is not None:
+                rows_to_replace &= old_move.iloc[:, 2] == wavelength_index
+            out_move = pd.concat([old_move.loc[~rows_to_replace], out_move], ignore_index=True)
+
+        # columns containing subpixel shifts or missing values (measurements with fewer frames) are float columns,
+        # whose integral values are still written as integers
+        out_move.to_csv(move_file, sep="\t", header=False, index=False, float_format="%.10g")
+
+
+def _prepare_frames_for_registration(frames_xyt, window):
+    """
+    Subtract the mean of each frame and multiply it with <window>, to reduce the influence of frame borders on phase
+    correlation
+    :param numpy.ndarray frames_xyt: 3D, format XYT
+    :param numpy.ndarray window: 2D, format XY
+    :rtype: numpy.ndarray
+    """
+
+    frames = frames_xyt.astype(np.float64)
+    frames -= frames.mean(axis=(0, 1), keepdims=True)
+    frames *= window[:, :, np.newaxis]
+
+    return frames
+
+
+def _gaussian_peak_offsets(center, before, after):
+    """
+    Subpixel offsets of peaks from fitting gaussians through three values around each peak, i.e., parabolas through
+    their logarithms. Where values are not positive, parabolas are fitted through the values themselves
+    :param numpy.ndarray center: values at the peaks
+    :param numpy.ndarray before: values before the peaks along one axis
+    :param numpy.ndarray after: values after the peaks along the same axis
+    :return: offsets in [-0.5, 0.5], 0 where no peak fits
+    :rtype: numpy.ndarray
+    """
+
+    positive = (center > 0) & (before > 0) & (after > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        center, before, after = (np.where(positive, np.log(np.where(positive, x, 1)), x)
+                                 for x in (center, before, after))
+        curvature = before - 2 * center + after
+        offsets = np.where(curvature < 0, 0.5 * (before - after) / curvature, 0)
+
+    return np.clip(np.nan_to_num(offsets), -0.5, 0.5)
+
+
+def register_frames_phase_correlation(movie_xyt, reference_frame=REFERENCE_FRAME, max_shift=None):
+    """
+    Calculate shifts that align each frame of <movie_xyt> to the frame <reference_frame>, using phase correlation
+    with subpixel refinement (see REFINEMENT_ITERATIONS). All frames are transformed in blocks of FRAMES_PER_BLOCK.
+    Shifts have the same meaning as in view.idl_translation_core.ViewLoadData.MovementCorrection: shifting frame t by
+    shifts[0, t] along X and by shifts[1, t] along Y (e.g. with np.roll) aligns it to the reference frame
+    :param numpy.ndarray movie_xyt: 3D, format XYT
+    :param int reference_frame: index of the reference frame, the last frame is used if there are fewer frames
+    :param int max_shift: maximum shift searched along X and Y, in pixels. Defaults to MAX_SHIFT_PROPORTION of the
+    smaller of the frame dimensions
+    :return: numpy.ndarray of shape (3, number of frames), with rows shifts along X, shifts along Y and quality,
+    i.e., int(10 * correlation coefficient) of the shifted frame and the reference frame, excluding <max_shift> pixels
+    along the borders
+    """
+
+    size_x, size_y, n_frames = movie_xyt.shape
+    reference_frame = min(reference_frame, n_frames - 1)
+    if max_shift is None:
+        max_shift = min(int(size_x * MAX_SHIFT_PROPORTION), int(size_y * MAX_SHIFT_PROPORTION))
+
+    window = np.outer(np.hanning(size_x), np.hanning(size_y))
+    reference = _prepare_frames_for_registration(movie_xyt[:, :, reference_frame: reference_frame + 1], window)
+    reference_fft = scipy.fft.fft2(reference, axes=(0, 1))
+
+    # normalization of the cross power spectrum weights all frequencies equally, which makes registration sensitive to
+    # noise at high frequencies. Weighting with a gaussian low pass filter avoids this and results in a smooth peak
+    frequencies_x, frequencies_y = np.fft.fftfreq(size_x), np.fft.fftfreq(size_y)
+    low_pass = np.exp(-0.5 * (frequencies_x[:, np.newaxis] ** 2 + frequencies_y[np.newaxis, :] ** 2)
+                      / LOW_PASS_SIGMA ** 2)[:, :, np.newaxis]
+
+    # shifts corresponding to the indices of the correlation surface, which wraps around
+    offsets_x = np.fft.fftfreq(size_x, 1 / size_x).round().astype(int)
+    offsets_y = np.fft.fftfreq(size_y, 1 / size_y).round().astype(int)
+    outside_search_window \
+        = (np.abs(offsets_x)[:, np.newaxis] > max_shift) | (np.abs(offsets_y)[np.newaxis, :] > max_shift)
+
+    # quality is calculated excluding borders, where frames wrap around after shifting
+    interior_x = np.arange(max_shift, size_x - max_shift)
+    interior_y = np.arange(max_shift, size_y - max_shift)
+    reference_interior = movie_xyt[np.ix_(interior_x, interior_y, [reference_frame])].astype(np.float64)
+
+    def phase_correlation_shifts(frames_xyt):
+
+        n_block_frames = frames_xyt.shape[2]
+
+        # normalized cross power spectrum, its inverse transform peaks at the shifts that align frames to reference
+        cross_power = reference_fft * np.conj(scipy.fft.fft2(_prepare_frames_for_registration(frames_xyt, window),
+                                                             axes=(0, 1)))
+        cross_power /= np.maximum(np.abs(cross_power), np.finfo(np.float64).tiny)
+        cross_power *= low_pass
+        correlation = scipy.fft.ifft2(cross_power, axes=(0, 1)).real
+        correlation[outside_search_window] = -np.inf
+
+        peak_x, peak_y = np.unravel_index(correlation.reshape(-1, n_block_frames).argmax(axis=0), (size_x, size_y))
+        frame_inds_ = np.arange(n_block_frames)
+
+        def correlation_at(x_inds, y_inds):
+            values = correlation[x_inds % size_x, y_inds % size_y, frame_inds_]
+            # neighbours outside the search window
+            return np.where(np.isfinite(values), values, 0)
+
+        peak_values = correlation[peak_x, peak_y, frame_inds_]
+        subpixel_x = _gaussian_peak_offsets(
+            peak_values, correlation_at(peak_x - 1, peak_y), correlation_at(peak_x + 1, peak_y))
+        subpixel_y = _gaussian_peak_offsets(
+            peak_values, correlation_at(peak_x, peak_y - 1), correlation_at(peak_x, peak_y + 1))
+
+        return offsets_x[peak_x] + subpixel_x, offsets_y[peak_y] + subpixel_y
+
+    shifts = np.zeros((3, n_frames))
+
+    for block_start in range(0, n_frames, FRAMES_PER_BLOCK):
+
+        block = movie_xyt[:, :, block_start: block_start + FRAMES_PER_BLOCK]
+        n_block_frames = block.shape[2]
+        frame_inds = np.arange(n_block_frames)
+        block_slice = slice(block_start, block_start + n_block_frames)
+
+        shifts_x, shifts_y = phase_correlation_shifts(block)
+
+        # parts of frames entering or leaving the field of view bias shifts. Registering frames again after
+        # aligning them with the shifts found reduces the bias
+        for _ in range(REFINEMENT_ITERATIONS):
+            aligned_block = np.stack(
+                [ndimage.shift(block[:, :, ind].astype(np.float64), (shifts_x[ind], shifts_y[ind]), order=1,
+                               mode="nearest")
+                 for ind in frame_inds], axis=2)
+            residual_shifts_x, residual_shifts_y = phase_correlation_shifts(aligned_block)
+            shifts_x += residual_shifts_x
+            shifts_y += residual_shifts_y
+
+        shifts[0, block_slice] = shifts_x
+        shifts[1, block_slice] = shifts_y
+        integer_shifts_x, integer_shifts_y = shifts_x.round().astype(int), shifts_y.round().astype(int)
+
+        # correlation coefficients of the interior of frames shifted by integer shifts and the reference frame
+        shifted_interior = block[
+            (interior_x[:, np.newaxis, np.newaxis] - integer_shifts_x) % size_x,
+            (interior_y[np.newaxis, :, np.newaxis] - integer_shifts_y) % size_y,
+            frame_inds].astype(np.float64)
+        shifted_interior -= shifted_interior.mean(axis=(0, 1), keepdims=True)
+        centered_reference = reference_interior - reference_interior.mean()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            correlation_coefficients = (shifted_interior * centered_reference).sum(axis=(0, 1)) / np.sqrt(
+                (shifted_interior ** 2).sum(axis=(0, 1)) * (centered_reference ** 2).sum())
+        shifts[2, block_slice] = (10 * np.nan_to_num(correlation_coefficients)).astype(int)
+
+    return shifts
+
+
+def get_shifts_sidecar_path(raw_data_filename):
+    """
+    Path of the file next to the raw data file <raw_data_filename> in which shifts calculated for it are stored
+    :param str|pathlib.Path raw_data_filename:
+    :rtype: pathlib.Path
+    """
+
+    raw_data_filename = pl.Path(raw_data_filename)
+    return raw_data_filename.with_name(f"{raw_data_filename.name}.shifts.npz")
+
+
+def get_registration_key(movie_xyt):
+    """
+    Calculate a key that changes when the data to register or the registration parameters change. All pixels of the
+    data are hashed, so that changes of raw data or of corrections applied before movement correction are detected
+    even if they affect only a few pixels
+    :param numpy.ndarray movie_xyt: 3D, format XYT
+    :rtype: str
+    """
+
+    sha1 = hashlib.sha1()
+    sha1.update(repr((movie_xyt.shape, str(movie_xyt.dtype), REFERENCE_FRAME, MAX_SHIFT_PROPORTION, LOW_PASS_SIGMA,
+                      REFINEMENT_ITERATIONS)).encode())
+    sha1.update(np.ascontiguousarray(movie_xyt).data)
+
+    return sha1.hexdigest()
+
+
+def read_shifts_sidecar(sidecar_path, key):
+    """
+    Read shifts stored with key <key> in the file <sidecar_path>
+    :param str|pathlib.Path sidecar_path: see <get_shifts_sidecar_path>
+    :param str key: see <get_registration_key>
+    :return: numpy.ndarray of shape (3, number of frames), see <register_frames_phase_correlation>, or None if there
+    are no shifts stored with key <key>
+    """
+
+    try:
+        with np.load(sidecar_path) as npz_file:
+            return npz_file[key]
+    except (OSError, EOFError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def write_shifts_sidecar(sidecar_path, key, shifts):
+    """
+    Store shifts with key <key> in the file <sidecar_path>, in addition to shifts already stored in it with other keys
+    (e.g. for both wavelengths of data in one file, or for data filtered differently). Only the last
+    MAX_SIDECAR_ENTRIES are kept
+    :param str|pathlib.Path sidecar_path: see <get_shifts_sidecar_path>
+    :param str key: see <get_registration_key>
+    :param numpy.ndarray shifts: see <register_frames_phase_correlation>
+    """
+
+    sidecar_path = pl.Path(sidecar_path)
+
+    with _shifts_sidecar_lock:
+        try:
+            with np.load(sidecar_path) as npz_file:
+                entries = {k: npz_file[k] for k in npz_file.files if k != key}
+        except (OSError, EOFError, ValueError, zipfile.BadZipFile):
+            entries = {}
+
+        entries[key] = shifts
+        entries = dict(list(entries.items())[-MAX_SIDECAR_ENTRIES:])
+
+        try:
+            # written to a temporary file first, so that partially written files are never read
+            temp_path = sidecar_path.with_name(f"{sidecar_path.name}.{os.getpid()}.tmp.npz")
+            np.savez(temp_path, **entries)
+            os.replace(temp_path, sidecar_path)
+        except OSError as e:
+            logging.getLogger("VIEW").warning(f"Could not save shifts to {sidecar_path}: {e}")
+
+
+def _roll_frame_into(out, frame, shift_x, shift_y):
+    """
+    Write <frame> shifted by integer shifts into <out>, like np.roll(frame, (shift_x, shift_y), axis=(0, 1)) but as
+    four slice copies, without temporary arrays
+    :param numpy.ndarray out: 2D, same shape as <frame>
+    :param numpy.ndarray frame: 2D
+    :param int shift_x: shift along the first axis
+    :param int shift_y: shift along the second axis
+    """
+
+    size_x, size_y = frame.shape
+    shift_x, shift_y = shift_x % size_x, shift_y % size_y
+
+    out[shift_x:, shift_y:] = frame[:size_x - shift_x, :size_y - shift_y]
+    out[:shift_x, shift_y:] = frame[size_x - shift_x:, :size_y - shift_y]
+    out[shift_x:, :shift_y] = frame[:size_x - shift_x, size_y - shift_y:]
+    out[:shift_x, :shift_y] = frame[size_x - shift_x:, size_y - shift_y:]
+
+
+def apply_shifts(movie_xyt, shifts, subpixel=False, dtype=np.float64, n_threads=1):
+    """
+    Shift each frame of <movie_xyt> by the shifts in <shifts>, wrapping around at the borders, like np.roll does.
+    Frames are shifted in blocks of FRAMES_PER_BLOCK, which are copied to frame-major (TXY) order first, so that each
+    frame is contiguous in memory while it is shifted. Subpixel shifts are applied by linear interpolation along X and
+    then along Y, for all frames of a block at once
+    :param numpy.ndarray movie_xyt: 3D, format XYT
+    :param numpy.ndarray shifts: 2D, first row shifts along X, second row shifts along Y, one column per frame
+    :param bool subpixel: if False, shifts are rounded to integers and the shifted movie has the dtype of
+    <movie_xyt>, else it has the floating point dtype <dtype>
+    :param dtype: see <subpixel>
+    :param int n_threads: number of threads that shift blocks of frames in parallel (numpy releases the GIL)
+    :rtype: numpy.ndarray
+    """
+
+    n_frames = movie_xyt.shape[2]
+
+    if subpixel:
+        integer_shifts = np.floor(shifts[:2]).astype(int)
+        fractions = (shifts[:2] - integer_shifts).astype(dtype)
+        shifted = np.empty(movie_xyt.shape, dtype=dtype)
+    else:
+        integer_shifts = np.round(shifts[:2]).astype(int)
+        shifted = np.empty_like(movie_xyt)
+
+    def shift_block(block_slice):
+
+        block_txy = movie_xyt[:, :, block_slice].transpose(2, 0, 1).astype(shifted.dtype, order="C")
+        shifted_block_txy = np.empty_like(block_txy)
+        for frame_ind, frame in zip(range(n_frames)[block_slice], block_txy):
+            _roll_frame_into(shifted_block_txy[frame_ind - block_slice.start], frame,
+                             integer_shifts[0, frame_ind], integer_shifts[1, frame_ind])
+
+        if subpixel:
+            # shifting by the fraction f: shifted[x] = (1 - f) * frame[x] + f * frame[x - 1]
+            for axis, fractions_axis in ((1, fractions[0]), (2, fractions[1])):
+                f = fractions_axis[block_slice][:, np.newaxis, np.newaxis]
+                shifted_block_txy = (1 - f) * shifted_block_txy + f * np.roll(shifted_block_txy, 1, axis=axis)
+
+        shifted[:, :, block_slice] = shifted_block_txy.transpose(1, 2, 0)
+
+    block_slices = [slice(block_start, min(block_start + FRAMES_PER_BLOCK, n_frames))
+                    for block_start in range(0, n_frames, FRAMES_PER_BLOCK)]
+
+    if n_threads > 1 and len(block_slices) > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            # list() raises exceptions of threads, if any
+            list(executor.map(shift_block, block_slices))
+    else:
+        for block_slice in block_slices:
+            shift_block(block_slice)
+
+    return shifted
+
+
+def correct_movement(movie_xyt, flags, raw_data_filename=None, n_threads=1, wavelength_index=None):
+    """
+    Correct movement depending on the flag "LE_MovementCorrection":
+    0: no correction
+    1: shifts are calculated using <register_frames_phase_correlation> and applied
+    2: as 1, and shifts are written to the .moveList file of the animal (see <get_movement_list_path>), replacing
+    those of the current measurement
+    3: shifts are read from the .moveList file of the animal. If it has none for the current measurement, they are
+    calculated as for 1
+    If the flag "LE_MovementShiftsSidecar" is True, calculated shifts are stored in a file next to the raw data file
+    <raw_data_filename> and are read from it instead of being calculated again, when the same data is corrected
+    again. Shifts are applied with <apply_shifts>, with subpixel precision if the flag "LE_MovementSubpixel" is True,
+    else they are rounded to integers
+    :param numpy.ndarray movie_xyt: 3D, format XYT
+    :param FlagsManager flags:
+    :param str|pathlib.Path raw_data_filename: path of the raw data file <movie_xyt> was read from
+    :param int n_threads: number of threads used for applying shifts
+    :param int wavelength_index: for dual wavelength data, 0 or 1 depending on the wavelength of <movie_xyt>, so that
+    the shifts of both wavelengths are stored separately in the .moveList file (see <read_movement_list>).
+    None for single wavelength data
+    :return: movement corrected movie, <movie_xyt> itself if it is not corrected
+    :rtype: numpy.ndarray
+    """
+
+    movement_correction = flags["LE_MovementCorrection"]
+    if movement_correction == 0:
+        return movie_xyt
+
+    subpixel = flags["LE_MovementSubpixel"]
+    move_file = get_movement_list_path(flags)
+    measu = flags["STG_Measu"]
+
+    shifts = None
+    if movement_correction == 3:
+        shifts = read_movement_list(
+            move_file=move_file, measu=measu, n_frames=movie_xyt.shape[2], wavelength_index=wavelength_index)
+        if shifts is None:
+            logging.getLogger("VIEW").warning(
+                f"No movement values found for measurement {measu} in {move_file}. Calculating them instead")
+        elif shifts.shape[1] != movie_xyt.shape[2]:
+            logging.getLogger("VIEW").warning(
+                f"Number of movement values for measurement {measu} in {move_file} ({shifts.shape[1]}) "
+                f"does not match the number of frames ({movie_xyt.shape[2]}). Calculating them instead")
+            shifts = None
+
+    if shifts is None:
+
+        shifts_calculated = False
+        sidecar_path = None
+        if flags["LE_MovementShiftsSidecar"] and raw_data_filename is not None:
+            sidecar_path = get_shifts_sidecar_path(raw_data_filename)
+            registration_key = get_registration_key(movie_xyt)
+            shifts = read_shifts_sidecar(sidecar_path, registration_key)
+            if shifts is not None:
+                logging.getLogger("VIEW").info(f"Read shifts from {sidecar_path}")
+
+        if shifts is None:
+            logging.getLogger("VIEW").info("Calculating movement using phase correlation")
+            # rounded as written to .moveList files, so that using shifts read from them gives the same results
+            shifts = register_frames_phase_correlation(movie_xyt).round(2)
+            shifts_calculated = True
+
+            if sidecar_path is not None:
+                write_shifts_sidecar(sidecar_path, registration_key, shifts)
+
+        if not subpixel:
+            # integer shifts are applied and written to .moveList files, which IDL reads as integers
+            shifts = shifts.round().astype(int)
+
+        if movement_correction == 2:
+            # shifts read from the sidecar file are written only if the .moveList file does not contain them already
+            written_shifts = None if shifts_calculated else read_movement_list(
+                move_file=move_file, measu=measu, n_frames=movie_xyt.shape[2], wavelength_index=wavelength_index)
+            if written_shifts is None or written_shifts.shape != shifts.shape \
+                    or not np.allclose(written_shifts, shifts, equal_nan=True):
+                logging.getLogger("VIEW").info(f"Writing movement values to {move_file}")
+                write_movement_list(
+                    move_file=move_file, measu=measu, movement_list=shifts, wavelength_index=wavelength_index)
+
+    return apply_shifts(movie_xyt, shifts, subpixel=subpixel, dtype=flags.get_float_dtype(), n_threads=n_threads)
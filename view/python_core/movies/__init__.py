@@ -12,7 +12,9 @@ from .rotate import get_frame_rotator
 from .colorizer import get_colorizer_3D
 from .data_to_01 import get_normalizer
 from .excluder import Excluder3D
+from .render import render_frames_in_order
 import logging
+import os
 
 
 class MovieExporter(object):
@@ -69,6 +71,8 @@ class MovieExporter(object):
 
         self.writer = get_writer(flags)
 
+        self.render_threads = flags["mv_RenderThreads"] if flags["mv_RenderThreads"] > 0 else os.cpu_count()
+
     def preprocess(self, data: np.ndarray):
 
         time_filtered_data = self.temporal_processor.filter(data)
@@ -94,16 +98,29 @@ class MovieExporter(object):
 
         return self.frame_rotater.transform(frame_data)
 
-    def add_borders_annotations_to_frame(self, frame_data, frame_number, static_frame):
+    def get_static_overlay(self, data_to_01_mapper, data_frame_shape):
+        """
+        Render borders, colorbar, labels and outlines of regions of interest, which are the same for all frames,
+        into a static overlay (see view.python_core.movies.static_border.StaticOverlay)
+        :param data_to_01_mapper: see view.python_core.movies.data_to_01
+        :param tuple data_frame_shape: shape of frames of colorized data, format X, Y, Color
+        """
+
+        roi_overlay_colors, roi_overlay_mask = self.roi_marker.get_overlay(data_frame_shape)
+
+        return self.border_annotations_adder.get_static_overlay(
+            data_to_01_mapper=data_to_01_mapper,
+            data_overlay_colors=self.rotate_frame(roi_overlay_colors),
+            data_overlay_mask=self.rotate_frame(roi_overlay_mask),
+            dtype=self.colorizer.dtype)
 
-        return self.border_annotations_adder.add(frame_data, frame_number, static_frame)
+    def add_dynamic_annotations_to_frame(self, frame_data, frame_number):
 
-    def write_to_file(self, data_numpy_list, full_filename_without_extension):
+        return self.border_annotations_adder.add_dynamic_annotations(frame_data, frame_number)
 
-        return self.writer.write(data_numpy_list, self.data_sampling_period, full_filename_without_extension)
+    def write_to_file(self, frames, n_frames, full_filename_without_extension):
 
-    def add_rois(self, frame_data):
-        return self.roi_marker.draw(frame_data)
+        return self.writer.write(frames, n_frames, self.data_sampling_period, full_filename_without_extension)
 
 
 def export_movie(flags, p1, full_filename_without_extension):
@@ -114,30 +131,31 @@ def export_movie(flags, p1, full_filename_without_extension):
 
     data_to_01_mapper = movie_exporter.get_normalizer(preprocessed_data)
 
-    static_frame = movie_exporter.border_annotations_adder.static_border_adder.get_static_frame(data_to_01_mapper)
-
     colorized_data = movie_exporter.colorize(preprocessed_data, data_to_01_mapper)
 
-    finalized_frame_data_list = []
-    for frame_number in range(first_frame_retained, last_frame_retained + 1):
+    # colorized data is uint8 RGBA
+    static_overlay = movie_exporter.get_static_overlay(
+        data_to_01_mapper=data_to_01_mapper,
+        data_frame_shape=colorized_data.shape[:2] + colorized_data.shape[3:])
+
+    def render_frame(frame_number):
 
         frame_data = colorized_data[:, :, frame_number - first_frame_retained, :]
 
-        frame_data_with_rois = movie_exporter.add_rois(frame_data)
+        rotated_frame_data = movie_exporter.rotate_frame(frame_data)
 
-        rotated_frame_data = movie_exporter.rotate_frame(frame_data_with_rois)
+        frame_data_with_overlay = static_overlay.composite(rotated_frame_data)
 
-        finalized_frame_data = movie_exporter.add_borders_annotations_to_frame(rotated_frame_data,
-                                                                               frame_number,
-                                                                               static_frame)
+        return movie_exporter.add_dynamic_annotations_to_frame(frame_data_with_overlay, frame_number)
 
-        finalized_frame_data_list.append(finalized_frame_data)
+    # frames are rendered in parallel while the writer consumes them in order, so that finalized frames of the
+    # whole movie are never held in memory together
+    finalized_frames = render_frames_in_order(render_frame=render_frame,
+                                              frame_numbers=range(first_frame_retained, last_frame_retained + 1),
+                                              n_threads=movie_exporter.render_threads)
 
     logging.getLogger("VIEW").info(f"mv_individualScale set to:{flags['mv_individualScale']}. Minimum and maximum are: "
                  f"{data_to_01_mapper.get_data_limits()}")
-    op_filename = movie_exporter.write_to_file(finalized_frame_data_list, full_filename_without_extension)
+    op_filename = movie_exporter.write_to_file(finalized_frames, last_frame_retained - first_frame_retained + 1,
+                                               full_filename_without_extension)
     return op_filename
-
-
-
-
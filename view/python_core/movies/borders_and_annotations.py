@@ -2,7 +2,8 @@ from view.python_core.utils.colors import mpl_color_to_PIL
 from .mark_stimulus import get_stimulus_marker
 from .frame_time import get_time_string_adder
 from .static_border import get_static_border_adder_3D
-from view.python_core.utils.pil_helpers import numpy_to_pil_image, pil_image_to_numpy
+from PIL import Image
+import numpy as np
 from view.python_core.utils.fonts import resolve_font_file, get_maximum_font_size_by_width
 
 
@@ -66,33 +67,32 @@ class BordersAndAnnotations(object):
             font_size=font_size_suggestion
         )
 
-    def add(self, frame_data, frame_number, static_frame):
-
-        frame_data_with_border = self.static_border_adder.composite(frame_data, static_frame)
+    def add_dynamic_annotations(self, frame_data_uint8, frame_number):
+        """
+        Add annotations that change from frame to frame, i.e. frame time and stimulus marks. Everything else is part
+        of the static overlay (see <get_static_overlay>)
+        :param numpy.ndarray frame_data_uint8: format Y, X, Color (RGBA), uint8, origin at top left, see
+        view.python_core.movies.static_border.StaticOverlay.composite
+        :param int frame_number: frame number
+        :return: annotated frame, same format as <frame_data_uint8>
+        :rtype: numpy.ndarray
+        """
 
         frame_time = self.data_sampling_period * (frame_number - 1)
 
-        pil_image = numpy_to_pil_image(frame_data_with_border)
+        pil_image = Image.fromarray(frame_data_uint8)
 
         pil_image_with_time = self.time_string_adder.add(pil_image, frame_time)
 
         pil_image_with_time_stimulus = self.stimulus_marker.mark(pil_image_with_time, frame_time)
 
-        annotated_frame_data = pil_image_to_numpy(pil_image_with_time_stimulus)
-
-        return annotated_frame_data
-
-
-
-
-
-
-
-
-
-
-
-
-
+        return np.asarray(pil_image_with_time_stimulus)
 
+    def get_static_overlay(self, data_to_01_mapper, data_overlay_colors, data_overlay_mask, dtype):
+        """
+        see view.python_core.movies.static_border.StaticBorder.get_static_overlay
+        """
 
+        return self.static_border_adder.get_static_overlay(
+            data_to_01_mapper=data_to_01_mapper, data_overlay_colors=data_overlay_colors,
+            data_overlay_mask=data_overlay_mask, dtype=dtype)
@@ -1,27 +1,29 @@
+import numpy as np
 from view.python_core.flags import FlagsManager
 from .data_limits import get_data_limit_decider
 from .background import get_background_3D, get_background_2D
 from ..excluder import Excluder3D, Excluder2D
 from .threshold import get_thresholder_3D, get_thresholder_2D
 from .aux_funcs import stack_duplicate_frames, apply_colormaps_based_on_mask, \
-    resolve_thresholdOnValue
+    resolve_thresholdOnValue, ColormapLUT, apply_colormap_luts_based_on_mask
 
 
 class ColorizerWithoutThresholding(object):
 
-    def __init__(self, colormap):
+    def __init__(self, colormap, dtype=np.float64):
         super().__init__()
         self.colormap = colormap
+        self.dtype = dtype
 
     def colorize(self, data, data_to_01_mapper):
         scaled_data = data_to_01_mapper.normalize(data=data)
-        return self.colormap(scaled_data)
+        return self.colormap(scaled_data).astype(self.dtype, copy=False)
 
 
 class ColorizerWithThresholding(ColorizerWithoutThresholding):
 
-    def __init__(self, background, thresholder, colormap_inside):
-        super().__init__(colormap_inside)
+    def __init__(self, background, thresholder, colormap_inside, dtype=np.float64):
+        super().__init__(colormap_inside, dtype)
         self.thresholder = thresholder
         self.background_data = background.get_data_scaled()
         self.colormap_outside = background.get_colormap()
@@ -32,7 +34,44 @@ class ColorizerWithThresholding(ColorizerWithoutThresholding):
                                              data_for_inside_mask=scaled_data,
                                              data_for_outside_mask=self.background_data,
                                              colormap_inside_mask=self.colormap,
-                                             colormap_outside_mask=self.colormap_outside)
+                                             colormap_outside_mask=self.colormap_outside,
+                                             dtype=self.dtype)
+
+
+class LUTColorizerWithoutThresholding(object):
+    """
+    Same as ColorizerWithoutThresholding, but colors are looked up in a uint8 lookup table of the colormap (see
+    ColormapLUT) and returned as uint8 RGBA, which takes an eighth of the memory of float64 RGBA
+    """
+
+    def __init__(self, colormap, dtype=np.float64):
+        super().__init__()
+        self.colormap_lut = ColormapLUT(colormap, dtype)
+        self.dtype = dtype
+
+    def colorize(self, data, data_to_01_mapper):
+        scaled_data = data_to_01_mapper.normalize(data=data)
+        return self.colormap_lut(scaled_data)
+
+
+class LUTColorizerWithThresholding(LUTColorizerWithoutThresholding):
+    """
+    Same as ColorizerWithThresholding, returning uint8 RGBA (see LUTColorizerWithoutThresholding)
+    """
+
+    def __init__(self, background, thresholder, colormap_inside, dtype=np.float64):
+        super().__init__(colormap_inside, dtype)
+        self.thresholder = thresholder
+        self.background_data = background.get_data_scaled()
+        self.colormap_lut_outside = ColormapLUT(background.get_colormap(), dtype)
+
+    def colorize(self, data, data_to_01_mapper):
+        scaled_data = data_to_01_mapper.normalize(data=data)
+        return apply_colormap_luts_based_on_mask(mask=self.thresholder.get_mask(data),
+                                                 data_for_inside_mask=scaled_data,
+                                                 data_for_outside_mask=self.background_data,
+                                                 colormap_lut_inside_mask=self.colormap_lut,
+                                                 colormap_lut_outside_mask=self.colormap_lut_outside)
 
 
 def get_colorizer_3D(flags: FlagsManager, p1, colormap, excluder: Excluder3D, area_mask_2D_excluded):
@@ -43,9 +82,10 @@ def get_colorizer_3D(flags: FlagsManager, p1, colormap, excluder: Excluder3D, ar
                                                 thresholder=thresholder)
     background_obj = get_background_3D(flags=flags, p1=p1, excluder=excluder, data_limit_decider=data_limit_decider)
 
-    return ColorizerWithThresholding(background=background_obj,
-                                     thresholder=thresholder,
-                                     colormap_inside=colormap)
+    return LUTColorizerWithThresholding(background=background_obj,
+                                        thresholder=thresholder,
+                                        colormap_inside=colormap,
+                                        dtype=flags.get_float_dtype())
 
 
 def get_colorizer_2D(flags: FlagsManager, p1, colormap, bg_color,
@@ -61,7 +101,8 @@ def get_colorizer_2D(flags: FlagsManager, p1, colormap, bg_color,
 
     return ColorizerWithThresholding(background=background_obj,
                                      thresholder=thresholder,
-                                     colormap_inside=colormap)
+                                     colormap_inside=colormap,
+                                     dtype=flags.get_float_dtype())
 
 
 
@@ -3,7 +3,7 @@ import re
 
 
 def apply_colormaps_based_on_mask(mask, data_for_inside_mask, data_for_outside_mask,
-                                  colormap_inside_mask, colormap_outside_mask):
+                                  colormap_inside_mask, colormap_outside_mask, dtype=np.float64):
     """
     Returns the combination of applying two colormaps to two datasets on two mutually exclusive sets of pixels
     as follows. Applies <colormap_inside_mask> to <data_for_inside_mask> for pixels where <thresh_mask> is True and applies
@@ -13,6 +13,7 @@ def apply_colormaps_based_on_mask(mask, data_for_inside_mask, data_for_outside_m
     :param data_for_outside_mask: float numpy.ndarray, having the same shape as thresh_mask
     :param colormap_inside_mask: matplotlib colormap
     :param colormap_outside_mask: matplotlib colormap
+    :param dtype: numpy floating point data type of the returned array
     :return: numpy.ndarray, having the same shape as thresh_mask
     """
     assert data_for_inside_mask.shape == data_for_outside_mask.shape, f"data_within_mask and data_outside_mask " \
@@ -24,7 +25,7 @@ def apply_colormaps_based_on_mask(mask, data_for_inside_mask, data_for_outside_m
                                                         f"does not match shape of data given " \
                                                         f"({data_for_inside_mask.shape})"
 
-    data_colorized = np.empty(list(data_for_inside_mask.shape) + [4])
+    data_colorized = np.empty(list(data_for_inside_mask.shape) + [4], dtype=dtype)
 
     data_colorized[mask, :] = colormap_inside_mask(data_for_inside_mask[mask])
     data_colorized[~mask, :] = colormap_outside_mask(data_for_outside_mask[~mask])
@@ -40,6 +41,90 @@ def apply_colormaps_based_on_mask(mask, data_for_inside_mask, data_for_outside_m
     # return data_colorized_inside + data_colorized_outside
 
 
+class ColormapLUT(object):
+    """
+    Lookup table of the colors of a matplotlib colormap as uint8 RGBA. Data scaled to [0, 1] is quantized to
+    the entries of the colormap exactly as matplotlib does it, so that the colors looked up are the colors
+    the colormap returns, converted to uint8
+    """
+
+    def __init__(self, colormap, dtype=np.float64):
+        """
+        :param matplotlib.colors.Colormap colormap:
+        :param dtype: numpy floating point data type the colors of the colormap are converted to before being
+        converted to uint8, as floating point colors would be
+        """
+
+        super().__init__()
+        self.n_colors = colormap.N
+
+        # entries 0 to N - 1 are the colors of the colormap, followed by the colors used for data below 0, data
+        # above 1 and NaN
+        colors = np.concatenate([colormap(np.arange(self.n_colors)), colormap(np.array([-1.0, 2.0, np.nan]))])
+
+        # truncated, as floating point colors are when converted to uint8 (see numpy_to_pil_image)
+        self.lut = np.array(colors.astype(dtype) * 255, dtype=np.uint8)
+
+    def get_indices(self, data_01):
+        """
+        Indices of the entries of <self.lut> for the values of <data_01>, see matplotlib.colors.Colormap.__call__
+        :param numpy.ndarray data_01: floating point data, scaled to [0, 1]
+        :rtype: numpy.ndarray
+        :return: same shape as <data_01>
+        """
+
+        data_scaled = np.multiply(data_01, self.n_colors)
+        # 1 (N after scaling) is not out of range
+        data_scaled[data_scaled == self.n_colors] = self.n_colors - 1
+
+        with np.errstate(invalid="ignore"):
+            indices = data_scaled.astype(np.int32)
+        indices[data_scaled < 0] = self.n_colors
+        indices[data_scaled >= self.n_colors] = self.n_colors + 1
+        indices[np.isnan(data_scaled)] = self.n_colors + 2
+
+        return indices
+
+    def __call__(self, data_01):
+        """
+        Colorize <data_01>
+        :param numpy.ndarray data_01: floating point data, scaled to [0, 1]
+        :rtype: numpy.ndarray
+        :return: uint8 RGBA, of shape data_01.shape + (4,)
+        """
+
+        return np.take(self.lut, self.get_indices(data_01), axis=0)
+
+
+def apply_colormap_luts_based_on_mask(mask, data_for_inside_mask, data_for_outside_mask,
+                                      colormap_lut_inside_mask, colormap_lut_outside_mask):
+    """
+    Same as <apply_colormaps_based_on_mask>, but using lookup tables of colormaps and returning uint8 RGBA. The two
+    lookup tables are concatenated, so that colors are looked up for all pixels with a single np.take
+    :param mask: boolean numpy.ndarray
+    :param data_for_inside_mask: float numpy.ndarray, having the same shape as thresh_mask
+    :param data_for_outside_mask: float numpy.ndarray, having the same shape as thresh_mask
+    :param ColormapLUT colormap_lut_inside_mask:
+    :param ColormapLUT colormap_lut_outside_mask:
+    :return: uint8 numpy.ndarray, of shape mask.shape + (4,)
+    """
+    assert data_for_inside_mask.shape == data_for_outside_mask.shape, \
+        f"data_within_mask and data_outside_mask must have the same shape. Given: {data_for_inside_mask.shape} " \
+        f"and {data_for_outside_mask.shape}"
+
+    assert mask.shape == data_for_inside_mask.shape, f"The shape of given thresh_mask ({mask.shape}) " \
+                                                     f"does not match shape of data given " \
+                                                     f"({data_for_inside_mask.shape})"
+
+    lut_combined = np.concatenate([colormap_lut_inside_mask.lut, colormap_lut_outside_mask.lut])
+
+    indices = colormap_lut_outside_mask.get_indices(data_for_outside_mask)
+    indices += len(colormap_lut_inside_mask.lut)
+    indices[mask] = colormap_lut_inside_mask.get_indices(data_for_inside_mask[mask])
+
+    return np.take(lut_combined, indices, axis=0)
+
+
 def stack_duplicate_frames(frame, depth):
     """
     Retuns a numpy.ndarray formed by stacking <frame> along the third axis
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import itertools
+
+
+# number of frames rendered ahead of the frame being written, per rendering thread. Limits the memory used by frames
+# waiting to be written
+FRAMES_AHEAD_PER_THREAD = 4
+
+
+def render_frames_in_order(render_frame, frame_numbers, n_threads):
+    """
+    Render frames in <n_threads> threads and yield them in the order of <frame_numbers>, as soon as all frames before
+    them have been yielded. At most FRAMES_AHEAD_PER_THREAD * <n_threads> frames are rendered ahead of the frame
+    yielded last, so that rendering does not run away from a slower consumer, e.g. a movie writer
+    :param Callable render_frame: called with a frame number, returns the rendered frame. Called concurrently from
+    several threads, so it must not modify shared state
+    :param Iterable frame_numbers: numbers of the frames to render
+    :param int n_threads: number of threads rendering frames. If 1, frames are rendered in the calling thread
+    :return: generator of rendered frames
+    """
+
+    if n_threads <= 1:
+        for frame_number in frame_numbers:
+            yield render_frame(frame_number)
+        return
+
+    frame_numbers = iter(frame_numbers)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+
+        # futures of frames being rendered or waiting to be yielded, in the order in which they are to be yielded
+        pending = collections.deque(
+            executor.submit(render_frame, frame_number)
+            for frame_number in itertools.islice(frame_numbers, FRAMES_AHEAD_PER_THREAD * n_threads))
+
+        try:
+            while pending:
+                rendered_frame = pending.popleft().result()
+
+                # keep threads busy while the consumer processes the frame
+                for frame_number in itertools.islice(frame_numbers, 1):
+                    pending.append(executor.submit(render_frame, frame_number))
+
+                yield rendered_frame
+        finally:
+            # when rendering a frame failed or the consumer stopped early, frames not started are not rendered
+            for future in pending:
+                future.cancel()
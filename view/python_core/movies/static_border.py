@@ -46,6 +46,75 @@ class StaticBorder(object):
 
         return new_frame
 
+    def get_static_overlay(self, data_to_01_mapper, data_overlay_colors, data_overlay_mask, dtype=np.float64):
+        """
+        Returns the static frame (see <get_static_frame>) together with colors drawn onto data, e.g. outlines of
+        regions of interest, as a StaticOverlay
+        :param data_to_01_mapper: see <get_static_frame>
+        :param numpy.ndarray data_overlay_colors: see StaticOverlay
+        :param numpy.ndarray data_overlay_mask: see StaticOverlay
+        :param dtype: see StaticOverlay
+        :rtype: StaticOverlay
+        """
+
+        return StaticOverlay(static_frame=self.get_static_frame(data_to_01_mapper),
+                             data_origin=(self.mv_xgap_left, self.mv_ygap),
+                             data_overlay_colors=data_overlay_colors, data_overlay_mask=data_overlay_mask,
+                             dtype=dtype)
+
+
+class StaticOverlay(object):
+    """
+    Parts of movie frames that are the same in all frames, i.e., borders with colorbar and labels and colors drawn
+    onto data, like outlines of regions of interest. They are rendered once per movie into a uint8 RGBA image in the
+    format of PIL images and movie writers (Y, X, Color with origin at top left), with a mask of the pixels they cover.
+    Data of each frame is then composited with it with one masked copy, without being converted to floating point
+    """
+
+    def __init__(self, static_frame, data_origin, data_overlay_colors, data_overlay_mask, dtype=np.float64):
+        """
+        :param numpy.ndarray static_frame: format X, Y, Color (RGBA), float in range [0, 1], origin at bottom left
+        :param tuple data_origin: X and Y index of the first pixel of data in <static_frame>
+        :param numpy.ndarray data_overlay_colors: format X, Y, Color (RGBA), float in range [0, 1], colors drawn onto
+        data, of the size of data
+        :param numpy.ndarray data_overlay_mask: format X, Y, boolean, True where <data_overlay_colors> are drawn
+        :param dtype: numpy floating point data type of frames. Colors are converted to it before being converted to
+        uint8, as they would be when drawn onto frames
+        """
+
+        super().__init__()
+
+        self.data_slices = tuple(slice(start, start + size) for start, size in zip(data_origin, data_overlay_mask.shape))
+
+        overlay = static_frame.astype(dtype, copy=True)
+        overlay[self.data_slices][data_overlay_mask] = data_overlay_colors[data_overlay_mask]
+
+        self.overlay_uint8 = np.array(numpy_to_pil_image(overlay))
+
+        # pixels of data not covered by the overlay, format X, Y, Color
+        self.data_uncovered_mask = ~data_overlay_mask[:, :, np.newaxis]
+
+    def composite(self, frame_data_uint8):
+        """
+        Composite data with the overlay
+        :param numpy.ndarray frame_data_uint8: format X, Y, Color (RGBA), uint8, origin at bottom left, e.g. from
+        view.python_core.movies.colorizer.LUTColorizerWithThresholding
+        :return: format Y, X, Color (RGBA), uint8, origin at top left
+        :rtype: numpy.ndarray
+        """
+
+        data_shape = frame_data_uint8.shape[:2]
+        assert data_shape == self.data_uncovered_mask.shape[:2], \
+            f"Frame data of shape {self.data_uncovered_mask.shape[:2]} expected, got {data_shape}"
+
+        new_frame = self.overlay_uint8.copy()
+
+        # view of <new_frame> in format X, Y, Color with origin at bottom left
+        new_frame_XY = np.flip(new_frame, axis=0).swapaxes(0, 1)
+        np.copyto(new_frame_XY[self.data_slices], frame_data_uint8, where=self.data_uncovered_mask)
+
+        return new_frame
+
 
 class StaticBorderWithColorbar(StaticBorder):
 
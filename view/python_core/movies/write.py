@@ -1,5 +1,6 @@
 import pandas as pd
-from moviepy.editor import ImageSequenceClip
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+import itertools
 import multiprocessing
 import logging
 import pathlib as pl
@@ -16,7 +17,29 @@ def get_extension_from_codec(codec):
     return codec_map[codec]
 
 
+def peek_first_frame(frames):
+    """
+    Get the first frame of <frames> without losing it, e.g. to learn the frame size before writing starts
+    :param Iterable frames: frames, e.g. a generator
+    :return: first_frame, frames
+    first_frame: the first frame
+    frames: iterator over all frames, including the first
+    """
+
+    frames = iter(frames)
+    try:
+        first_frame = next(frames)
+    except StopIteration:
+        raise ValueError("Error saving movie! There are no frames to save.")
+
+    return first_frame, itertools.chain([first_frame], frames)
+
+
 class MovieWriter(object):
+    """
+    Writes frames into a movie file as they are rendered, by piping them one by one to an ffmpeg subprocess, so that
+    only one frame needs to be held in memory at a time
+    """
 
     def __init__(self, flags):
 
@@ -25,31 +48,19 @@ class MovieWriter(object):
         self.bitrate = flags["mv_bitrate"]
         self.codec = flags["mv_exportFormat"]
 
-    def get_clip(self, data_numpy_list, data_sampling_period):
+    def get_fps(self, data_sampling_period):
 
         data_fps = pd.Timedelta("1s") / data_sampling_period
-        video_fps = self.speed_factor * data_fps
-
-        data_numpy_list_for_moviepy = []
-
-        for frame_data_numpy in data_numpy_list:
-
-            # need to swap axes as our axis order is XY and moviepy expects YX
-            frame_data_numpy_swapped = frame_data_numpy.swapaxes(0, 1)
-
-            # need to convert it to 8 bit from float
-            frame_data_numpy_swapped_uint8 = np.array(frame_data_numpy_swapped * 255, dtype=np.uint8)
-
-            # flip Y since origin in moviepy is top left
-            frame_data_for_clip = np.flip(frame_data_numpy_swapped_uint8, axis=0)
-
-            data_numpy_list_for_moviepy.append(frame_data_for_clip)
+        return self.speed_factor * data_fps
 
-        clip = ImageSequenceClip(data_numpy_list_for_moviepy, fps=video_fps)
-
-        return clip
-
-    def write(self, data_numpy_list, data_sampling_period, full_filename_without_extension):
+    def write(self, frames, n_frames, data_sampling_period, full_filename_without_extension):
+        """
+        :param Iterable frames: frames in the format Y, X, Color (RGBA), uint8, origin at top left, e.g. a generator
+        :param int n_frames: number of frames in <frames>
+        :param pandas.Timedelta data_sampling_period: period between frames of data
+        :param str full_filename_without_extension: path of the movie file, without extension
+        :return: path of the file written
+        """
 
         if data_sampling_period == pd.Timedelta(0):
 
@@ -58,7 +69,7 @@ class MovieWriter(object):
                              "Tip: You can save the movie as a TIFF-Stack by setting the flags 'mv_exportFormat' in "
                              "the tab 'movie' to 'stack_tif' and view the resulting TIFF-Stack in ImageJ")
 
-        clip = self.get_clip(data_numpy_list, data_sampling_period)
+        first_frame, frames = peek_first_frame(frames)
 
         out_name = f"{full_filename_without_extension}{get_extension_from_codec(self.codec)}"
 
@@ -66,15 +77,23 @@ class MovieWriter(object):
         if self.codec == "libx264":
             ffmpeg_params = ["-crf", '1']
 
-        clip.write_videofile(filename=out_name,
-                             codec=self.codec,
-                             ffmpeg_params=ffmpeg_params,
-                             preset="veryslow",
-                             threads=multiprocessing.cpu_count() - 1,
-                             logger="bar",
-                             bitrate=self.bitrate
-                             )
-        logging.getLogger("VIEW").info(f"Wrote a movie: {out_name}")
+        # alpha is dropped, as the movie is written without mask
+        movie_writer = FFMPEG_VideoWriter(filename=out_name,
+                                          size=(first_frame.shape[1], first_frame.shape[0]),  # (width, height)
+                                          fps=self.get_fps(data_sampling_period),
+                                          codec=self.codec,
+                                          preset="veryslow",
+                                          bitrate=self.bitrate,
+                                          threads=multiprocessing.cpu_count() - 1,
+                                          ffmpeg_params=ffmpeg_params
+                                          )
+        try:
+            for frame_data_numpy in frames:
+                movie_writer.write_frame(np.ascontiguousarray(frame_data_numpy[:, :, :3]))
+        finally:
+            movie_writer.close()
+
+        logging.getLogger("VIEW").info(f"Wrote a movie with {n_frames} frames: {out_name}")
         return out_name
 
 
@@ -84,21 +103,15 @@ class MovieWriterIndividualTif(MovieWriter):
 
         super().__init__(flags)
 
-    def write(self, data_numpy_list, data_sampling_period, full_filename_without_extension):
-
-        if data_sampling_period == pd.Timedelta(0):
-            data_sampling_period = pd.Timedelta("1s")  # fake value, as it will not be written
-
-        clip = self.get_clip(data_numpy_list, data_sampling_period)
+    def write(self, frames, n_frames, data_sampling_period, full_filename_without_extension):
 
         out_dir_path = pl.Path(full_filename_without_extension)
         if not out_dir_path.is_dir():
             out_dir_path.mkdir()
 
-        filename_format = f"{str(out_dir_path / out_dir_path.name)}%03d.tif"
-
-        clip.write_images_sequence(nameformat=filename_format,
-                                   logger="bar")
+        for frame_index, frame_data_numpy in enumerate(frames):
+            tifffile.imwrite(out_dir_path / f"{out_dir_path.name}{frame_index:03d}.tif",
+                             data=frame_data_numpy)
         logging.getLogger("VIEW").info(f"Wrote a sequence of images to the folder {str(out_dir_path)}")
 
         return out_dir_path
@@ -110,27 +123,16 @@ class MovieWriterStackTif(object):
 
         super().__init__()
 
-    def write(self, data_numpy_list, data_sampling_period, full_filename_without_extension):
-
-        # each image in data_numpy_list is of the format X,Y,Color.
-        # Stacking them to get 4D data in the format Z, X, Y, Color
-        data_4D = np.stack(data_numpy_list, axis=0)
-
-        # Flip Y since origin in tif is top left
-        data_4D_Y_flipped = np.flip(data_4D, axis=2)
-
-        # convert to uint8
-        data_4D_uint8 = np.array(data_4D_Y_flipped * 255, dtype=np.uint8)
-
-        # convert to format Z, Y, X, color
-        data_4D_XY_swapped = data_4D_uint8.swapaxes(1, 2)
+    def write(self, frames, n_frames, data_sampling_period, full_filename_without_extension):
 
-        # convert to TZCYXS format required by imagej
-        data_4D_formatted = data_4D_XY_swapped[np.newaxis, :, np.newaxis, :, :]
+        first_frame, frames = peek_first_frame(frames)
 
+        # each frame is of the format Y, X, Color. Frames are written one after the other as a stack in the
+        # TZCYXS format required by imagej, with the stack along Z
         outfile_path = f"{full_filename_without_extension}.tif"
 
-        tifffile.imwrite(outfile_path, data=data_4D_formatted, imagej=True)
+        tifffile.imwrite(outfile_path, data=frames, shape=(1, n_frames, 1) + first_frame.shape, dtype=np.uint8,
+                         imagej=True)
         logging.getLogger("VIEW").info(f"Wrote a tiff stack to {str(outfile_path)}")
 
         return outfile_path
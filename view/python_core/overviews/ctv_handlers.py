@@ -1,7 +1,16 @@
-from ..ctvs import get_ctv_function
+from ..ctvs import get_ctv_function, get_array_mode_ctv_function
 import numpy as np
 import pandas as pd
 from ..flags import FlagsManager
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+import copy
+import os
+import pickle
+import threading
+import uuid
+import weakref
 
 
 class PixelWiseCTVHandler(object):
@@ -16,6 +25,7 @@ class PixelWiseCTVHandler(object):
             ctv_method_file = None
 
         self.ctv_method = get_ctv_function(flags["CTV_Method"], ctv_method_file)
+        self.array_mode_ctv_method = get_array_mode_ctv_function(self.ctv_method)
         self.ctv_firstframe = flags["CTV_firstframe"]
         self.ctv_lastframe = flags["CTV_lastframe"]
         self.sampling_period = p1.metadata.trial_ticks
@@ -37,14 +47,21 @@ class PixelWiseCTVHandler(object):
         self.flags = flags
         self.p1 = p1
 
+    # maximum number of pixels whose time traces are passed together to array mode CTVs
+    array_mode_block_size = 65536
+
     def apply(self, data):
         """
-        Apply the CTV specified in self.flags during initialization pixel wise to generate overview frames
+        Apply the CTV specified in self.flags during initialization pixel wise to generate overview frames.
+        CTVs with an array mode version are applied to blocks of pixels at once, others to one pixel after another
         :param numpy.ndarray data: 3D, XYT
         :rtype: numpy.ndarray
         :return: dimensions: features-X-Y
         """
 
+        if self.array_mode_ctv_method is not None:
+            return self.apply_array_mode(data)
+
         result_frame = None
 
         for x_ind, y_ind in np.ndindex(*data.shape[:2]):
@@ -56,6 +73,52 @@ class PixelWiseCTVHandler(object):
 
         return result_frame  # dimensions: features-X-Y
 
+    def apply_array_mode(self, data):
+        """
+        Apply the array mode version of the CTV specified in self.flags during initialization to blocks of
+        entire rows of pixels (along Y) to generate overview frames
+        :param numpy.ndarray data: 3D, XYT
+        :rtype: numpy.ndarray
+        :return: dimensions: features-X-Y
+        """
+
+        size_x, size_y, n_frames = data.shape
+        block_size_x = max(1, self.array_mode_block_size // max(1, size_y))
+
+        result_frame = None
+
+        for x_start in range(0, size_x, block_size_x):
+
+            data_block = data[x_start: x_start + block_size_x]
+            block_shape = data_block.shape[:2]
+
+            features = self.apply_traces(np.reshape(data_block, (-1, n_frames)))
+            if result_frame is None:
+                result_frame = np.empty((features.shape[0], size_x, size_y))
+
+            result_frame[:, x_start: x_start + block_shape[0], :] = features.reshape((-1, *block_shape))
+
+        return result_frame  # dimensions: features-X-Y
+
+    def apply_traces(self, timetraces):
+        """
+        Apply the array mode version of the CTV specified in self.flags during initialization to many time traces
+        :param numpy.ndarray timetraces: 2D, one time trace per row
+        :rtype: numpy.ndarray
+        :return: dimensions: features-time traces
+        """
+
+        return self.array_mode_ctv_method(
+            time_traces=timetraces,
+            first_frame=self.ctv_firstframe,
+            last_frame=self.ctv_lastframe,
+            sampling_period=self.sampling_period,
+            stim_on_times=self.stim_on_times,
+            stim_off_times=self.stim_off_times,
+            stimulus_number=self.stimulus_number,
+            flags=self.flags,
+            p1=self.p1)
+
     def apply_pixel(self, timetrace):
 
         return self.ctv_method(
@@ -70,12 +133,197 @@ class PixelWiseCTVHandler(object):
             p1=self.p1)
 
 
+# (number of workers, concurrent.futures.ProcessPoolExecutor), reused by all ParallelPixelWiseCTVHandler objects
+_ctv_worker_pool = None
+
+# PixelWiseCTVHandler objects created in a worker process, with the ids of the corresponding
+# ParallelPixelWiseCTVHandler objects as keys
+_worker_ctv_handlers = OrderedDict()
+_worker_ctv_handlers_max_entries = 4
+
+# (weak reference to the data last passed to ParallelPixelWiseCTVHandler.apply, SharedMemory containing a copy of it),
+# so that data is copied only once when CTVs are applied to it for several stimuli
+_shared_ctv_data = None
+_shared_ctv_data_lock = threading.Lock()
+
+
+def get_ctv_worker_pool(n_workers):
+    """
+    Returns a pool of <n_workers> worker processes, which is created at the first call and reused as long as
+    <n_workers> does not change
+    :param int n_workers: number of worker processes
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+
+    global _ctv_worker_pool
+
+    if _ctv_worker_pool is None or _ctv_worker_pool[0] != n_workers:
+        if _ctv_worker_pool is not None:
+            _ctv_worker_pool[1].shutdown(wait=False)
+        _ctv_worker_pool = n_workers, ProcessPoolExecutor(max_workers=n_workers)
+
+    return _ctv_worker_pool[1]
+
+
+def _release_shared_memory(shared_memory):
+    """
+    Close and unlink <shared_memory>, if that has not happened yet
+    :param multiprocessing.shared_memory.SharedMemory shared_memory:
+    """
+
+    try:
+        shared_memory.close()
+        shared_memory.unlink()
+    except FileNotFoundError:  # already unlinked
+        pass
+
+
+def get_shared_ctv_data(data):
+    """
+    Returns a shared memory block containing a copy of <data>. The block is reused as long as the same array is
+    passed, e.g. when overviews are generated for several stimuli of a measurement, and is released when <data>
+    is garbage collected or a different array is passed. Data must therefore not be changed in place in between
+    :param numpy.ndarray data: 3D, XYT
+    :rtype: multiprocessing.shared_memory.SharedMemory
+    """
+
+    global _shared_ctv_data
+
+    with _shared_ctv_data_lock:
+
+        if _shared_ctv_data is not None:
+            data_ref, shared_memory = _shared_ctv_data
+            if data_ref() is data:
+                return shared_memory
+            _release_shared_memory(shared_memory)
+            _shared_ctv_data = None
+
+        shared_memory = SharedMemory(create=True, size=max(1, data.nbytes))
+        try:
+            shared_data = np.ndarray(data.shape, dtype=data.dtype, buffer=shared_memory.buf)
+            shared_data[:] = data
+            del shared_data
+        except BaseException:
+            _release_shared_memory(shared_memory)
+            raise
+
+        _shared_ctv_data = weakref.ref(data, lambda data_ref: _release_shared_memory(shared_memory)), shared_memory
+        # at interpreter exit at the latest
+        weakref.finalize(shared_memory, _release_shared_memory, shared_memory)
+
+        return shared_memory
+
+
+def _apply_ctv_to_shared_data_tile(handler_id, handler_args_memory_name, shared_memory_name, shape, dtype, tile):
+    """
+    Runs in worker processes. Applies a CTV to the tile <tile> of the XYT data in the shared memory block with name
+    <shared_memory_name>, using a PixelWiseCTVHandler that is created at the first call with <handler_id> and reused
+    afterwards. It is created from flags and p1 pickled into the shared memory block with name
+    <handler_args_memory_name>, which is read only then, so that they are not sent with every tile
+    :return: dimensions: features-X-Y
+    """
+
+    ctv_handler = _worker_ctv_handlers.get(handler_id)
+    if ctv_handler is None:
+        handler_args_memory = SharedMemory(name=handler_args_memory_name)
+        try:
+            flags, p1 = pickle.loads(handler_args_memory.buf)
+        finally:
+            handler_args_memory.close()
+        ctv_handler = PixelWiseCTVHandler(flags=flags, p1=p1)
+        _worker_ctv_handlers[handler_id] = ctv_handler
+        if len(_worker_ctv_handlers) > _worker_ctv_handlers_max_entries:
+            _worker_ctv_handlers.popitem(last=False)
+
+    shared_memory = SharedMemory(name=shared_memory_name)
+    try:
+        return ctv_handler.apply(np.ndarray(shape, dtype=dtype, buffer=shared_memory.buf)[tile])
+    finally:
+        try:
+            shared_memory.close()
+        except BufferError:  # data still referenced by the traceback of an exception, released with it
+            pass
+
+
+class ParallelPixelWiseCTVHandler(PixelWiseCTVHandler):
+
+    def __init__(self, flags: FlagsManager, p1):
+        """
+        Applies CTVs pixel wise like PixelWiseCTVHandler, but to tiles of the XY plane in parallel in worker
+        processes. Data is passed to workers through shared memory (see <get_shared_ctv_data>) and the pool of workers
+        is reused as long as the number of workers specified by the flag "SO_ParallelWorkers" does not change
+        """
+
+        super().__init__(flags=flags, p1=p1)
+
+        self.n_workers = flags["SO_ParallelWorkers"] if flags["SO_ParallelWorkers"] > 0 else os.cpu_count()
+        self.handler_id = uuid.uuid4().hex
+
+        # workers create their own PixelWiseCTVHandler, as custom CTVs cannot be pickled. Movie data is not needed
+        # for that and is not sent to them. Flags and p1 are pickled once into shared memory, from which each worker
+        # reads them once
+        p1_without_data = copy.copy(p1)
+        for data_attr in ("raw1", "raw2", "sig1"):
+            setattr(p1_without_data, data_attr, None)
+        # worker processes cannot be pickled and are not needed
+        p1_without_data.bleach_correction_worker_pool = None
+        handler_args = pickle.dumps((flags, p1_without_data), protocol=pickle.HIGHEST_PROTOCOL)
+        self.handler_args_memory = SharedMemory(create=True, size=len(handler_args))
+        self.handler_args_memory.buf[:len(handler_args)] = handler_args
+        weakref.finalize(self, _release_shared_memory, self.handler_args_memory)
+
+    def apply(self, data):
+        """
+        Apply the CTV specified in self.flags during initialization pixel wise to generate overview frames
+        :param numpy.ndarray data: 3D, XYT
+        :rtype: numpy.ndarray
+        :return: dimensions: features-X-Y
+        """
+
+        size_x, size_y = data.shape[:2]
+        # about four tiles per worker, so that workers stay busy when some tiles take longer than others
+        tile_size = max(1, int(np.ceil(np.sqrt(size_x * size_y / (4 * self.n_workers)))))
+
+        worker_pool = get_ctv_worker_pool(self.n_workers)
+        shared_memory = get_shared_ctv_data(data)
+        tiles_futures = []
+        try:
+            for x_start in range(0, size_x, tile_size):
+                for y_start in range(0, size_y, tile_size):
+                    tile = (slice(x_start, x_start + tile_size), slice(y_start, y_start + tile_size))
+                    future = worker_pool.submit(
+                        _apply_ctv_to_shared_data_tile, self.handler_id, self.handler_args_memory.name,
+                        shared_memory.name, data.shape, data.dtype, tile)
+                    tiles_futures.append((tile, future))
+
+            result_frame = None
+            for tile, future in tiles_futures:
+                features = future.result()
+                if result_frame is None:
+                    result_frame = np.empty((features.shape[0], size_x, size_y))
+
+                result_frame[(slice(None),) + tile] = features
+
+        finally:
+            # after an error, tiles that are already being processed need to finish before shared memory can be
+            # released
+            for tile, future in tiles_futures:
+                future.cancel()
+            wait([future for tile, future in tiles_futures])
+
+        return result_frame  # dimensions: features-X-Y
+
+
 def get_ctv_handler(flags, p1):
 
     if flags["SO_Method"] == 0:
 
         return PixelWiseCTVHandler(flags=flags, p1=p1)
 
+    elif flags["SO_Method"] == 1:
+
+        return ParallelPixelWiseCTVHandler(flags=flags, p1=p1)
+
     else:
         raise NotImplementedError(
             f"Features with 'SO_Method' set to {flags['SO_Method']} have not yet been implemented\n")
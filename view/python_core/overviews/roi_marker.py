@@ -13,6 +13,17 @@ class BlankROIMarker(object):
     def draw(self, frame):
         return frame
 
+    def get_overlay(self, frame_shape):
+        """
+        Returns what <draw> draws onto frames as a layer, so that it can be composited with frames
+        :param tuple frame_shape: shape of frames, format X, Y, Color
+        :return: overlay_colors, overlay_mask
+        overlay_colors: numpy.ndarray of shape <frame_shape>, colors drawn
+        overlay_mask: boolean numpy.ndarray, format XY, True where colors are drawn
+        """
+
+        return np.zeros(frame_shape), np.zeros(frame_shape[:2], dtype=bool)
+
 
 class BaseROIMarker(BlankROIMarker):
 
@@ -30,6 +41,15 @@ class BaseROIMarker(BlankROIMarker):
 
         return frame_copy
 
+    def get_overlay(self, frame_shape):
+
+        overlay_colors, overlay_mask = super().get_overlay(frame_shape)
+        for roi_mask, col, label in self.roi_mask_color_label_tuples:
+            overlay_colors[roi_mask, :] = col
+            overlay_mask |= roi_mask
+
+        return overlay_colors, overlay_mask
+
 
 class ROIMarkerSingleColor(BaseROIMarker):
 
@@ -73,6 +93,11 @@ class ROIMarkerQualitativeColorsBlankBackground(ROIMarkerQualitativeColors):
         blank_frame[:, :, :] = self.bg_color
         return super().draw(blank_frame)
 
+    def get_overlay(self, frame_shape):
+
+        # frames are replaced entirely
+        return self.draw(np.empty(frame_shape)), np.ones(frame_shape[:2], dtype=bool)
+
 
 def get_roi_marker_2D(flags, fg_color, bg_color, unexcluded_frame_size, excluder, measurement_label):
 
@@ -1,20 +1,24 @@
 from view.idl_translation_core.ViewLoadData import create_raw_data666
 from .metadata_related import MetadataDefinition, parse_p1_metadata_from_measurement_list_row
-from .filters import apply_filter
+from .filters import MedianMeanFilterPipeline, apply_scattered_light_correction
+from .corrected_raw_data_cache import CorrectedRawDataCache
 from view.python_core.bleach_corr import get_bleach_compensator
 from view.python_core.background import get_background_frames
 from view.python_core.areas import get_area_for_p1, get_area_for_bleach_correction
 from view.python_core.measurement_list.importers import LSMImporter, IngaTif_Importer
 from view.python_core.foto import calc_foto1
-from view.python_core.io import load_pst, read_lsm, read_tif_2Dor3D, read_single_file_fura_tif, read_lif, read_SingleWavelengthTif_MultiFileInga
+from view.python_core.movement_correction import correct_movement
+from view.python_core.io import load_pst, read_lsm, read_tif_2Dor3D, read_single_file_fura_tif, read_lif, read_SingleWavelengthTif_MultiFileInga, \
+    get_lif_reader, get_multi_tiff_reader_inga, is_memory_mapped
 from view.python_core.paths import get_existing_raw_data_filename
 from view.python_core.stimuli import PulsedStimuliiHandler
-from view.python_core.calc_methods import get_calc_method
+from view.python_core.calc_methods import get_calc_method, calc_signals_tiled
 import pathlib as pl
 import pandas as pd
 import copy
 import numpy as np
-from scipy.ndimage import gaussian_filter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import logging
 import gc
 from abc import ABC, abstractmethod
@@ -54,6 +58,12 @@ class P1SingleWavelengthAbstract(ABC):
         # an object of PulsedStimuliiHandler or some other subclass of BaseStimuliiHandler
         self.pulsed_stimuli_handler = None
 
+        # number of wavelengths whose raw data is being corrected concurrently, which share threads for filtering
+        self.concurrent_corrections = 1
+
+        # BleachCorrectionWorkerPool of the session loading data, e.g. of a VIEW object
+        self.bleach_correction_worker_pool = None
+
     def __del__(self):
 
         to_del = [
@@ -99,7 +109,7 @@ class P1SingleWavelengthAbstract(ABC):
 
         return self.metadata.format_x, self.metadata.format_y
 
-    def correct_raw_data(self, raw_data, p1_metadata, flags):
+    def correct_raw_data(self, raw_data, p1_metadata, flags, raw_data_filename=None, wavelength_index=None):
 
         # if the flag replace_init_frames is 2, replace the first two frames with the third
         frames2replace = flags["Data_ReplaceInitFrames"]
@@ -114,18 +124,25 @@ class P1SingleWavelengthAbstract(ABC):
                 f"is too large for the number of frames loaded ({raw_data.shape[2]}). Not Replacing any frames!")
 
         # apply median filter first, then mean filter, depending on flags
-        raw_data = apply_filter(matrix_in=raw_data, view_flags=flags, filter_type="median")
-        raw_data = apply_filter(matrix_in=raw_data, view_flags=flags, filter_type="mean")
+        filter_pipeline = MedianMeanFilterPipeline.from_flags(flags, n_sharing=self.concurrent_corrections)
+        raw_data = filter_pipeline.apply(raw_data)
+
+        # correct movement, depending on flags
+        raw_data = correct_movement(movie_xyt=raw_data, flags=flags, raw_data_filename=raw_data_filename,
+                                    n_threads=filter_pipeline.n_threads, wavelength_index=wavelength_index)
 
         # apply light scattering compensation using unsharp masking
-        # see Pg 376 of Galizia & Vetter(2004).
-        # "Optical Methods for Analyzing Odor-Evoked Activity in the Insect Brain."
-        # https://doi.org/10.1201/9781420039429.ch13
         smoothfactor = flags["LE_ScatteredLightFactor"]
 
-        if smoothfactor > 0:
+        # data is converted to floating point numbers only from here on
+        float_dtype = flags.get_float_dtype()
 
-            corrected_raw_data = np.empty_like(raw_data)
+        # needed before scattered light correction, whose output the bleach compensator can correct without copying
+        bleach_compensator = get_bleach_compensator(
+            flags=flags, p1_metadata=p1_metadata, movie_size=raw_data.shape,
+            worker_pool=self.bleach_correction_worker_pool)
+
+        if smoothfactor > 0:
 
             smoothradius_um = flags["LE_ScatteredLightRadius"]
 
@@ -135,24 +152,14 @@ class P1SingleWavelengthAbstract(ABC):
             if smX != smY:
                 logging.getLogger("VIEW").warning('unequal pixel size not implemented yet - averaging x and y value')
 
-            for frame_ind in range(raw_data.shape[2]):
-                current_frame = raw_data[:, :, frame_ind]
-
-                # calculate correction
-                correction = current_frame - gaussian_filter(current_frame, smoothradius, mode='nearest')
-
-                # smooth correction so as to not enhance noise
-                smoothed_correction = gaussian_filter(correction, smoothradius, mode='nearest')
-
-                # apply correction
-                corrected_raw_data[:, :, frame_ind] = current_frame + smoothfactor * smoothed_correction
+            corrected_raw_data = apply_scattered_light_correction(
+                matrix_in=raw_data, smoothfactor=smoothfactor, smoothradius=smoothradius, dtype=float_dtype,
+                out=bleach_compensator.empty_movie(shape=raw_data.shape, dtype=float_dtype))
 
         else:
             corrected_raw_data = raw_data
 
         # apply bleach correction depending on flags
-        bleach_compensator = get_bleach_compensator(flags=flags, p1_metadata=p1_metadata, movie_size=raw_data.shape)
-
         area_mask_for_p1 = get_area_for_p1(frame_size=raw_data.shape[:2], flags=flags)
 
         area_mask_for_bleach_correction = get_area_for_bleach_correction(
@@ -162,15 +169,27 @@ class P1SingleWavelengthAbstract(ABC):
         bleach_corrected_raw_data, bleach_fit_params = bleach_compensator.apply(
             stack_xyt=corrected_raw_data, area_mask=area_mask_for_bleach_correction)
 
+        # bleach correction returns float64 data. Integer data (no corrections applied) is kept as it is
+        if np.issubdtype(bleach_corrected_raw_data.dtype, np.floating):
+            bleach_corrected_raw_data = bleach_corrected_raw_data.astype(float_dtype, copy=False)
+
+        # memory mapped raw data (see view.python_core.io.load_pst) to which no correction was applied is read into
+        # memory, as the map would keep the raw data file open as long as the data is used (e.g. preventing it from
+        # being moved or deleted on Windows)
+        if is_memory_mapped(bleach_corrected_raw_data):
+            bleach_corrected_raw_data = np.array(bleach_corrected_raw_data)
+
         return area_mask_for_p1, bleach_corrected_raw_data, bleach_fit_params
 
-    def load_correct_raw_data(self, p1_metadata, flags):
+    def load_correct_raw_data(self, p1_metadata, flags, wavelength_index=None):
         """
         Reads data, applies median filters, applies mean filters, applies scatter light correction,
         applies bleach correction and return the resulting data. It also loads area from an area file
         if present, uses it for bleach correction and returns it
         :param pd.Series p1_metadata: metadata
         :param FlagsManager flags:
+        :param int wavelength_index: for dual wavelength data, index of the wavelength of the data read, see
+        view.python_core.movement_correction.correct_movement
         :return: filename, area_mask_for_p1, bleach_corrected_raw_data, bleach_fit_params
         filename: absolute path of the file containing the raw data
         area_mask_for_p1: area mask read if an area file was found, else an numpy array of ones
@@ -187,11 +206,71 @@ class P1SingleWavelengthAbstract(ABC):
                 f"measurement list file. Original Error:\n {str(fnfe)}")
 
         area_mask_for_p1, bleach_corrected_raw_data, bleach_fit_params = self.correct_raw_data(
-            raw_data=raw_data, p1_metadata=p1_metadata, flags=flags
+            raw_data=raw_data, p1_metadata=p1_metadata, flags=flags, raw_data_filename=filename,
+            wavelength_index=wavelength_index
         )
 
         return filename, area_mask_for_p1, [bleach_corrected_raw_data], bleach_fit_params
 
+    def get_raw_data_filenames(self, p1_metadata, flags):
+        """
+        Paths of the raw data files that would be read by <load_correct_raw_data>, without reading them.
+        Raises FileNotFoundError if they cannot be found.
+        :param pd.Series p1_metadata: metadata
+        :param FlagsManager flags:
+        :rtype: list
+        """
+
+        return [get_existing_raw_data_filename(
+            flags=flags, dbb=p1_metadata.dbb1, extensions=self.get_extensions() + [self.get_default_extension()])]
+
+    def get_raw_data_file_ranges(self, p1_metadata, flags, measu):
+        """
+        Byte ranges of the raw data files that would be read by <load_correct_raw_data> for the measurement <measu>,
+        without reading them. Raises FileNotFoundError if they cannot be found.
+        :param pd.Series p1_metadata: metadata
+        :param FlagsManager flags:
+        :param int measu: measurement number, used by formats that contain several measurements in one file
+        :return: list of tuples (path, offset, length), with length None meaning until the end of the file
+        """
+
+        return [(str(filename), 0, None)
+                for filename in self.get_raw_data_filenames(p1_metadata=p1_metadata, flags=flags)]
+
+    def load_correct_raw_data_with_caching(self, p1_metadata, flags):
+        """
+        Same as <load_correct_raw_data>, but results are read from and written to a CorrectedRawDataCache in
+        STG_ProcessedDataPath, if the flag LE_CorrectedRawDataCacheGB is larger than 0.
+        :param pd.Series p1_metadata: metadata
+        :param FlagsManager flags:
+        :return: see <load_correct_raw_data>
+        """
+
+        cache = CorrectedRawDataCache.from_flags(flags)
+
+        if cache is not None:
+            try:
+                raw_data_files = self.get_raw_data_filenames(p1_metadata=p1_metadata, flags=flags)
+            except FileNotFoundError:  # e.g. synthetic data, which has no raw data files
+                cache = None
+
+        if cache is None:
+            return self.load_correct_raw_data(p1_metadata=p1_metadata, flags=flags)
+
+        key = CorrectedRawDataCache.get_key(
+            p1_class_name=self.__class__.__name__, raw_data_files=raw_data_files, p1_metadata=p1_metadata,
+            flags=flags)
+
+        cached_outputs = cache.load(key)
+        if cached_outputs is not None:
+            logging.getLogger("VIEW").info(f"Read corrected raw data from cache ({cache.cache_dir / key})")
+            return cached_outputs
+
+        outputs = self.load_correct_raw_data(p1_metadata=p1_metadata, flags=flags)
+        cache.save(key, *outputs)
+
+        return outputs
+
     def load_from_metadata(self, p1_metadata: pd.Series, flags, extra_metadata=None):
 
         # initialize give values of metadata and extra_metadata
@@ -209,7 +288,7 @@ class P1SingleWavelengthAbstract(ABC):
         # self.area_mask is calculated inside self.load_correct_raw_data because it needs frame_size,
         # which can only be known after loading data
         filename, self.area_mask, bleach_corrected_raw_data, bleach_fit_params \
-            = self.load_correct_raw_data(p1_metadata=p1_metadata, flags=flags)
+            = self.load_correct_raw_data_with_caching(p1_metadata=p1_metadata, flags=flags)
 
         self.metadata.bleachpar = bleach_fit_params
 
@@ -299,15 +378,29 @@ class P1SingleWavelengthAbstract(ABC):
         new_p1.foto2 = self.foto2
         return new_p1
 
-    def calculate_signals(self, flags):
+    def calculate_signals(self, flags, sig1_out=None):
+        """
+        Calculate signals from raw data using the method specified by the flag "LE_CalcMethod" and set them as
+        self.sig1. If the flag "LE_SignalTileSize" is positive, signals are calculated in spatial tiles of that size
+        :param FlagsManager flags:
+        :param numpy.ndarray sig1_out: array in format XYT, of the same shape as raw data, into which signals are
+        written, e.g. a numpy.memmap for movies larger than memory. Only used when "LE_SignalTileSize" is positive
+        """
 
         raw_data = self.get_raw_data()
         assert self.area_mask is not None
         assert self.metadata.background_frames is not None
 
         calc_method = get_calc_method(flags)
-        self.sig1 = calc_method(
-            raw_data=raw_data, background_frames=self.metadata.background_frames, area_mask=self.area_mask)
+        tile_size = flags["LE_SignalTileSize"]
+        if tile_size > 0:
+            self.sig1 = calc_signals_tiled(
+                calc_method=calc_method, raw_data=raw_data, background_frames=self.metadata.background_frames,
+                area_mask=self.area_mask, dtype=flags.get_float_dtype(), tile_size=tile_size, out=sig1_out)
+        else:
+            self.sig1 = calc_method(
+                raw_data=raw_data, background_frames=self.metadata.background_frames, area_mask=self.area_mask,
+                dtype=flags.get_float_dtype())
 
     def get_raw_data(self):
 
@@ -386,6 +479,19 @@ class P1SingleWavelength_multiTIFInga(P1SingleWavelengthAbstract):
         data = read_SingleWavelengthTif_MultiFileInga(filename, measu)
         return data
 
+    def get_raw_data_file_ranges(self, p1_metadata, flags, measu):
+        """
+        Paths of the .tif files containing the frames of the measurement <measu>, which are read by
+        <load_correct_raw_data>, see <P1SingleWavelengthAbstract.get_raw_data_file_ranges>
+        """
+
+        filename, = self.get_raw_data_filenames(p1_metadata=p1_metadata, flags=flags)
+        if pl.Path(filename).suffix != ".txt":  # defaulted to a .tif file
+            return super().get_raw_data_file_ranges(p1_metadata=p1_metadata, flags=flags, measu=measu)
+
+        return [(str(tif_file), 0, None)
+                for tif_file in get_multi_tiff_reader_inga(filename).get_measurement_tif_files(measu)]
+
     def get_p1_metadata_from_filename(self, filename, measu):
         """
         Create a p1_metadata object from Inga's .txt file that is written with the data for each experiment
@@ -440,6 +546,19 @@ class P1SingleWavelengthLIF(P1SingleWavelengthAbstract):
         data = read_lif(filename, measu)
         return data
 
+    def get_raw_data_file_ranges(self, p1_metadata, flags, measu):
+        """
+        Position of the memory block of the measurement <measu> in the .lif file, which is read by
+        <load_correct_raw_data>, see <P1SingleWavelengthAbstract.get_raw_data_file_ranges>
+        """
+
+        filename, = self.get_raw_data_filenames(p1_metadata=p1_metadata, flags=flags)
+        if pl.Path(filename).suffix != ".lif":  # defaulted to a .tif file
+            return super().get_raw_data_file_ranges(p1_metadata=p1_metadata, flags=flags, measu=measu)
+
+        offset, length = get_lif_reader(filename).get_memory_block_range(measu)
+        return [(str(filename), offset, length)]
+
 
 class P1SingleWavelengthTill(P1SingleWavelengthAbstract):
 
@@ -460,7 +579,8 @@ class P1SingleWavelengthTill(P1SingleWavelengthAbstract):
         :param str filename: absolute path of raw data file on file system
         :rtype: numpy.ndarray
         """
-        return load_pst(filename)
+        # memory mapped, frames are only read from disk when accessed
+        return load_pst(filename, lazy=True)
 
 
 class P1SingleWavelengthLSM(P1SingleWavelengthAbstract):
@@ -562,6 +682,27 @@ class P1DualWavelengthAbstract(P1SingleWavelengthAbstract, ABC):
 
         # Loading Air not implemented
 
+    def run_for_each_wavelength(self, funcs, flags):
+        """
+        Call each of <funcs>, which read and/or correct raw data of one wavelength each. If the flag
+        "LE_CorrectWavelengthsInParallel" is True, they are called concurrently in threads (numpy and scipy release
+        the GIL), else one after the other
+        :param list funcs: callables without arguments
+        :param FlagsManager flags:
+        :return: list of the values returned by <funcs>
+        """
+
+        if not flags["LE_CorrectWavelengthsInParallel"] or len(funcs) < 2:
+            return [func() for func in funcs]
+
+        self.concurrent_corrections = len(funcs)
+        try:
+            with ThreadPoolExecutor(max_workers=len(funcs)) as executor:
+                futures = [executor.submit(func) for func in funcs]
+                return [future.result() for future in futures]
+        finally:
+            self.concurrent_corrections = 1
+
     def get_raw_data(self):
         assert self.raw1 is not None and self.raw2 is not None, \
             "Cannot calculate signals as raw data has bot yet been loaded. Please" \
@@ -607,16 +748,19 @@ class P1DualWavelengthTIFTwoFiles(P1DualWavelengthAbstract):
         bleach_fit_params: params used for bleach fitting
         """
 
-        # read and correct raw1
-        filename1, area_mask, [bleach_corrected_raw_data1], bleach_fit_params1 \
-            = super().load_correct_raw_data(p1_metadata=p1_metadata, flags=flags)
-
-        # read raw2
+        # read raw2 like raw1, from dbb2 instead of dbb1
         metadata_copy = copy.copy(self.metadata)
         metadata_copy.dbb1 = metadata_copy.dbb2
 
-        filename2, area_mask, [bleach_corrected_raw_data2], bleach_fit_params2 \
-            = super().load_correct_raw_data(p1_metadata=metadata_copy, flags=flags)
+        # read and correct raw1 and raw2
+        (filename1, area_mask, [bleach_corrected_raw_data1], bleach_fit_params1), \
+            (filename2, area_mask, [bleach_corrected_raw_data2], bleach_fit_params2) \
+            = self.run_for_each_wavelength(
+                funcs=[partial(super().load_correct_raw_data, p1_metadata=p1_metadata, flags=flags,
+                               wavelength_index=0),
+                       partial(super().load_correct_raw_data, p1_metadata=metadata_copy, flags=flags,
+                               wavelength_index=1)],
+                flags=flags)
 
         # make sure the shapes of data belonging to the two wavelength match
         assert bleach_corrected_raw_data1.shape == bleach_corrected_raw_data2.shape, \
@@ -627,6 +771,19 @@ class P1DualWavelengthTIFTwoFiles(P1DualWavelengthAbstract):
             filename1, area_mask, [bleach_corrected_raw_data1, bleach_corrected_raw_data2], \
             [bleach_fit_params1, bleach_fit_params2]
 
+    def get_raw_data_filenames(self, p1_metadata, flags):
+        """
+        Paths of the raw data files that would be read by <load_correct_raw_data>, without reading them.
+        Raises FileNotFoundError if they cannot be found.
+        :param pd.Series p1_metadata: metadata
+        :param FlagsManager flags:
+        :rtype: list
+        """
+
+        extensions = self.get_extensions() + [self.get_default_extension()]
+        return [get_existing_raw_data_filename(flags=flags, dbb=dbb, extensions=extensions)
+                for dbb in (p1_metadata.dbb1, p1_metadata.dbb2)]
+
     def get_p1_metadata_from_filenames(self, filenames):
         """
         Create a p1_metadata object only using raw data filenames in <filenames>. Use defaults or guesses
@@ -671,7 +828,8 @@ class P1DualWavelengthTill(P1DualWavelengthTIFTwoFiles):
         :param str filename: absolute path of raw data file on file system
         :rtype: numpy.ndarray
         """
-        return load_pst(filename)
+        # memory mapped, frames are only read from disk when accessed
+        return load_pst(filename, lazy=True)
 
 
 class P1SingleWavelength666(P1SingleWavelengthAbstract):
@@ -813,13 +971,14 @@ class P1DualWavelengthTIFSingleFile(P1DualWavelengthAbstract):
                 f"Problem loading raw data from dbb1. Please check the measurement row selected in the "
                 f"measurement list file. Original Error:\n {str(fnfe)}")
 
-        area_mask_for_p1, bleach_corrected_raw_data_340, bleach_fit_params_340 = self.correct_raw_data(
-            raw_data=raw_data[0], p1_metadata=p1_metadata, flags=flags
-        )
-
-        area_mask_for_p1, bleach_corrected_raw_data_380, bleach_fit_params_380 = self.correct_raw_data(
-            raw_data=raw_data[1], p1_metadata=p1_metadata, flags=flags
-        )
+        (area_mask_for_p1, bleach_corrected_raw_data_340, bleach_fit_params_340), \
+            (area_mask_for_p1, bleach_corrected_raw_data_380, bleach_fit_params_380) \
+            = self.run_for_each_wavelength(
+                funcs=[partial(self.correct_raw_data, raw_data=raw_data[0], p1_metadata=p1_metadata, flags=flags,
+                               raw_data_filename=filename, wavelength_index=0),
+                       partial(self.correct_raw_data, raw_data=raw_data[1], p1_metadata=p1_metadata, flags=flags,
+                               raw_data_filename=filename, wavelength_index=1)],
+                flags=flags)
 
         return \
             filename, area_mask_for_p1, \
@@ -877,9 +1036,10 @@ def get_empty_p1(LE_loadExp, odor_conc=None):
     return empty_obj
 
 
-def get_p1(p1_metadata, flags, extra_metadata):
+def get_p1(p1_metadata, flags, extra_metadata, bleach_correction_worker_pool=None):
 
     empty_obj = get_empty_p1(flags["LE_loadExp"], p1_metadata.get("odor_nr", None))
+    empty_obj.bleach_correction_worker_pool = bleach_correction_worker_pool
     empty_obj.load_from_metadata(p1_metadata, flags, extra_metadata)
     return empty_obj
 
@@ -0,0 +1,178 @@
+import hashlib
+import logging
+import os
+import pathlib as pl
+import pickle
+import shutil
+
+import numpy as np
+
+from view.python_core.movement_correction import get_movement_list_path
+
+
+class CorrectedRawDataCache(object):
+    """
+    On-disk cache of the output of P1SingleWavelengthAbstract.load_correct_raw_data. Each entry is a folder in
+    <cache_dir> named after a key (see <get_key>) and contains one .npy file per raw data array, the area mask as .npy
+    and remaining values pickled. Least recently used entries are deleted when the total size of the cache exceeds
+    <max_size_bytes>.
+    """
+
+    # flags that influence raw data correction have names starting with these prefixes
+    relevant_flag_prefixes = ("LE", "Data_")
+
+    # flags with names starting with <relevant_flag_prefixes> that do not influence raw data correction
+    irrelevant_flags = (
+        "LE_CorrectedRawDataCacheGB", "LE_labelColumns", "LE_CalcMethod", "LE_SignalTileSize",
+        "LE_BleachParallelWorkers", "Data_FilterThreads", "LE_CorrectWavelengthsInParallel",
+        "LE_MovementShiftsSidecar")
+
+    def __init__(self, cache_dir, max_size_bytes):
+        """
+        :param str|pathlib.Path cache_dir: folder in which entries are saved
+        :param int max_size_bytes: maximum size of all entries together, in bytes
+        """
+
+        super().__init__()
+        self.cache_dir = pl.Path(cache_dir)
+        self.max_size_bytes = max_size_bytes
+
+    @classmethod
+    def from_flags(cls, flags):
+        """
+        Create a cache in the folder "corrected_raw_data_cache" in STG_ProcessedDataPath, with maximum size
+        given by the flag "LE_CorrectedRawDataCacheGB". Corrected raw data is not cached when bleach fit parameters
+        are reused across the measurements of an animal, as the result then depends on other measurements
+        :param FlagsManager flags:
+        :return: CorrectedRawDataCache object, or None if caching is turned off
+        """
+
+        max_size_gb = flags["LE_CorrectedRawDataCacheGB"]
+        if max_size_gb <= 0 or flags["LE_BleachFitReuse"] == "animal":
+            return None
+
+        return cls(cache_dir=flags.get_processed_data_dir_path() / "corrected_raw_data_cache",
+                   max_size_bytes=int(max_size_gb * 1024 ** 3))
+
+    @classmethod
+    def get_key(cls, p1_class_name, raw_data_files, p1_metadata, flags):
+        """
+        Calculate a key that changes when any of the inputs of raw data correction changes, i.e., the raw data
+        files, the flags with names starting with <relevant_flag_prefixes>, the area file, the .moveList file or the
+        metadata used during correction
+        :param str p1_class_name: name of the P1 class used to load data
+        :param Sequence raw_data_files: paths of raw data files
+        :param pandas.Series p1_metadata: experimental metadata
+        :param FlagsManager flags:
+        :rtype: str
+        """
+
+        def file_identity(file_path):
+            stat = os.stat(file_path)
+            return str(pl.Path(file_path).resolve()), stat.st_mtime_ns, stat.st_size
+
+        relevant_flags = sorted(
+            (flag_name, repr(flag_value)) for flag_name, flag_value in flags.items()
+            if flag_name.startswith(cls.relevant_flag_prefixes) and flag_name not in cls.irrelevant_flags)
+
+        area_file = flags.get_existing_area_filepath()
+
+        # movement values read from the .moveList file are an input of raw data correction
+        movement_list_file = get_movement_list_path(flags)
+        if flags["LE_MovementCorrection"] != 3 or not movement_list_file.is_file():
+            movement_list_file = None
+
+        key_parts = [
+            p1_class_name,
+            [file_identity(raw_data_file) for raw_data_file in raw_data_files],
+            flags["STG_Measu"],
+            relevant_flags,
+            None if area_file is None else file_identity(area_file),
+            None if movement_list_file is None else file_identity(movement_list_file),
+            tuple(p1_metadata.background_frames),
+            p1_metadata.get("frequency"),
+            p1_metadata.get("pixelsizex"),
+            p1_metadata.get("pixelsizey"),
+            p1_metadata.get("pulsed_stimuli_handler") is not None
+        ]
+
+        return hashlib.sha1(repr(key_parts).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Load entry with key <key>. Raw data arrays are read into memory, as memory mapped arrays would keep the files
+        of the entry open as long as the data is used, which would prevent the entry from being replaced or evicted
+        on Windows
+        :param str key: see <get_key>
+        :return: filename, area_mask, raw_data_list, bleach_fit_params if the entry exists, else None
+        """
+
+        entry_dir = self.cache_dir / key
+        try:
+            with open(entry_dir / "values.pickle", "rb") as fh:
+                filename, n_raw_data, bleach_fit_params = pickle.load(fh)
+
+            area_mask = np.load(entry_dir / "area_mask.npy")
+            raw_data_list = [np.load(entry_dir / f"raw_data{ind}.npy") for ind in range(n_raw_data)]
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError) as e:
+            if entry_dir.is_dir():
+                logging.getLogger("VIEW").warning(
+                    f"Could not read corrected raw data from cache ({entry_dir}), correcting raw data again: {e}")
+            return None
+
+        # mark entry as recently used
+        os.utime(entry_dir)
+
+        return filename, area_mask, raw_data_list, bleach_fit_params
+
+    def save(self, key, filename, area_mask, raw_data_list, bleach_fit_params):
+        """
+        Save the outputs of P1SingleWavelengthAbstract.load_correct_raw_data as an entry with key <key>, then delete
+        least recently used entries if the cache is larger than allowed
+        :param str key: see <get_key>
+        """
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry_dir = self.cache_dir / key
+        # written to a temporary folder first, so that partially written entries are never loaded
+        temp_entry_dir = self.cache_dir / f"{key}.{os.getpid()}.tmp"
+
+        try:
+            temp_entry_dir.mkdir(exist_ok=True)
+            for ind, raw_data in enumerate(raw_data_list):
+                np.save(temp_entry_dir / f"raw_data{ind}.npy", np.asarray(raw_data))
+            np.save(temp_entry_dir / "area_mask.npy", np.asarray(area_mask))
+            with open(temp_entry_dir / "values.pickle", "wb") as fh:
+                pickle.dump((filename, len(raw_data_list), bleach_fit_params), fh)
+
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            temp_entry_dir.rename(entry_dir)
+        except OSError as e:
+            logging.getLogger("VIEW").warning(f"Could not save corrected raw data to cache ({entry_dir}): {e}")
+            shutil.rmtree(temp_entry_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        """
+        Delete least recently used entries till the size of the cache is at most <self.max_size_bytes>
+        """
+
+        entries = []
+        for entry_dir in self.cache_dir.iterdir():
+            if entry_dir.is_dir() and not entry_dir.name.endswith(".tmp"):
+                entry_size = sum(x.stat().st_size for x in entry_dir.iterdir())
+                entries.append((entry_dir.stat().st_mtime, entry_size, entry_dir))
+
+        total_size = sum(entry_size for _, entry_size, _ in entries)
+
+        for _, entry_size, entry_dir in sorted(entries, key=lambda x: x[0]):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                shutil.rmtree(entry_dir)
+            except OSError as e:  # e.g. files in use by another process on Windows
+                logging.getLogger("VIEW").warning(f"Could not delete corrected raw data from cache ({entry_dir}): {e}")
+                continue
+            total_size -= entry_size
@@ -1,8 +1,32 @@
 from scipy.ndimage.filters import median_filter, uniform_filter
+from scipy.ndimage import gaussian_filter
 import numpy as np
+import scipy.fft
+from concurrent.futures import ThreadPoolExecutor
+import os
+import queue
 from scipy.signal import kaiserord, firwin, freqz, lfilter
 
 
+def get_filter_sizes(ndim, size_in_space, size_in_time):
+    """
+    Sizes of the filter window along each dimension of the data to filter
+    :param int ndim: number of dimensions of the data, 3 for XYT, 2 for XY and 1 for time traces
+    :param int size_in_space: window size along X and Y
+    :param int size_in_time: window size along T
+    :rtype: tuple
+    """
+
+    if ndim == 3:  # assume data format is XYT
+        return size_in_space, size_in_space, size_in_time
+    elif ndim == 2:  # assume data format is XY
+        return size_in_space, size_in_space
+    elif ndim == 1:  # assume data is a time trace
+        return size_in_time,
+    else:
+        raise NotImplementedError
+
+
 def apply_filter(matrix_in: np.ndarray, view_flags, filter_type: str):
 
     if filter_type == "median":
@@ -19,18 +43,270 @@ def apply_filter(matrix_in: np.ndarray, view_flags, filter_type: str):
     if size_in_time is None and size_in_space is None:
         return matrix_in
 
-    if len(matrix_in.shape) == 3:  # assume data format is XYT
-        sizes_along_dimension_of_input = (size_in_space, size_in_space, size_in_time)
-    elif len(matrix_in.shape) == 2:  # assume data format is XY
-        sizes_along_dimension_of_input = (size_in_space, size_in_space)
-    elif len(matrix_in.shape) == 1:  # assume data is a time trace
-        sizes_along_dimension_of_input = (size_in_time,)
-    else:
-        raise NotImplementedError
+    sizes_along_dimension_of_input = get_filter_sizes(len(matrix_in.shape), size_in_space, size_in_time)
 
     return func(matrix_in, size=sizes_along_dimension_of_input, mode="nearest")
 
 
+class MedianMeanFilterPipeline(object):
+    """
+    Applies a median filter followed by a mean filter, with the same results as apply_filter with filter_type "median"
+    followed by apply_filter with filter_type "mean". Data is split into blocks along its outermost axis in memory,
+    and both filters are applied to one block after the other, so that a block stays in cache between the two filters.
+    Blocks are filtered in parallel by threads (scipy.ndimage releases the GIL) and are extended by as many
+    neighbouring values as the filters need, so that results do not depend on the blocks. Scratch buffers are kept
+    and reused for all blocks and all calls of <apply>
+    """
+
+    # approximate number of values in a block
+    block_elements = 2 ** 20
+
+    def __init__(self, median_size_in_space, median_size_in_time, mean_size_in_space, mean_size_in_time,
+                 n_threads=None):
+        """
+        :param int median_size_in_space: window sizes of the median filter, None for no median filter
+        (see FlagsManager.interpret_median_filter_params)
+        :param int median_size_in_time:
+        :param int mean_size_in_space: window sizes of the mean filter, None for no mean filter
+        (see FlagsManager.interpret_mean_filter_params)
+        :param int mean_size_in_time:
+        :param int n_threads: number of threads, defaults to the number of CPUs
+        """
+
+        super().__init__()
+        self.median_sizes = median_size_in_space, median_size_in_time
+        self.mean_sizes = mean_size_in_space, mean_size_in_time
+        self.n_threads = n_threads if n_threads else os.cpu_count()
+
+        # free scratch buffers, one set is used by each thread at a time
+        self._scratch_buffers = queue.SimpleQueue()
+
+    @classmethod
+    def from_flags(cls, flags, n_sharing=1):
+        """
+        Create a pipeline with filters specified by the flags "Data_Median_Filter*" and "Data_Mean_Filter*", using
+        the number of threads given by the flag "Data_FilterThreads"
+        :param FlagsManager flags:
+        :param int n_sharing: number of pipelines run concurrently, among which the threads are divided
+        :rtype: MedianMeanFilterPipeline
+        """
+
+        median_size_in_space, median_size_in_time = flags.interpret_median_filter_params()
+        mean_size_in_space, mean_size_in_time = flags.interpret_mean_filter_params()
+
+        n_threads = flags["Data_FilterThreads"] if flags["Data_FilterThreads"] > 0 else os.cpu_count()
+
+        return cls(median_size_in_space=median_size_in_space, median_size_in_time=median_size_in_time,
+                   mean_size_in_space=mean_size_in_space, mean_size_in_time=mean_size_in_time,
+                   n_threads=max(1, n_threads // n_sharing))
+
+    def get_filters(self, ndim):
+        """
+        Filters to apply, in order, to data with <ndim> dimensions
+        :param int ndim: see <get_filter_sizes>
+        :return: list of (filter function, window sizes along each dimension)
+        """
+
+        filters = []
+        for func, (size_in_space, size_in_time) in ((median_filter, self.median_sizes),
+                                                    (uniform_filter, self.mean_sizes)):
+            if size_in_space is not None or size_in_time is not None:
+                filters.append((func, get_filter_sizes(ndim, size_in_space, size_in_time)))
+
+        return filters
+
+    def apply(self, matrix_in: np.ndarray, out=None):
+        """
+        Apply filters to <matrix_in>
+        :param numpy.ndarray matrix_in: 3D (format XYT), 2D (format XY) or 1D (time trace)
+        :param numpy.ndarray out: if specified, same shape and dtype as <matrix_in>, filtered data is written into it.
+        Must not overlap with <matrix_in>
+        :return: filtered data, <out> if specified, <matrix_in> itself if no filters are to be applied
+        :rtype: numpy.ndarray
+        """
+
+        filters = self.get_filters(matrix_in.ndim)
+
+        if len(filters) == 0:
+            return matrix_in
+
+        if out is None:
+            out = np.empty(matrix_in.shape, dtype=matrix_in.dtype)
+
+        # blocks along the outermost axis in memory are contiguous, or nearly so
+        axis = int(np.argmax(np.abs(matrix_in.strides)))
+        axis_length = matrix_in.shape[axis]
+
+        # values before and after a block needed for filtering it, for windows of size n scipy.ndimage uses
+        # n // 2 values before and (n - 1) // 2 values after
+        halo_before = sum(sizes[axis] // 2 for _, sizes in filters)
+        halo_after = sum((sizes[axis] - 1) // 2 for _, sizes in filters)
+
+        elements_per_index = max(1, matrix_in.size // max(1, axis_length))
+        block_length = max(1, min(self.block_elements // elements_per_index,
+                                  int(np.ceil(axis_length / self.n_threads))))
+
+        def filter_block(block_start):
+
+            block_stop = min(block_start + block_length, axis_length)
+            extended_start = max(0, block_start - halo_before)
+            extended_stop = min(axis_length, block_stop + halo_after)
+
+            extended_slice = [slice(None)] * matrix_in.ndim
+            extended_slice[axis] = slice(extended_start, extended_stop)
+            extended_block = matrix_in[tuple(extended_slice)]
+
+            try:
+                scratch_buffers = self._scratch_buffers.get_nowait()
+            except queue.Empty:
+                scratch_buffers = [np.empty(0, dtype=matrix_in.dtype) for _ in filters]
+
+            try:
+                filter_input = extended_block
+                for filter_ind, (func, sizes) in enumerate(filters):
+                    if scratch_buffers[filter_ind].size < extended_block.size \
+                            or scratch_buffers[filter_ind].dtype != matrix_in.dtype:
+                        scratch_buffers[filter_ind] = np.empty(extended_block.size, dtype=matrix_in.dtype)
+                    filter_output = scratch_buffers[filter_ind][:extended_block.size].reshape(extended_block.shape)
+                    func(filter_input, size=sizes, mode="nearest", output=filter_output)
+                    filter_input = filter_output
+
+                core_slice = [slice(None)] * matrix_in.ndim
+                core_slice[axis] = slice(block_start - extended_start, block_stop - extended_start)
+                out_slice = [slice(None)] * matrix_in.ndim
+                out_slice[axis] = slice(block_start, block_stop)
+                out[tuple(out_slice)] = filter_input[tuple(core_slice)]
+            finally:
+                self._scratch_buffers.put(scratch_buffers)
+
+        block_starts = range(0, axis_length, block_length)
+        if self.n_threads > 1 and len(block_starts) > 1:
+            with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+                # list() raises exceptions of threads, if any
+                list(executor.map(filter_block, block_starts))
+        else:
+            for block_start in block_starts:
+                filter_block(block_start)
+
+        return out
+
+
+# gaussian kernels with sigma (in pixels) at least this large are applied using FFT when method="auto"
+SCATTERED_LIGHT_FFT_MIN_SIGMA = 10
+
+# approximate maximum number of values transformed together by <gaussian_filter1d_fft>, limits memory usage
+SCATTERED_LIGHT_FFT_BLOCK_ELEMENTS = 2 ** 22
+
+
+def _next_fast_fft_size(size):
+    """
+    Smallest integer not less than <size> without prime factors larger than 5
+    :param int size:
+    :rtype: int
+    """
+
+    while True:
+        remainder = size
+        for prime in (2, 3, 5):
+            while remainder % prime == 0:
+                remainder //= prime
+        if remainder == 1:
+            return size
+        size += 1
+
+
+def gaussian_filter1d_fft(matrix_in: np.ndarray, sigma: float, axis: int, output: np.ndarray, truncate=4.0):
+    """
+    Same as scipy.ndimage.gaussian_filter1d(matrix_in, sigma, axis=axis, mode="nearest", truncate=truncate,
+    output=output), but convolving using FFT, which is faster for large <sigma>
+    :param numpy.ndarray matrix_in: 3D
+    :param float sigma: standard deviation of the gaussian kernel, in pixels
+    :param int axis: axis along which to filter
+    :param numpy.ndarray output: same shape as <matrix_in>, floating point, filtered data is written into it.
+    Can be <matrix_in> itself
+    :param float truncate: kernel is truncated at this many standard deviations
+    """
+
+    radius = int(truncate * sigma + 0.5)
+    kernel = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+
+    # data is padded by repeating edge values, as with mode="nearest", which also prevents circular convolution
+    # from wrapping around. Transforms are computed with sizes that have only small prime factors, as they are faster
+    n_in = matrix_in.shape[axis]
+    fft_size = _next_fast_fft_size(n_in + 2 * radius)
+
+    # kernel centered at index 0, so that filtered data is not shifted
+    kernel_padded = np.zeros(fft_size)
+    kernel_padded[:2 * radius + 1] = kernel
+    kernel_fft = scipy.fft.rfft(np.roll(kernel_padded, -radius))
+
+    matrix_in_moved = np.moveaxis(matrix_in, axis, -1)
+    output_moved = np.moveaxis(output, axis, -1)
+    kernel_fft_shape = (1,) * (matrix_in.ndim - 1) + kernel_fft.shape
+
+    # filtered in blocks along the first of the remaining axes, to limit memory usage
+    block_size = max(1, SCATTERED_LIGHT_FFT_BLOCK_ELEMENTS // (fft_size * int(np.prod(matrix_in_moved.shape[1:-1]))))
+    for block_start in range(0, matrix_in_moved.shape[0], block_size):
+        block = slice(block_start, block_start + block_size)
+        padded = np.pad(matrix_in_moved[block], [(0, 0)] * (matrix_in.ndim - 1) + [(radius, radius)], mode="edge")
+        padded_fft = scipy.fft.rfft(padded, n=fft_size)
+        filtered = scipy.fft.irfft(padded_fft * kernel_fft.reshape(kernel_fft_shape), n=fft_size)
+        output_moved[block] = filtered[..., radius: radius + n_in]
+
+
+def apply_scattered_light_correction(matrix_in: np.ndarray, smoothfactor: float, smoothradius: float, dtype,
+                                     out=None, method="auto"):
+    """
+    Light scattering compensation using unsharp masking, applied to all frames at once.
+    See Pg 376 of Galizia & Vetter(2004).
+    "Optical Methods for Analyzing Odor-Evoked Activity in the Insect Brain."
+    https://doi.org/10.1201/9781420039429.ch13
+    :param numpy.ndarray matrix_in: 3D, format XYT
+    :param float smoothfactor: strength of correction, between 0 and 1
+    :param float smoothradius: standard deviation of the gaussian kernel used, in pixels
+    :param dtype: floating point dtype of the output
+    :param numpy.ndarray out: if specified, same shape as <matrix_in> and of dtype <dtype>, corrected data is
+    written into it
+    :param str method: "direct" for separable gaussian filtering, "fft" for convolution using FFT, "auto" for
+    "fft" if <smoothradius> is at least SCATTERED_LIGHT_FFT_MIN_SIGMA, else "direct"
+    :return: corrected data, <out> if specified
+    :rtype: numpy.ndarray
+    """
+
+    if out is None:
+        out = np.empty(matrix_in.shape, dtype=dtype)
+
+    if method == "auto":
+        method = "fft" if smoothradius >= SCATTERED_LIGHT_FFT_MIN_SIGMA else "direct"
+
+    if method == "direct":
+        def gaussian_filter_xy(input_, output):
+            gaussian_filter(input_, (smoothradius, smoothradius, 0), mode="nearest", output=output)
+    elif method == "fft":
+        def gaussian_filter_xy(input_, output):
+            gaussian_filter1d_fft(input_, smoothradius, axis=0, output=output)
+            gaussian_filter1d_fft(output, smoothradius, axis=1, output=output)
+    else:
+        raise NotImplementedError(f"Method can be either 'direct', 'fft' or 'auto', got {method}")
+
+    scratch = np.empty(matrix_in.shape, dtype=dtype)
+
+    # calculate correction
+    gaussian_filter_xy(matrix_in, output=scratch)
+    np.subtract(matrix_in, scratch, out=scratch)
+
+    # smooth correction so as to not enhance noise
+    gaussian_filter_xy(scratch, output=out)
+    del scratch
+
+    # apply correction
+    out *= smoothfactor
+    out += matrix_in
+
+    return out
+
+
 def filter_kaisord_highpass(signal, sampling_rate, cutoff=100, transitionWidth=40, rippleDB=20):
     """
     Applies a digital high pass filter to <signal>.
@@ -1,3 +1,4 @@
+import functools
 import pathlib as pl
 
 from matplotlib import font_manager
@@ -30,11 +31,28 @@ def resolve_font_file(mv_fontName):
     return font2use
 
 
+# maximum number of fonts kept loaded by <get_font>
+FONT_CACHE_SIZE = 64
+
+
+@functools.lru_cache(maxsize=FONT_CACHE_SIZE)
+def get_font(font_file, font_size):
+    """
+    Load a font from a font file. Loaded fonts are cached for the whole process, keyed by file and size, so that
+    annotating many frames does not load the same font from disk again and again
+    :param str font_file: absolute path of a font file on disk
+    :param int font_size: font size
+    :rtype: PIL.ImageFont.FreeTypeFont
+    """
+
+    return ImageFont.truetype(font=font_file, size=font_size)
+
+
 def get_maximum_font_size_by_width(font_name, text, maximum_width):
 
-    font = ImageFont.truetype(font=font_name, size=10)
+    font = get_font(font_file=font_name, font_size=10)
 
-    w, h = font.getsize(text)
+    _, _, w, h = font.getbbox(text)
 
     return int(10 * maximum_width / w)
 
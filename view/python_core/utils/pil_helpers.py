@@ -1,6 +1,45 @@
-from PIL import ImageDraw, ImageFont, Image
+from PIL import ImageDraw, Image
 import numpy as np
 from typing import Sequence
+import functools
+from view.python_core.utils.fonts import get_font
+
+
+# maximum number of rendered texts kept by <get_text_mask>
+TEXT_MASK_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=TEXT_MASK_CACHE_SIZE)
+def get_text_mask(text, font_file, font_size, fraction_x, fraction_y):
+    """
+    Render <text> as a mask of the pixels it covers. Rendered texts are cached for the whole process, so that texts
+    repeated in many frames, like frame times or stimulus labels, are rasterized only once. The mask does not depend
+    on the color of the text, which is applied when pasting it (see <add_string>)
+    :param str text: text to render
+    :param str font_file: absolute path of a font file on disk
+    :param int font_size: font size
+    :param float fraction_x: fractional part of the X position of the text, which PIL uses for subpixel positioning
+    :param float fraction_y: fractional part of the Y position of the text
+    :return: mask, offset
+    mask: PIL Image in mode "L", or None if <text> covers no pixels
+    offset: 2-membered tuple, position of the top left corner of <mask> relative to the integer part of the position
+    of the text
+    """
+
+    font = get_font(font_file=font_file, font_size=font_size)
+
+    left, top, right, bottom = font.getbbox(text)
+    margin = 2 + max(0, -int(np.floor(left)), -int(np.floor(top)))
+
+    # drawn exactly as ImageDraw.text would draw it onto an image at a position with the same fractional part
+    canvas = Image.new("L", (margin + int(np.ceil(right)) + 2, margin + int(np.ceil(bottom)) + 2))
+    ImageDraw.Draw(canvas).text((margin + fraction_x, margin + fraction_y), text, fill=255, font=font)
+
+    bbox = canvas.getbbox()
+    if bbox is None:
+        return None, (0, 0)
+
+    return canvas.crop(bbox), (bbox[0] - margin, bbox[1] - margin)
 
 
 def add_string(image, position, font_size: int, text, fill_color_for_pil: str, font_file,
@@ -16,12 +55,11 @@ def add_string(image, position, font_size: int, text, fill_color_for_pil: str, f
     assert horizontal_alignment in ["left", "center", "right"], "unknown setting for horizontal alignment"
     assert vertical_alignment in ["top", "center", "bottom"], "unknown setting for vertical alignment"
 
-    image_draw_obj = ImageDraw.Draw(image)
-
     corrected_font_size = 8 * round(font_size / 8)
 
-    font = ImageFont.truetype(font=font_file, size=corrected_font_size)
-    text_width, text_height = font.getsize(text)
+    font = get_font(font_file=font_file, font_size=corrected_font_size)
+    # right and bottom of the bounding box of the text drawn at (0, 0), as returned by getsize of Pillow < 10
+    _, _, text_width, text_height = font.getbbox(text)
 
     x_pos, y_pos = position
     if horizontal_alignment == "right":
@@ -34,7 +72,17 @@ def add_string(image, position, font_size: int, text, fill_color_for_pil: str, f
     elif vertical_alignment == "center":
         y_pos -= int(text_height / 2)
 
-    image_draw_obj.text((x_pos, y_pos), text, fill=fill_color_for_pil, font=font)
+    if x_pos >= 0 and y_pos >= 0 and image.mode in ("RGB", "RGBA"):
+        # pasting the color of the text through a cached mask gives the same pixels as ImageDraw.text
+        text_mask, (offset_x, offset_y) = get_text_mask(
+            text=text, font_file=font_file, font_size=corrected_font_size,
+            fraction_x=x_pos % 1, fraction_y=y_pos % 1)
+        if text_mask is not None:
+            image.paste(fill_color_for_pil, box=(int(x_pos) + offset_x, int(y_pos) + offset_y), mask=text_mask)
+    else:
+        # integer parts of negative positions are rounded differently and other image modes render text differently,
+        # texts are drawn directly then
+        ImageDraw.Draw(image).text((x_pos, y_pos), text, fill=fill_color_for_pil, font=font)
 
     return image
 
@@ -69,7 +117,7 @@ def pil_image_to_numpy(image_PIL):
     """
 
     # convert frame back to numpy.ndarray, float in range [0, 1]
-    frame_data = np.array(np.array(image_PIL) / 255, dtype=np.float)
+    frame_data = np.array(image_PIL) / 255
 
     # swap the axes as PIL return YX
     frame_dataXY = frame_data.swapaxes(0, 1)
@@ -4,15 +4,18 @@ import shutil
 import sys
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from pkg_resources import get_distribution
 from .flags import FlagsManager
+from .io import read_file_ranges_into_os_cache
 from view.python_core.gdm_generation import get_roi_gdm_traces_dict, get_gdm_file
 from .measurement_list import MeasurementList
 from .measurement_list.importers import get_setup_extension
 from .movies import export_movie
 from .overviews import generate_overview_image, generate_overview_image_for_output
 from .overviews.ctv_handlers import get_ctv_handler
+from .bleach_corr import BleachCorrectionWorkerPool
 from .p1_class import get_empty_p1, get_p1
 from .rois.roi_io import get_roi_io_class
 import gc
@@ -32,6 +35,8 @@ class VIEW(object):
         self.flags.update_flags({"VIEW_batchmode": True})
         self.measurement_list = None
         self.p1 = None
+        # worker processes for parallel bleach correction, reused for all measurements loaded
+        self.bleach_correction_worker_pool = BleachCorrectionWorkerPool()
         self.log_file = self.setup_logging(terminal_output_verbose)
         logging.getLogger("VIEW").info(
             f"VIEW object initialized for offline use. Version: {get_distribution('view').version}")
@@ -40,6 +45,7 @@ class VIEW(object):
 
         del self.flags
         self.delete_data()
+        self.bleach_correction_worker_pool.shutdown()
 
     def delete_data(self):
 
@@ -188,22 +194,83 @@ class VIEW(object):
 
         self.flags.update_flags({"STG_Measu": measu})
 
-        measu_label, self.p1 = self.measurement_list.load_data(flags=self.flags, measu=measu)
+        measu_label, self.p1 = self.measurement_list.load_data(
+            flags=self.flags, measu=measu, bleach_correction_worker_pool=self.bleach_correction_worker_pool)
 
         return measu_label
 
-    def calculate_signals(self):
+    def calculate_signals(self, sig1_out=None):
         """
         Calculates signals using the raw data currently loaded and using current flag values. Raises an ValueError if
         no raw data has been loaded
+        :param numpy.ndarray sig1_out: array into which signals are written when the flag "LE_SignalTileSize" is
+        positive, e.g. a numpy.memmap (see P1SingleWavelengthAbstract.calculate_signals)
         :returns: None
         """
 
         if self.p1 is not None:
-            self.p1.calculate_signals(self.flags)
+            self.p1.calculate_signals(self.flags, sig1_out=sig1_out)
         else:
             raise ValueError("No raw data has been loaded. Load some raw data and try calculating signals again!")
 
+    def iter_measurements(self, measus, prefetch=1):
+        """
+        Loads the measurements of the current animal with the specified <measus> one after the other (see
+        <load_measurement_data_from_current_animal>) and yields after loading each. Meanwhile, the raw data files of
+        the next <prefetch> measurements are read in a background thread, so that reading them from disk overlaps
+        with processing the current measurement.
+        :param Sequence measus: list of int
+        :param int prefetch: number of measurements to read ahead, 0 for no prefetching
+        :return: generator yielding tuples (measu, label of the measurement)
+        """
+
+        self.check_if_animal_is_initialized()
+        measus = list(measus)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        futures = []
+        # file ranges read so far, so that e.g. files shared by several measurements are read only once
+        prefetched_file_ranges = set()
+        try:
+            for ind, measu in enumerate(measus):
+                if prefetch > 0:
+                    # at first the next <prefetch> measurements, later only the one that has newly come into range
+                    to_prefetch = measus[1: prefetch + 1] if ind == 0 else measus[ind + prefetch: ind + prefetch + 1]
+                    for measu_to_prefetch in to_prefetch:
+                        futures.append(
+                            executor.submit(self.prefetch_raw_data_files_of_current_animal, measu_to_prefetch,
+                                            prefetched_file_ranges))
+
+                yield measu, self.load_measurement_data_from_current_animal(measu)
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def prefetch_raw_data_files_of_current_animal(self, measu, prefetched_file_ranges=None):
+        """
+        Reads the parts of raw data files needed for the measurement with the specified <measu> of the current animal
+        into the file cache of the operating system, so that loading the measurement later is faster. Errors are
+        logged and otherwise ignored, as they will be raised again when the measurement is loaded
+        :param int measu:
+        :param set prefetched_file_ranges: file ranges (see
+        view.python_core.p1_class.P1SingleWavelengthAbstract.get_raw_data_file_ranges) already read, which are not
+        read again. Ranges read are added to it
+        """
+
+        if prefetched_file_ranges is None:
+            prefetched_file_ranges = set()
+
+        try:
+            p1_metadata, extra_metadata = self.measurement_list.get_p1_metadata_by_measu(measu)
+            file_ranges = get_empty_p1(LE_loadExp=self.flags["LE_loadExp"]).get_raw_data_file_ranges(
+                p1_metadata=p1_metadata, flags=self.flags, measu=measu)
+            file_ranges = [file_range for file_range in file_ranges if file_range not in prefetched_file_ranges]
+            read_file_ranges_into_os_cache(file_ranges)
+            prefetched_file_ranges.update(file_ranges)
+        except Exception as e:
+            logging.getLogger("VIEW").debug(f"Could not prefetch raw data of measu={measu}: {e}")
+
     def load_measurement_data(self, animal, measu):
         """
         Loads the measurement with the specified <measu> for the specified animal.
@@ -232,6 +299,7 @@ class VIEW(object):
         self.flags.update_flags({"LE_loadExp": LE_loadExp})
 
         self.p1 = get_empty_p1(LE_loadExp=self.flags["LE_loadExp"])
+        self.p1.bleach_correction_worker_pool = self.bleach_correction_worker_pool
 
         # needed for looking if a usable area file exists
         self.flags.update_flags({'STG_ReportTag': animal})